@@ -12,20 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os, pickle, re
+import os, pickle, re, zlib
+import hashlib
 from .. import build
 from .. import dependencies
 from .. import mesonlib
+from .. import mlog
 import json
 from ..coredata import MesonException
 
+include_regex = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]')
+directive_regex = re.compile(r'^\s*#\s*(\w+)')
+
+# A header must be included by at least this fraction of a target's
+# sources to be put in its automatic precompiled header.
+auto_pch_threshold = 0.5
+
 class InstallData():
-    def __init__(self, source_dir, build_dir, prefix, depfixer):
+    def __init__(self, source_dir, build_dir, prefix):
         self.source_dir = source_dir
         self.build_dir= build_dir
         self.prefix = prefix
         self.targets = []
-        self.depfixer = depfixer
         self.headers = []
         self.man = []
         self.data = []
@@ -58,6 +66,7 @@ class Backend():
         self.build = build
         self.environment = build.environment
         self.processed_targets = {}
+        self.shared_pch = {}
         self.dep_rules = {}
         self.build_to_src = os.path.relpath(self.environment.get_source_dir(),
                                             self.environment.get_build_dir())
@@ -112,30 +121,336 @@ class Backend():
         dirname = os.path.join(self.environment.get_build_dir(), self.get_target_private_dir(target))
         return dirname
 
+    def get_unity_size(self, target):
+        if target.unity_size is not None:
+            return target.unity_size
+        return self.environment.coredata.get_builtin_option('unity_size')
+
+    def unity_block_key(self, block):
+        first = os.path.relpath(block[0], self.environment.get_build_dir())
+        return '-%08x' % zlib.crc32(first.replace('\\', '/').encode('utf-8'))
+
+    def get_unity_file_name(self, target, key, suffix):
+        return os.path.join(self.get_target_private_dir_abs(target), target.name + '-unity' + key + suffix)
+
+    def split_unity_sources(self, sources, unity_size):
+        """Splits the given sources into blocks of at most unity_size files.
+        Block boundaries are chosen from the file names rather than their
+        positions so that adding or removing a file usually changes only
+        the block that contains it. Returns a list of (key, sources) pairs
+        where key is a name fragment that stays stable with the block's
+        contents."""
+        if unity_size == 0 or len(sources) <= unity_size:
+            return [('', sources)]
+        # A file ends a block with probability 1/unity_size. Blocks are
+        # also cut when they reach unity_size files, so a change can
+        # only move boundaries up to the next file that ends a block.
+        divisor = unity_size
+        blocks = []
+        current = []
+        for src in sorted(sources):
+            current.append(src)
+            relname = os.path.relpath(src, self.environment.get_build_dir())
+            h = zlib.crc32(relname.replace('\\', '/').encode('utf-8'))
+            if h % divisor == 0 or len(current) == unity_size:
+                blocks.append(current)
+                current = []
+        if len(current) > 0:
+            blocks.append(current)
+        return [(self.unity_block_key(b), b) for b in blocks]
+
+    def estimate_unity_costs(self, target, sources, previous_blocks, suffix):
+        """Returns a tuple (costs, hot). Costs maps source files to their
+        measured compile time and hot is a set of files that should be
+        compiled on their own because they are being actively edited.
+        Backends that can measure compile times override this."""
+        return ({}, set())
+
+    def load_unity_blocks(self, target):
+        fname = os.path.join(self.get_target_private_dir_abs(target), target.name + '-unity-blocks.json')
+        try:
+            state = json.load(open(fname))
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(state, dict):
+            return {}
+        return state
+
+    def save_unity_blocks(self, target, state):
+        dirname = self.get_target_private_dir_abs(target)
+        os.makedirs(dirname, exist_ok=True)
+        fname = os.path.join(dirname, target.name + '-unity-blocks.json')
+        json.dump(state, open(fname, 'w'), indent=1, sort_keys=True)
+
+    def group_unity_sources_by_cost(self, target, sources, unity_size, previous, suffix):
+        """Groups sources into unity blocks of roughly equal compile cost.
+        Files that are being edited or that are more expensive than a
+        whole block are left out so they can be compiled on their own.
+        The previous grouping is given as a dict with the blocks and the
+        files left out along with the reason. Files keep their previous
+        assignment until their cost class changes, with some slack so
+        that noise in the measurements does not cause rebuilds. Returns
+        the blocks as a list of (key, sources) pairs and the files left
+        out as a dict mapping them to 'large' or 'edited'. Grouping only
+        happens when the build files are generated, so a file that starts
+        being edited is split out at the next regeneration rather than
+        right away."""
+        previous_blocks = previous.get('blocks', [])
+        previous_single = previous.get('single', {})
+        (costs, hot) = self.estimate_unity_costs(target, sources, previous_blocks, suffix)
+        # Many changed files at once means a branch switch or a similar
+        # mass change rather than active editing. Everything is rebuilt
+        # then anyway, so files that were split out for being edited
+        # return to the blocks.
+        if len(hot) > len(sources) // 2:
+            hot = set()
+            previous_single = dict([(k, v) for (k, v) in previous_single.items() if v != 'edited'])
+        # Files without measurements are estimated from their size
+        # using the average cost per byte of the measured ones.
+        sizes = {}
+        for src in sources:
+            try:
+                sizes[src] = max(os.path.getsize(src), 1)
+            except OSError:
+                sizes[src] = 1
+        measured = [src for src in sources if src in costs]
+        if len(measured) > 0:
+            per_byte = sum([costs[x] for x in measured]) / sum([sizes[x] for x in measured])
+        else:
+            per_byte = 1.0
+        cost = {}
+        for src in sources:
+            cost[src] = costs.get(src, sizes[src] * per_byte)
+        # Like with grouping by files, a unity size of zero means a single
+        # block. The block count must not depend on the machine Meson
+        # runs on, or build.ninja would differ between machines.
+        if unity_size > 0:
+            num_blocks = max(1, (len(sources) + unity_size - 1) // unity_size)
+        else:
+            num_blocks = 1
+        budget = sum(cost.values()) / num_blocks
+        in_blocks = set()
+        for block in previous_blocks:
+            in_blocks.update(block)
+        single = {}
+        candidates = []
+        for src in sources:
+            if previous_single.get(src) == 'large':
+                limit = budget / 2
+            elif src in in_blocks:
+                limit = 2 * budget
+            else:
+                limit = budget
+            if num_blocks > 1 and cost[src] > limit:
+                single[src] = 'large'
+            elif src in hot or previous_single.get(src) == 'edited':
+                # Files that were split out while being edited stay out,
+                # so that their blocks are not rebuilt when the edit is done.
+                single[src] = 'edited'
+            else:
+                candidates.append(src)
+        candidate_set = set(candidates)
+        blocks = []
+        placed = set()
+        for old in previous_blocks:
+            block = [x for x in old if x in candidate_set and x not in placed]
+            if len(block) == 0:
+                continue
+            if sum([cost[x] for x in block]) > 2 * budget:
+                continue
+            if unity_size > 0 and len(block) > unity_size:
+                continue
+            blocks.append(block)
+            placed.update(block)
+        current = []
+        current_cost = 0
+        for src in sorted(candidates):
+            if src in placed:
+                continue
+            if len(current) > 0 and (current_cost + cost[src] > budget or
+                                     (unity_size > 0 and len(current) == unity_size)):
+                blocks.append(current)
+                current = []
+                current_cost = 0
+            current.append(src)
+            current_cost += cost[src]
+        if len(current) > 0:
+            blocks.append(current)
+        blocks = [sorted(b) for b in blocks]
+        return ([(self.unity_block_key(b), b) for b in blocks], single)
+
     def generate_unity_files(self, target, unity_src):
+        """Writes the unity files of the target. Returns a tuple of the
+        generated unity files and the sources that were left out of them
+        and must be compiled individually."""
         langlist = {}
+        langorder = []
         abs_files = []
         result = []
+        excluded = []
         for src in unity_src:
             comp = self.get_compiler_for_source(src)
             language = comp.get_language()
-            suffix = '.' + comp.get_default_suffix()
             if language not in langlist:
-                outfilename = os.path.join(self.get_target_private_dir_abs(target), target.name + '-unity' + suffix)
+                langlist[language] = (comp, [])
+                langorder.append(language)
+            langlist[language][1].append(src)
+        unity_size = self.get_unity_size(target)
+        by_cost = self.environment.coredata.get_builtin_option('unity_grouping') == 'cost'
+        if by_cost:
+            previous_state = self.load_unity_blocks(target)
+            current_state = {}
+        for language in langorder:
+            (comp, sources) = langlist[language]
+            suffix = '.' + comp.get_default_suffix()
+            if by_cost:
+                (blocks, single) = self.group_unity_sources_by_cost(target, sources, unity_size,
+                                                                    previous_state.get(language, {}),
+                                                                    suffix)
+                excluded += [x for x in sources if x in single]
+                current_state[language] = {'blocks': [b for (_, b) in blocks],
+                                           'single': single}
+            else:
+                blocks = self.split_unity_sources(sources, unity_size)
+            for (key, block) in blocks:
+                outfilename = self.get_unity_file_name(target, key, suffix)
                 outfileabs = os.path.join(self.environment.get_build_dir(), outfilename)
                 outfileabs_tmp = outfileabs + '.tmp'
                 abs_files.append(outfileabs)
                 outfileabs_tmp_dir = os.path.dirname(outfileabs_tmp)
                 if not os.path.exists(outfileabs_tmp_dir):
                     os.makedirs(outfileabs_tmp_dir)
-                outfile = open(outfileabs_tmp, 'w')
-                langlist[language] = outfile
+                with open(outfileabs_tmp, 'w') as outfile:
+                    for src in block:
+                        outfile.write('#include<%s>\n' % src)
                 result.append(outfilename)
-            ofile = langlist[language]
-            ofile.write('#include<%s>\n' % src)
-        [x.close() for x in langlist.values()]
         [mesonlib.replace_if_different(x, x + '.tmp') for x in abs_files]
-        return result
+        if by_cost:
+            self.save_unity_blocks(target, current_state)
+        return (result, excluded)
+
+    def scan_leading_includes(self, fname):
+        """Returns the system headers included at the top of the given
+        source file, before any quoted include, other preprocessor
+        directive or code. The second return value is False if the file
+        defines macros before its includes. Force including a
+        precompiled header would change the meaning of such files."""
+        headers = []
+        in_comment = False
+        try:
+            f = open(fname, encoding='utf-8', errors='replace')
+        except OSError:
+            return ([], True)
+        with f:
+            for line in f:
+                line = line.strip()
+                if in_comment:
+                    if '*/' in line:
+                        in_comment = False
+                    continue
+                if line == '' or line.startswith('//'):
+                    continue
+                if line.startswith('/*'):
+                    in_comment = '*/' not in line
+                    continue
+                m = include_regex.match(line)
+                if m is not None:
+                    if m.group(1) == '"':
+                        break
+                    headers.append(m.group(2))
+                    continue
+                m = directive_regex.match(line)
+                if m is not None:
+                    if m.group(1) in ('define', 'undef'):
+                        return (headers, False)
+                    if m.group(1) == 'pragma':
+                        continue
+                break
+        return (headers, True)
+
+    def is_project_header(self, target, header):
+        srcdir = self.environment.get_source_dir()
+        dirs = [os.path.join(srcdir, target.get_subdir())]
+        for i in target.get_include_dirs():
+            for d in i.get_incdirs():
+                dirs.append(os.path.join(srcdir, i.get_curdir(), d))
+        for d in dirs:
+            if os.path.exists(os.path.join(d, header)):
+                return True
+        return False
+
+    def get_auto_pch_headers(self, target, language):
+        """Picks the system and third party headers that most of the
+        target's sources of the given language include."""
+        sources = []
+        for src in target.get_sources():
+            if self.environment.is_header(src) or not self.environment.is_source(src):
+                continue
+            abs_src = os.path.join(self.environment.get_build_dir(), src.rel_to_builddir(self.build_to_src))
+            try:
+                if self.get_compiler_for_source(abs_src).get_language() != language:
+                    continue
+            except RuntimeError:
+                continue
+            sources.append(abs_src)
+        if len(sources) < 2:
+            return []
+        counts = {}
+        order = []
+        for src in sources:
+            (headers, safe) = self.scan_leading_includes(src)
+            if not safe:
+                mlog.debug('Not generating a precompiled header for target %s because %s defines macros before its includes.'
+                           % (target.get_basename(), src))
+                return []
+            for h in headers:
+                if h not in counts:
+                    counts[h] = 0
+                    order.append(h)
+                counts[h] += 1
+        minimum = max(2, len(sources) * auto_pch_threshold)
+        return [h for h in order if counts[h] >= minimum and not self.is_project_header(target, h)]
+
+    def generate_auto_pch(self, target):
+        """Synthesizes a precompiled header for targets that have asked
+        for one and do not list their own."""
+        enabled = target.auto_pch
+        if enabled is None:
+            enabled = self.environment.coredata.get_builtin_option('auto_pch')
+        if not enabled:
+            return
+        for lang in ['c', 'cpp']:
+            if len(target.get_pch(lang)) > 0:
+                continue
+            try:
+                compiler = self.get_compiler_for_lang(lang)
+            except RuntimeError:
+                continue
+            headers = self.get_auto_pch_headers(target, lang)
+            if len(headers) == 0:
+                continue
+            pchdir = self.get_target_private_dir_abs(target)
+            os.makedirs(pchdir, exist_ok=True)
+            contents = '/* Autogenerated by Meson. Do not edit. */\n'
+            for h in headers:
+                contents += '#include<%s>\n' % h
+            # Headers with the same contents get the same name so
+            # find_shared_pchs can build them only once.
+            basename = '%s_autopch_%s' % (lang, hashlib.sha1(contents.encode()).hexdigest()[:12])
+            header = os.path.join(pchdir, basename + '.h')
+            with open(header + '.tmp', 'w') as f:
+                f.write(contents)
+            mesonlib.replace_if_different(header, header + '.tmp')
+            pch = [header]
+            if compiler.get_id() == 'msvc':
+                # MSVC also needs a source file to create the PCH from.
+                source = os.path.join(pchdir, basename + '.' + compiler.get_default_suffix())
+                with open(source + '.tmp', 'w') as f:
+                    f.write('#include"%s"\n' % (basename + '.h'))
+                mesonlib.replace_if_different(source, source + '.tmp')
+                pch.append(source)
+            mlog.debug('Automatic precompiled header for target %s: %s' % (target.get_basename(), ' '.join(headers)))
+            target.pch[lang] = pch
 
     def relpath(self, todir, fromdir):
         return os.path.relpath(os.path.join('dummyprefixdir', todir),\
@@ -226,21 +541,100 @@ class Backend():
             result.append(objname)
         return result
 
+    def get_pch_dir(self, target, lang):
+        """Returns the directory, relative to the build dir, that holds
+        the precompiled header of the target for the given language."""
+        try:
+            return self.shared_pch[(target.get_id(), lang)]
+        except KeyError:
+            return self.get_target_private_dir(target)
+
     def get_pch_include_args(self, compiler, target):
         args = []
-        pchpath = self.get_target_private_dir(target)
-        includeargs = compiler.get_include_args(pchpath, False)
+        includeargs = []
         for lang in ['c', 'cpp']:
             p = target.get_pch(lang)
             if len(p) == 0:
                 continue
             if compiler.can_compile(p[-1]):
+                pchpath = self.get_pch_dir(target, lang)
                 header = p[0]
+                includeargs += compiler.get_include_args(pchpath, False)
                 args += compiler.get_pch_use_args(pchpath, header)
         if len(args) > 0:
             args = includeargs + args
         return args
 
+    def get_pch_key(self, target, lang, compiler):
+        """Returns a key that is equal for all targets whose precompiled
+        header for lang can be built once and shared."""
+        files = []
+        build_dir = os.path.normpath(self.environment.get_build_dir())
+        for f in target.get_pch(lang):
+            fname = os.path.normpath(os.path.join(self.environment.get_source_dir(), target.get_source_subdir(), f))
+            if fname.startswith(build_dir + os.sep):
+                # Generated headers count as equal if they have
+                # the same contents.
+                files.append(open(fname, 'rb').read())
+            else:
+                files.append(fname)
+        args = self.generate_basic_compiler_args(target, compiler)
+        return (lang, target.is_cross, tuple(files), tuple(args))
+
+    def find_shared_pchs(self):
+        """Finds precompiled headers that are built with the same
+        arguments in several targets so they only need to be built once."""
+        self.shared_pch = {}
+        if not self.environment.coredata.get_builtin_option('use_pch'):
+            return
+        users = {}
+        keyorder = []
+        for t in self.build.get_targets().values():
+            if not isinstance(t, build.BuildTarget):
+                continue
+            self.generate_auto_pch(t)
+            for lang in ['c', 'cpp']:
+                if len(t.get_pch(lang)) == 0:
+                    continue
+                try:
+                    compiler = self.get_compiler_for_lang(lang)
+                except RuntimeError:
+                    continue
+                key = self.get_pch_key(t, lang, compiler)
+                if key not in users:
+                    users[key] = []
+                    keyorder.append(key)
+                users[key].append(t)
+        for key in keyorder:
+            if len(users[key]) < 2:
+                continue
+            h = hashlib.sha1(pickle.dumps(key)).hexdigest()[:12]
+            pchdir = os.path.join('meson-pch', h)
+            for t in users[key]:
+                self.shared_pch[(t.get_id(), key[0])] = pchdir
+
+    def uses_split_dwarf(self):
+        # Split DWARF only makes a difference when there is debug info.
+        return self.environment.coredata.get_builtin_option('split_dwarf') and \
+            self.environment.coredata.get_builtin_option('buildtype') in ('debug', 'debugoptimized')
+
+    def get_toolchain_link_args(self, compiler):
+        '''Arguments that select the linker and its features. They are the
+        same for every link done with the given compiler.'''
+        args = compiler.get_linker_select_args(self.environment.coredata.get_builtin_option('linker'))
+        if self.environment.coredata.get_builtin_option('gdb_index'):
+            args += compiler.get_gdb_index_link_args()
+        args += compiler.get_lto_link_args(self.get_lto_mode(),
+                                           self.environment.coredata.get_builtin_option('lto_jobs'))
+        return args
+
+    def get_lto_mode(self):
+        # Coverage data of optimised code across translation
+        # units would not match the sources.
+        if self.environment.coredata.get_builtin_option('coverage'):
+            return 'none'
+        return self.environment.coredata.get_builtin_option('lto')
+
     def generate_basic_compiler_args(self, target, compiler):
         commands = []
         commands += compiler.get_always_args()
@@ -250,6 +644,9 @@ class Backend():
         commands += self.environment.coredata.external_args[compiler.get_language()]
         commands += target.get_extra_args(compiler.get_language())
         commands += compiler.get_buildtype_args(self.environment.coredata.get_builtin_option('buildtype'))
+        if self.uses_split_dwarf():
+            commands += compiler.get_split_dwarf_args()
+        commands += compiler.get_lto_compile_args(self.get_lto_mode())
         if self.environment.coredata.get_builtin_option('coverage'):
             commands += compiler.get_coverage_args()
         if self.environment.coredata.get_builtin_option('werror'):
@@ -396,6 +793,10 @@ class Backend():
             if absolute_paths:
                 fname = os.path.join(self.environment.get_build_dir(), fname)
             srcs.append(fname)
+        if target.depfile is not None:
+            depfile = os.path.join(outdir, target.depfile)
+        else:
+            depfile = None
         cmd = []
         for i in target.command:
             if isinstance(i, build.Executable):
@@ -410,6 +811,8 @@ class Backend():
                 i = i.replace('@INPUT%d@' % j, src)
             for (j, res) in enumerate(ofilenames):
                 i = i.replace('@OUTPUT%d@' % j, res)
+            if depfile is not None:
+                i = i.replace('@DEPFILE@', depfile)
             if i == '@INPUT@':
                 cmd += srcs
             elif i == '@OUTPUT@':
@@ -14,6 +14,7 @@
 
 from . import backends
 from .. import environment, mesonlib
+from .. import compilers
 from .. import build
 from .. import mlog
 from .. import dependencies
@@ -21,7 +22,7 @@ from ..mesonlib import File
 from .backends import InstallData
 from ..build import InvalidArguments
 from ..coredata import MesonException
-import os, sys, pickle, re
+import os, sys, pickle, re, hashlib
 import subprocess, shutil
 
 if mesonlib.is_windows():
@@ -31,6 +32,15 @@ else:
     quote_char = "'"
     execute_wrapper = ''
 
+# On platforms where compile and link rules do not always go through a
+# response file, build elements whose command line is longer than this
+# are switched to a variant of their rule that does.
+rspfile_threshold = 32 * 1024
+
+fortran_module_re = re.compile(r"^\s*module\s+(\w+)\s*(!.*)?$", re.IGNORECASE)
+fortran_submodule_re = re.compile(r"^\s*submodule\s*\(\s*(\w+)\s*(?::\s*(\w+)\s*)?\)\s*(\w+)", re.IGNORECASE)
+fortran_use_re = re.compile(r"^\s*use(?:\s*,\s*(\w+)\s*::|\s*::|\s+)\s*(\w+)", re.IGNORECASE)
+
 def ninja_quote(text):
     return text.replace(' ', '$ ').replace(':', '$:')
 
@@ -98,7 +108,7 @@ class NinjaBuildElement():
         for e in self.elems:
             (name, elems) = e
             should_quote = True
-            if name == 'DEPFILE' or name == 'DESC' or name == 'pool':
+            if name == 'DEPFILE' or name == 'DESC' or name == 'pool' or name == 'RSPFILE':
                 should_quote = False
             line = ' %s = ' % name
             q_templ = quote_char + "%s" + quote_char
@@ -118,6 +128,15 @@ class NinjaBuildElement():
             outfile.write(line)
         outfile.write('\n')
 
+    def get_command_length(self):
+        length = 0
+        for i in self.outfilenames + self.infilenames:
+            length += len(i) + 1
+        for (_, elems) in self.elems:
+            for i in elems:
+                length += len(i) + 1
+        return length
+
     def check_outputs(self):
         for n in self.outfilenames:
             if n in self.all_outputs:
@@ -131,7 +150,14 @@ class NinjaBackend(backends.Backend):
         self.source_suffix_in_objs = True
         self.ninja_filename = 'build.ninja'
         self.fortran_deps = {}
+        self.fortran_submodules = {}
+        self.fortran_pending_objs = {}
+        self.fortran_scan_cache = None
+        self.fortran_scan_dirty = False
         self.all_outputs = {}
+        self.ninja_log = None
+        self.unity_origins = {}
+        self.rspfile_rules = set()
 
     def detect_vs_dep_prefix(self, outfile, tempfilename):
         '''VS writes its dependency in a locale dependent format.
@@ -173,6 +199,7 @@ int dummy;
         self.generate_rules(outfile)
         self.generate_phony(outfile)
         outfile.write('# Build rules for targets\n\n')
+        self.find_shared_pchs()
         [self.generate_target(t, outfile) for t in self.build.get_targets().values()]
         if len(self.build.pot) > 0:
             outfile.write('# Build rules for localisation.\n\n')
@@ -190,13 +217,22 @@ int dummy;
         # fully created.
         outfile.close()
         os.replace(tempfilename, outfilename)
+        self.save_fortran_scan_cache()
         self.generate_compdb()
 
     # http://clang.llvm.org/docs/JSONCompilationDatabase.html
     def generate_compdb(self):
         ninja_exe = environment.detect_ninja()
         builddir = self.environment.get_build_dir()
-        jsondb = subprocess.check_output([ninja_exe, '-t', 'compdb', 'c_COMPILER', 'cpp_COMPILER'], cwd=builddir)
+        cmd = [ninja_exe, '-t', 'compdb']
+        rules = ['c_COMPILER', 'cpp_COMPILER']
+        # Commands using response files only make sense in the database if
+        # Ninja puts the contents of the response file in their place.
+        ninja_version = subprocess.check_output([ninja_exe, '--version']).decode()
+        if mesonlib.version_compare(ninja_version, '>=1.9'):
+            cmd.append('-x')
+            rules += ['c_COMPILER_RSP', 'cpp_COMPILER_RSP']
+        jsondb = subprocess.check_output(cmd + rules, cwd=builddir)
         open(os.path.join(builddir, 'compile_commands.json'), 'wb').write(jsondb)
 
     # Get all generated headers. Any source file might need them so
@@ -255,6 +291,7 @@ int dummy;
         header_deps = gen_other_deps
         unity_src = []
         unity_deps = [] # Generated sources that must be built before compiling a Unity target.
+        unity_origins = {} # Maps unity sources to how they would be compiled on their own.
         header_deps += self.get_generated_headers(target)
         for gensource in target.get_generated_sources():
             if isinstance(gensource, build.CustomTarget):
@@ -288,6 +325,7 @@ int dummy;
                             unity_deps.append(rel_src)
                             abs_src = os.path.join(self.environment.get_build_dir(), rel_src)
                             unity_src.append(abs_src)
+                            unity_origins[abs_src] = (src, True)
                         else:
                             obj_list.append(self.generate_single_compile(target, outfile, src, True,
                                                                          header_deps=header_deps))
@@ -295,7 +333,9 @@ int dummy;
         for src in gen_src_deps:
                 src_list.append(src)
                 if is_unity:
-                    unity_src.append(os.path.join(self.environment.get_build_dir(), src))
+                    abs_src = os.path.join(self.environment.get_build_dir(), src)
+                    unity_src.append(abs_src)
+                    unity_origins[abs_src] = (src, True)
                     header_deps.append(src)
                 else:
                     # Generated targets are ordered deps because the must exist
@@ -316,12 +356,18 @@ int dummy;
                     abs_src = os.path.join(self.environment.get_build_dir(),
                                            src.rel_to_builddir(self.build_to_src))
                     unity_src.append(abs_src)
+                    unity_origins[abs_src] = (src, False)
                 else:
                     obj_list.append(self.generate_single_compile(target, outfile, src, False, [], header_deps))
         obj_list += self.flatten_object_list(target)
         if is_unity:
-            for src in self.generate_unity_files(target, unity_src):
+            self.unity_origins = unity_origins
+            (unity_files, excluded) = self.generate_unity_files(target, unity_src)
+            for src in unity_files:
                 obj_list.append(self.generate_single_compile(target, outfile, src, True, unity_deps + header_deps))
+            for abs_src in excluded:
+                (src, is_generated) = unity_origins[abs_src]
+                obj_list.append(self.generate_single_compile(target, outfile, src, is_generated, [], header_deps))
         linker = self.determine_linker(target, src_list)
         elem = self.generate_link(target, outfile, outname, obj_list, linker, pch_objects)
         self.generate_shlib_aliases(target, self.get_target_dir(target))
@@ -347,7 +393,11 @@ int dummy;
             deps.append(os.path.join(self.get_target_dir(i), fname))
         if target.build_always:
             deps.append('PHONY')
-        elem = NinjaBuildElement(self.all_outputs, ofilenames, 'CUSTOM_COMMAND', srcs)
+        if target.depfile is not None:
+            elem = NinjaBuildElement(self.all_outputs, ofilenames, 'CUSTOM_COMMAND_DEP', srcs)
+            elem.add_item('DEPFILE', os.path.join(self.get_target_dir(target), target.depfile))
+        else:
+            elem = NinjaBuildElement(self.all_outputs, ofilenames, 'CUSTOM_COMMAND', srcs)
         for i in target.depend_files:
             if isinstance(i, mesonlib.File):
                 deps.append(i.rel_to_builddir(self.build_to_src))
@@ -457,10 +507,9 @@ int dummy;
         script_root = self.environment.get_script_dir()
         install_script = os.path.join(script_root, 'meson_install.py')
         install_data_file = os.path.join(self.environment.get_scratch_dir(), 'install.dat')
-        depfixer = [sys.executable, self.environment.get_build_command(), '--internal', 'depfixer']
         d = InstallData(self.environment.get_source_dir(),
                         self.environment.get_build_dir(),
-                        self.environment.get_prefix(), depfixer)
+                        self.environment.get_prefix())
         elem = NinjaBuildElement(self.all_outputs, 'install', 'CUSTOM_COMMAND', 'PHONY')
         elem.add_dep('all')
         elem.add_item('DESC', 'Installing files.')
@@ -495,6 +544,7 @@ int dummy;
         bindir = self.environment.get_bindir()
 
         should_strip = self.environment.coredata.get_builtin_option('strip')
+        split_dwarf = self.uses_split_dwarf()
         for t in self.build.get_targets().values():
             if t.should_install():
                 outdir = t.get_custom_install_dir()
@@ -503,8 +553,14 @@ int dummy;
                         outdir = bindir
                     else:
                         outdir = libdir
+                # The .dwo files of linked binaries are packaged on install,
+                # they are next to the object files in the private dir.
+                if split_dwarf and isinstance(t, (build.Executable, build.SharedLibrary)):
+                    dwodir = self.get_target_private_dir(t)
+                else:
+                    dwodir = None
                 i = [self.get_target_filename(t), outdir, t.get_aliaslist(),\
-                    should_strip, t.install_rpath]
+                    should_strip, t.install_rpath, dwodir]
                 d.targets.append(i)
 
     def generate_custom_install_script(self, d):
@@ -619,6 +675,12 @@ int dummy;
         outfile.write(' command = $COMMAND\n')
         outfile.write(' description = $DESC\n')
         outfile.write(' restat = 1\n\n')
+        outfile.write('rule CUSTOM_COMMAND_DEP\n')
+        outfile.write(' command = $COMMAND\n')
+        outfile.write(' description = $DESC\n')
+        outfile.write(' deps = gcc\n')
+        outfile.write(' depfile = $DEPFILE\n')
+        outfile.write(' restat = 1\n\n')
         outfile.write('rule REGENERATE_BUILD\n')
         c = (quote_char + ninja_quote(sys.executable) + quote_char,
              quote_char + ninja_quote(self.environment.get_build_command())  + quote_char,
@@ -670,19 +732,17 @@ int dummy;
         main_class = target.get_main_class()
         if main_class != '':
             e = 'e'
-        for src in src_list:
-            plain_class_path = self.generate_single_java_compile(src, target, compiler, outfile)
-            class_list.append(plain_class_path)
-        class_dep_list = [os.path.join(self.get_target_private_dir(target), i) for i in class_list]
+        (classdir, stamp) = self.generate_java_compile(src_list, target, compiler, outfile)
         jar_rule = 'java_LINKER'
         commands = [c+m+e+f]
         if e != '':
             commands.append(main_class)
         commands.append(self.get_target_filename(target))
-        for cls in class_list:
-            commands += ['-C', self.get_target_private_dir(target), cls]
+        # The class dir holds exactly the classes of the last compilation,
+        # including inner and anonymous ones, so all of it goes in the jar.
+        commands += ['-C', classdir, '.']
         elem = NinjaBuildElement(self.all_outputs, outname_rel, jar_rule, [])
-        elem.add_dep(class_dep_list)
+        elem.add_dep(stamp)
         elem.add_item('ARGS', commands)
         elem.write(outfile)
 
@@ -741,20 +801,28 @@ int dummy;
         elem.add_item('ARGS', commands)
         elem.write(outfile)
 
-    def generate_single_java_compile(self, src, target, compiler, outfile):
+    def generate_java_compile(self, src_list, target, compiler, outfile):
+        """Compiles all sources of a Jar target with one javac invocation.
+        Starting the JVM takes much longer than compiling a typical source
+        file so doing it once per target instead of once per file is a
+        large win. The names of the class files are not known before
+        javac has run, so the output of the build element is a stamp file
+        that lists them."""
+        classdir = os.path.join(self.get_target_private_dir(target), 'classes')
+        stamp = os.path.join(self.get_target_private_dir(target), 'classes.stamp')
         args = []
         args += compiler.get_buildtype_args(self.environment.coredata.get_builtin_option('buildtype'))
-        args += compiler.get_output_args(self.get_target_private_dir(target))
+        args += compiler.get_output_args(classdir)
         for i in target.include_dirs:
             for idir in i.get_incdirs():
                 args += ['-sourcepath', os.path.join(self.build_to_src, i.curdir, idir)]
-        rel_src = src.rel_to_builddir(self.build_to_src)
-        plain_class_path = src.fname[:-4] + 'class'
-        rel_obj = os.path.join(self.get_target_private_dir(target), plain_class_path)
-        element = NinjaBuildElement(self.all_outputs, rel_obj, compiler.get_language() + '_COMPILER', rel_src)
+        rel_srcs = [src.rel_to_builddir(self.build_to_src) for src in src_list]
+        element = NinjaBuildElement(self.all_outputs, stamp, compiler.get_language() + '_COMPILER', rel_srcs)
         element.add_item('ARGS', args)
+        element.add_item('CLASSDIR', classdir)
+        element.add_item('TARGET', target.get_basename())
         element.write(outfile)
-        return plain_class_path
+        return (classdir, stamp)
 
     def generate_java_link(self, outfile):
         rule = 'rule java_LINKER\n'
@@ -1027,21 +1095,56 @@ int dummy;
             crstr = ''
         if static_linker is None:
             return
-        rule = 'rule STATIC%s_LINKER\n' % crstr
         if mesonlib.is_windows():
-            command_templ = ''' command = %s @$out.rsp
+            rsp_templ = ''' command = %s @$out.rsp
  rspfile = $out.rsp
  rspfile_content = $LINK_ARGS %s $in
 '''
+            command_templ = rsp_templ
         else:
+            # The ar options stay on the command line because wrappers
+            # such as gcc-ar put their own options in front of them, after
+            # which ar does not accept a response file in their place.
+            rsp_templ = ''' command = %s $LINK_ARGS @$RSPFILE
+ rspfile = $RSPFILE
+ rspfile_content = %s $in
+'''
             command_templ = ' command = %s $LINK_ARGS %s $in\n'
-        command = command_templ %\
-        (' '.join(static_linker.get_exelist()),
-         ' '.join(static_linker.get_output_args('$out')))
         description = ' description = Static linking library $out\n\n'
-        outfile.write(rule)
-        outfile.write(command)
-        outfile.write(description)
+        rules = [('STATIC%s_LINKER' % crstr, '')]
+        if self.use_thin_archives(static_linker):
+            # Thin archives only refer to the objects, so creating them
+            # from scratch is cheap. This drops members that are no longer
+            # part of the target and turns a normal archive into a thin one,
+            # which ar refuses to do in place.
+            rules.append(('STATIC_THIN%s_LINKER' % crstr, 'rm -f $out && '))
+        for (rulename, prefix) in rules:
+            templ_args = (prefix + ' '.join(static_linker.get_exelist()),
+                          ' '.join(static_linker.get_output_args('$out')))
+            outfile.write('rule %s\n' % rulename)
+            outfile.write(command_templ % templ_args)
+            outfile.write(description)
+            if self.supports_rspfile(static_linker):
+                self.rspfile_rules.add(rulename)
+                outfile.write('rule %s_RSP\n' % rulename)
+                outfile.write(rsp_templ % templ_args)
+                outfile.write(description)
+
+    def remove_thin_archive(self, fname):
+        try:
+            with open(fname, 'rb') as f:
+                is_thin = f.read(8) == b'!<thin>\n'
+        except OSError:
+            return
+        if is_thin:
+            os.unlink(fname)
+
+    def use_thin_archives(self, static_linker):
+        if not self.environment.coredata.get_builtin_option('thin_archives'):
+            return False
+        if mesonlib.is_windows() or not hasattr(static_linker, 'get_std_thin_link_args'):
+            return False
+        return static_linker.get_std_thin_link_args() is not None
 
     def generate_dynamic_link_rules(self, outfile):
         ctypes = [(self.build.compilers, False)]
@@ -1068,22 +1171,29 @@ int dummy;
                     except KeyError:
                         pass
                 rule = 'rule %s%s_LINKER\n' % (langname, crstr)
-                if mesonlib.is_windows():
-                    command_template = ''' command = %s @$out.rsp
+                rsp_template = ''' command = %s @$out.rsp
  rspfile = $out.rsp
  rspfile_content = %s $ARGS  %s $in $LINK_ARGS $aliasing
 '''
+                if mesonlib.is_windows():
+                    command_template = rsp_template
                 else:
                     command_template = ' command = %s %s $ARGS  %s $in $LINK_ARGS $aliasing\n'
-                command = command_template % \
-                (' '.join(compiler.get_linker_exelist()),\
-                 ' '.join(cross_args),\
-                 ' '.join(compiler.get_linker_output_args('$out')))
+                template_args = (' '.join(compiler.get_linker_exelist()),\
+                                 ' '.join(cross_args + self.get_toolchain_link_args(compiler)),\
+                                 ' '.join(compiler.get_linker_output_args('$out')))
+                command = command_template % template_args
                 description = ' description = Linking target $out'
                 outfile.write(rule)
                 outfile.write(command)
                 outfile.write(description)
                 outfile.write('\n')
+                if self.supports_rspfile(compiler):
+                    self.rspfile_rules.add('%s%s_LINKER' % (langname, crstr))
+                    outfile.write('rule %s%s_LINKER_RSP\n' % (langname, crstr))
+                    outfile.write(self.get_rsp_rule_command(rsp_template % template_args))
+                    outfile.write(description)
+                    outfile.write('\n')
         scriptdir = self.environment.get_script_dir()
         outfile.write('\n')
         symrule = 'rule SHSYM\n'
@@ -1104,8 +1214,11 @@ int dummy;
     def generate_java_compile_rule(self, compiler, outfile):
         rule = 'rule %s_COMPILER\n' % compiler.get_language()
         invoc = ' '.join([ninja_quote(i) for i in compiler.get_exelist()])
-        command = ' command = %s $ARGS $in\n' % invoc
-        description = ' description = Compiling Java object $in.\n'
+        command = ' command = %s %s --internal javacompile $CLASSDIR $out %s $ARGS $in\n' % \
+            (quote_char + ninja_quote(sys.executable) + quote_char,
+             quote_char + ninja_quote(self.environment.get_build_command()) + quote_char,
+             invoc)
+        description = ' description = Compiling Java sources of $TARGET.\n'
         outfile.write(rule)
         outfile.write(command)
         outfile.write(description)
@@ -1219,19 +1332,20 @@ rule FORTRAN_DEP_HACK
                 cross_args = self.environment.cross_info.config['properties'][langname + '_args']
             except KeyError:
                 pass
-        if mesonlib.is_windows():
-            command_template = ''' command = %s @$out.rsp
+        rsp_template = ''' command = %s @$out.rsp
  rspfile = $out.rsp
  rspfile_content = %s $ARGS %s %s %s $in
 '''
+        if mesonlib.is_windows():
+            command_template = rsp_template
         else:
             command_template = ' command = %s %s $ARGS %s %s %s $in\n'
-        command = command_template % \
-            (' '.join(compiler.get_exelist()),\
-             ' '.join(cross_args),
-             ' '.join(quoted_depargs),\
-             ' '.join(compiler.get_output_args('$out')),\
-             ' '.join(compiler.get_compile_only_args()))
+        template_args = (' '.join(compiler.get_exelist()),\
+                         ' '.join(cross_args),
+                         ' '.join(quoted_depargs),\
+                         ' '.join(compiler.get_output_args('$out')),\
+                         ' '.join(compiler.get_compile_only_args()))
+        command = command_template % template_args
         description = ' description = Compiling %s object $out\n' % langname
         if compiler.get_id() == 'msvc':
             deps = ' deps = msvc\n'
@@ -1243,6 +1357,13 @@ rule FORTRAN_DEP_HACK
         outfile.write(deps)
         outfile.write(description)
         outfile.write('\n')
+        if self.supports_rspfile(compiler):
+            self.rspfile_rules.add('%s%s_COMPILER' % (langname, crstr))
+            outfile.write('rule %s%s_COMPILER_RSP\n' % (langname, crstr))
+            outfile.write(self.get_rsp_rule_command(rsp_template % template_args))
+            outfile.write(deps)
+            outfile.write(description)
+            outfile.write('\n')
 
     def generate_pch_rule_for(self, langname, compiler, qstr, is_cross, outfile):
         if langname != 'c' and langname != 'cpp':
@@ -1341,6 +1462,9 @@ rule FORTRAN_DEP_HACK
                 outfiles = [os.path.join(self.get_target_private_dir(target), of) for of in outfiles]
                 args = [x.replace("@INPUT@", infilename).replace('@OUTPUT@', sole_output)\
                         for x in base_args]
+                if generator.depfile is not None:
+                    depfile = os.path.join(self.get_target_private_dir(target), generator.get_dep_outname(infilename))
+                    args = [x.replace('@DEPFILE@', depfile) for x in args]
                 args = self.replace_outputs(args, self.get_target_private_dir(target), outfilelist)
                 # We have consumed output files, so drop them from the list of remaining outputs.
                 if sole_output == '':
@@ -1355,7 +1479,11 @@ rule FORTRAN_DEP_HACK
                     else:
                         final_args.append(a)
                 cmdlist = exe_arr + final_args
-                elem = NinjaBuildElement(self.all_outputs, outfiles, 'CUSTOM_COMMAND', infilename)
+                if generator.depfile is not None:
+                    elem = NinjaBuildElement(self.all_outputs, outfiles, 'CUSTOM_COMMAND_DEP', infilename)
+                    elem.add_item('DEPFILE', depfile)
+                else:
+                    elem = NinjaBuildElement(self.all_outputs, outfiles, 'CUSTOM_COMMAND', infilename)
                 if len(extra_dependencies) > 0:
                     elem.add_dep(extra_dependencies)
                 elem.add_item('DESC', 'Generating $out')
@@ -1364,60 +1492,155 @@ rule FORTRAN_DEP_HACK
                 elem.add_item('COMMAND', cmdlist)
                 elem.write(outfile)
 
+    def load_fortran_scan_cache(self):
+        if self.fortran_scan_cache is not None:
+            return
+        self.fortran_scan_cache = {}
+        try:
+            cache = pickle.load(open(self.get_fortran_scan_cache_file(), 'rb'))
+            if isinstance(cache, dict):
+                self.fortran_scan_cache = cache
+        except Exception:
+            pass
+
+    def get_fortran_scan_cache_file(self):
+        return os.path.join(self.environment.get_scratch_dir(), 'fortran_scan.dat')
+
+    def save_fortran_scan_cache(self):
+        if not self.fortran_scan_dirty:
+            return
+        pickle.dump(self.fortran_scan_cache, open(self.get_fortran_scan_cache_file(), 'wb'))
+        self.fortran_scan_dirty = False
+
+    def scan_fortran_file(self, fname):
+        """Returns a tuple (modules, submodules, uses) for the given
+        Fortran source. Modules are the names of the modules it
+        defines, submodules is a list of (ancestor, parent, name)
+        tuples, parent being None for direct children of a module, and
+        uses lists the modules it uses. All names are lower case.
+        Results are cached by file size and modification time."""
+        st = os.stat(fname)
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self.fortran_scan_cache.get(fname)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        modules = []
+        submodules = []
+        uses = []
+        for line in open(fname, encoding='utf-8', errors='replace'):
+            m = fortran_use_re.match(line)
+            if m is not None:
+                if m.group(1) is None or m.group(1).lower() != 'intrinsic':
+                    uses.append(m.group(2).lower())
+                continue
+            m = fortran_module_re.match(line)
+            if m is not None:
+                modules.append(m.group(1).lower())
+                continue
+            m = fortran_submodule_re.match(line)
+            if m is not None:
+                parent = m.group(2)
+                if parent is not None:
+                    parent = parent.lower()
+                submodules.append((m.group(1).lower(), parent, m.group(3).lower()))
+        result = (modules, submodules, uses)
+        self.fortran_scan_cache[fname] = (stamp, result)
+        self.fortran_scan_dirty = True
+        return result
+
+    def get_fortran_sources(self, target, compiler):
+        """Returns the Fortran sources of the target as tuples of the
+        absolute file name, the object file it is compiled to and
+        whether the source is generated."""
+        result = []
+        build_dir = self.environment.get_build_dir()
+        for s in target.get_sources():
+            if not compiler.can_compile(s):
+                continue
+            abs_src = os.path.normpath(os.path.join(build_dir, s.rel_to_builddir(self.build_to_src)))
+            result.append((abs_src, self.get_object_for_source(target, s), False))
+        for gensource in target.get_generated_sources():
+            if isinstance(gensource, build.CustomTarget):
+                for src in gensource.output:
+                    src = os.path.join(self.get_target_dir(gensource), src)
+                    if compiler.can_compile(src):
+                        result.append((os.path.normpath(os.path.join(build_dir, src)),
+                                       self.get_object_for_source(target, RawFilename(src)), True))
+            else:
+                for src in gensource.get_outfilelist():
+                    if not compiler.can_compile(src):
+                        continue
+                    if self.has_dir_part(src):
+                        rel_src = src
+                    else:
+                        rel_src = os.path.join(self.get_target_private_dir(target), src)
+                    result.append((os.path.normpath(os.path.join(build_dir, rel_src)),
+                                   self.get_object_for_source(target, src), True))
+        return result
+
     def scan_fortran_module_outputs(self, target):
         compiler = None
         for c in self.build.compilers:
             if c.get_language() == 'fortran':
                 compiler = c
                 break
+        basename = target.get_basename()
+        self.fortran_deps[basename] = {}
+        self.fortran_submodules[basename] = {}
+        self.fortran_pending_objs[basename] = []
         if compiler is None:
-            self.fortran_deps[target.get_basename()] = {}
             return
-        modre = re.compile(r"\s*module\s+(\w+)", re.IGNORECASE)
-        module_files = {}
-        for s in target.get_sources():
-            # FIXME, does not work for generated Fortran sources,
-            # but those are really rare. I hope.
-            if not compiler.can_compile(s):
+        self.load_fortran_scan_cache()
+        module_files = self.fortran_deps[basename]
+        submodule_files = self.fortran_submodules[basename]
+        for (abs_src, obj, is_generated) in self.get_fortran_sources(target, compiler):
+            if is_generated:
+                # The modules of a generated source may change without a
+                # reconfigure, or it may not have been built yet. Every
+                # other Fortran object of the target depends on its object
+                # instead, which is rebuilt whenever it changes.
+                self.fortran_pending_objs[basename].append(obj)
                 continue
-            for line in open(os.path.join(self.environment.get_source_dir(), s.subdir, s.fname)):
-                modmatch = modre.match(line)
-                if modmatch is not None:
-                    modname = modmatch.group(1)
-                    if modname.lower() == 'procedure': # MODULE PROCEDURE construct
-                        continue
-                    if modname in module_files:
-                        raise InvalidArguments('Namespace collision: module %s defined in two files %s and %s.' %
-                                               (modname, module_files[modname], s))
-                    module_files[modname] = s
-        self.fortran_deps[target.get_basename()] = module_files
+            (modules, submodules, _) = self.scan_fortran_file(abs_src)
+            for modname in modules:
+                if modname == 'procedure': # MODULE PROCEDURE construct
+                    continue
+                if modname in module_files:
+                    raise InvalidArguments('Namespace collision: module %s defined in two files %s and %s.' %
+                                           (modname, module_files[modname], abs_src))
+                module_files[modname] = abs_src
+            for (ancestor, _, name) in submodules:
+                submodule_files[(ancestor, name)] = abs_src
 
     def get_fortran_deps(self, compiler, src, target):
         mod_files = []
-        usere = re.compile(r"\s*use\s+(\w+)", re.IGNORECASE)
+        if not os.path.exists(src):
+            return mod_files
         dirname = self.get_target_private_dir(target)
-        tdeps= self.fortran_deps[target.get_basename()]
-        for line in open(src):
-            usematch = usere.match(line)
-            if usematch is not None:
-                usename = usematch.group(1)
-                if usename not in tdeps:
-                    # The module is not provided by any source file. This is due to
-                    # a) missing file/typo/etc
-                    # b) using a module provided by the compiler, such as OpenMP
-                    # There's no easy way to tell which is which (that I know of)
-                    # so just ignore this and go on. Ideally we would print a
-                    # warning message to the user but this is a common occurrance,
-                    # which would lead to lots of distracting noise.
-                    continue
-                mod_source_file = tdeps[usename]
-                # Check if a source uses a module it exports itself.
-                # Potential bug if multiple targets have a file with
-                # the same name.
-                if mod_source_file.fname == os.path.split(src)[1]:
-                    continue
-                mod_name = compiler.module_name_to_filename(usematch.group(1))
-                mod_files.append(os.path.join(dirname, mod_name))
+        tdeps = self.fortran_deps[target.get_basename()]
+        tsubdeps = self.fortran_submodules[target.get_basename()]
+        (_, submodules, uses) = self.scan_fortran_file(src)
+        for usename in uses:
+            if usename not in tdeps:
+                # The module is not provided by any source file. This is due to
+                # a) missing file/typo/etc
+                # b) using a module provided by the compiler, such as OpenMP
+                # There's no easy way to tell which is which (that I know of)
+                # so just ignore this and go on. Ideally we would print a
+                # warning message to the user but this is a common occurrance,
+                # which would lead to lots of distracting noise.
+                continue
+            # Check if a source uses a module it exports itself.
+            if tdeps[usename] == src:
+                continue
+            mod_files.append(os.path.join(dirname, compiler.module_name_to_filename(usename)))
+        # A submodule needs the interface of its ancestor module
+        # and the submodule file of its parent, if it has one.
+        for (ancestor, parent, _) in submodules:
+            if ancestor in tdeps and tdeps[ancestor] != src:
+                mod_files.append(os.path.join(dirname, compiler.module_name_to_filename(ancestor)))
+            if parent is not None and tsubdeps.get((ancestor, parent), src) != src:
+                mod_files.append(os.path.join(dirname, compiler.submodule_name_to_filename(ancestor, parent)))
         return mod_files
 
     def generate_single_compile(self, target, outfile, src, is_generated=False, header_deps=[], order_deps=[]):
@@ -1458,29 +1681,20 @@ rule FORTRAN_DEP_HACK
                 break
         if isinstance(src, RawFilename):
             rel_src = src.fname
+            abs_src = os.path.join(self.environment.get_build_dir(), rel_src)
         elif is_generated:
             if self.has_dir_part(src):
                 rel_src = src
             else:
                 rel_src = os.path.join(self.get_target_private_dir(target), src)
-                abs_src = os.path.join(self.environment.get_source_dir(), rel_src)
+            abs_src = os.path.join(self.environment.get_build_dir(), rel_src)
         else:
             if isinstance(src, File):
                 rel_src = src.rel_to_builddir(self.build_to_src)
             else:
                 raise build.InvalidArguments('Invalid source type.')
             abs_src = os.path.join(self.environment.get_build_dir(), rel_src)
-        if isinstance(src, RawFilename):
-            src_filename = src.fname
-        elif isinstance(src, File):
-            src_filename = src.fname
-        elif os.path.isabs(src):
-            src_filename = os.path.basename(src)
-        else:
-            src_filename = src
-        obj_basename = src_filename.replace('/', '_').replace('\\', '_')
-        rel_obj = os.path.join(self.get_target_private_dir(target), obj_basename)
-        rel_obj += '.' + self.environment.get_object_suffix()
+        rel_obj = self.get_object_for_source(target, src)
         dep_file = compiler.depfile_for_object(rel_obj)
         if self.environment.coredata.get_builtin_option('use_pch'):
             pchlist = target.get_pch(compiler.language)
@@ -1490,7 +1704,7 @@ rule FORTRAN_DEP_HACK
             pch_dep = []
         else:
             arr = []
-            i = os.path.join(self.get_target_private_dir(target), compiler.get_pch_name(pchlist[0]))
+            i = os.path.join(self.get_pch_dir(target, compiler.language), compiler.get_pch_name(pchlist[0]))
             arr.append(i)
             pch_dep = arr
         custom_target_include_dirs = []
@@ -1509,15 +1723,26 @@ rule FORTRAN_DEP_HACK
         compiler_name = '%s%s_COMPILER' % (compiler.get_language(), crstr)
         extra_deps = []
         if compiler.get_language() == 'fortran':
+            abs_src = os.path.normpath(abs_src)
             extra_deps += self.get_fortran_deps(compiler, abs_src, target)
+            # Generated sources do not wait for each other, which
+            # would be a dependency cycle.
+            pending_objs = self.fortran_pending_objs[target.get_basename()]
+            if rel_obj not in pending_objs:
+                extra_deps += pending_objs
             # Dependency hack. Remove once multiple outputs in Ninja is fixed:
             # https://groups.google.com/forum/#!topic/ninja-build/j-2RfBIOd_8
+            modfiles = []
             for modname, srcfile in self.fortran_deps[target.get_basename()].items():
-                modfile = os.path.join(self.get_target_private_dir(target),
-                                       compiler.module_name_to_filename(modname))
-                if srcfile == src:
-                    depelem = NinjaBuildElement(self.all_outputs, modfile, 'FORTRAN_DEP_HACK', rel_obj)
-                    depelem.write(outfile)
+                if srcfile == abs_src:
+                    modfiles.append(compiler.module_name_to_filename(modname))
+            for (ancestor, name), srcfile in self.fortran_submodules[target.get_basename()].items():
+                if srcfile == abs_src:
+                    modfiles.append(compiler.submodule_name_to_filename(ancestor, name))
+            for modfile in modfiles:
+                modfile = os.path.join(self.get_target_private_dir(target), modfile)
+                depelem = NinjaBuildElement(self.all_outputs, modfile, 'FORTRAN_DEP_HACK', rel_obj)
+                depelem.write(outfile)
             commands += compiler.get_module_outdir_args(self.get_target_private_dir(target))
 
         element = NinjaBuildElement(self.all_outputs, rel_obj, compiler_name, rel_src)
@@ -1541,9 +1766,93 @@ rule FORTRAN_DEP_HACK
             element.add_orderdep(i)
         element.add_item('DEPFILE', dep_file)
         element.add_item('ARGS', commands)
+        self.use_rspfile_if_needed(element)
         element.write(outfile)
         return rel_obj
 
+    def load_ninja_log(self):
+        '''Returns a dict mapping output files of the previous builds
+        to the time in milliseconds it took to build them.'''
+        if self.ninja_log is not None:
+            return self.ninja_log
+        self.ninja_log = {}
+        logfile = os.path.join(self.environment.get_build_dir(), '.ninja_log')
+        try:
+            f = open(logfile, encoding='utf-8', errors='replace')
+        except OSError:
+            return self.ninja_log
+        with f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 4:
+                    continue
+                try:
+                    duration = int(fields[1]) - int(fields[0])
+                except ValueError:
+                    continue
+                # Later entries are from newer builds.
+                self.ninja_log[fields[3]] = max(duration, 0)
+        return self.ninja_log
+
+    def get_mtime(self, fname):
+        try:
+            return os.stat(fname).st_mtime
+        except OSError:
+            return None
+
+    def estimate_unity_costs(self, target, sources, previous_blocks, suffix):
+        log = self.load_ninja_log()
+        build_dir = self.environment.get_build_dir()
+        costs = {}
+        last_compiled = {}
+        # Time spent on a previous unity block is divided among its
+        # files by size.
+        for block in previous_blocks:
+            unity_file = self.get_unity_file_name(target, self.unity_block_key(block), suffix)
+            obj = self.get_object_for_source(target, unity_file)
+            obj_mtime = self.get_mtime(os.path.join(build_dir, obj))
+            sizes = [max(os.path.getsize(x), 1) if os.path.exists(x) else 1 for x in block]
+            total_size = sum(sizes)
+            for (src, size) in zip(block, sizes):
+                if obj in log:
+                    costs[src] = log[obj] * size / total_size
+                if obj_mtime is not None:
+                    last_compiled[src] = obj_mtime
+        # Files that were compiled on their own have exact timings.
+        for src in sources:
+            if src not in self.unity_origins:
+                continue
+            obj = self.get_object_for_source(target, self.unity_origins[src][0])
+            obj_mtime = self.get_mtime(os.path.join(build_dir, obj))
+            if obj in log:
+                costs[src] = log[obj]
+            if obj_mtime is not None:
+                last_compiled[src] = max(obj_mtime, last_compiled.get(src, 0))
+        # A file is being edited if it has changed since it was
+        # last compiled. Only the files and objects are compared, so
+        # the result does not depend on when Meson runs.
+        hot = set()
+        for src in sources:
+            src_mtime = self.get_mtime(src)
+            if src_mtime is not None and src in last_compiled and src_mtime > last_compiled[src]:
+                hot.add(src)
+        return (costs, hot)
+
+    def get_object_for_source(self, target, src):
+        if isinstance(src, RawFilename):
+            src_filename = src.fname
+        elif isinstance(src, File):
+            src_filename = src.fname
+        elif os.path.isabs(src):
+            src_filename = os.path.basename(src)
+        else:
+            src_filename = src
+        obj_basename = src_filename.replace('/', '_').replace('\\', '_')
+        rel_obj = os.path.join(self.get_target_private_dir(target), obj_basename)
+        return rel_obj + '.' + self.environment.get_object_suffix()
+
     def has_dir_part(self, fname):
         return '/' in fname or '\\' in fname
 
@@ -1564,7 +1873,7 @@ rule FORTRAN_DEP_HACK
         header = pch[0]
         source = pch[1]
         pchname = compiler.get_pch_name(header)
-        dst = os.path.join(self.get_target_private_dir(target), pchname)
+        dst = os.path.join(self.get_pch_dir(target, compiler.language), pchname)
 
         commands = []
         commands += self.generate_basic_compiler_args(target, compiler)
@@ -1577,7 +1886,7 @@ rule FORTRAN_DEP_HACK
     def generate_gcc_pch_command(self, target, compiler, pch):
         commands = []
         commands += self.generate_basic_compiler_args(target, compiler)
-        dst = os.path.join(self.get_target_private_dir(target),
+        dst = os.path.join(self.get_pch_dir(target, compiler.language),
                            os.path.split(pch)[-1] + '.' + compiler.get_pch_suffix())
         dep = dst + '.' + compiler.get_depfile_suffix()
         return (commands, dep, dst, []) # Gcc does not create an object file during pch generation.
@@ -1603,6 +1912,9 @@ rule FORTRAN_DEP_HACK
                 (commands, dep, dst, objs) = self.generate_gcc_pch_command(target, compiler, pch[0])
                 extradep = None
             pch_objects += objs
+            if dst in self.all_outputs:
+                # Shared with a target that has already been written.
+                continue
             rulename = compiler.get_language() + cstr + '_PCH'
             elem = NinjaBuildElement(self.all_outputs, dst, rulename, src)
             if extradep is not None:
@@ -1650,7 +1962,16 @@ rule FORTRAN_DEP_HACK
                 soversion = None
             commands += linker.get_soname_args(target.name, abspath, soversion)
         elif isinstance(target, build.StaticLibrary):
-            commands += linker.get_std_link_args()
+            # Libraries that are never installed only need to be usable
+            # for linking inside the build directory.
+            if not target.should_install() and self.use_thin_archives(linker):
+                commands += linker.get_std_thin_link_args()
+                linker_rule = 'STATIC_THIN' + crstr + '_LINKER'
+            else:
+                commands += linker.get_std_link_args()
+                # Normal archives are updated in place, which ar cannot do
+                # to a thin archive left over from an earlier configuration.
+                self.remove_thin_archive(os.path.join(self.environment.get_build_dir(), outname))
         else:
             raise RuntimeError('Unknown build target type.')
         # Link arguments of static libraries are not put in the command line of
@@ -1688,8 +2009,34 @@ rule FORTRAN_DEP_HACK
         elem = NinjaBuildElement(self.all_outputs, outname, linker_rule, obj_list)
         elem.add_dep(dep_targets + custom_target_libraries)
         elem.add_item('LINK_ARGS', commands)
+        self.use_rspfile_if_needed(elem)
         return elem
 
+    def supports_rspfile(self, tool):
+        '''Whether a response file variant of the rules of the given
+        compiler or static linker is needed and works. On Windows all
+        rules use response files anyway.'''
+        if mesonlib.is_windows():
+            return False
+        if isinstance(tool, compilers.ArLinker):
+            # The ar shipped with OSX does not understand @file.
+            return not mesonlib.is_osx()
+        return tool.get_id() in ('gcc', 'clang')
+
+    def get_rsp_rule_command(self, command):
+        # Ninja shell quotes $out in commands, and Meson's output names
+        # contain '@', so '@$out.rsp' would not name the response file
+        # literally. ninja -t compdb -x needs that to expand it.
+        return command.replace('$out.rsp', '$RSPFILE')
+
+    def use_rspfile_if_needed(self, element):
+        if element.rule in self.rspfile_rules and \
+           element.get_command_length() > rspfile_threshold:
+            element.rule += '_RSP'
+            # A name made of characters that never need quoting.
+            h = hashlib.sha1(element.outfilenames[0].encode('utf-8')).hexdigest()
+            element.add_item('RSPFILE', 'meson-private/%s.rsp' % h)
+
     def get_custom_target_provided_libraries(self, target):
         libs = []
         for t in target.get_generated_sources():
@@ -40,6 +40,8 @@ known_basic_kwargs = {'install' : True,
                       'sources' : True,
                       'objects' : True,
                       'native' : True,
+                      'unity_size' : True,
+                      'auto_pch' : True,
                      }
 
 known_shlib_kwargs = known_basic_kwargs.copy()
@@ -101,6 +103,9 @@ class Build:
         self.install_dirs = []
         self.dep_manifest_name = None
         self.dep_manifest = {}
+        # Static libraries built from the sources of external
+        # dependencies, keyed by source file and cross-ness.
+        self.dependency_source_libs = {}
 
     def has_language(self, language):
         for i in self.compilers:
@@ -404,6 +409,14 @@ class BuildTarget():
         self.install_rpath = kwargs.get('install_rpath', '')
         if not isinstance(self.install_rpath, str):
             raise InvalidArguments('Install_rpath is not a string.')
+        self.auto_pch = kwargs.get('auto_pch', None)
+        if self.auto_pch is not None and not isinstance(self.auto_pch, bool):
+            raise InvalidArguments('Auto_pch must be a boolean.')
+        self.unity_size = kwargs.get('unity_size', None)
+        if self.unity_size is not None:
+            if not isinstance(self.unity_size, int) or isinstance(self.unity_size, bool) \
+                or self.unity_size < 0:
+                raise InvalidArguments('Unity_size must be a non-negative integer.')
         resources = kwargs.get('resources', [])
         if not isinstance(resources, list):
             resources = [resources]
@@ -607,6 +620,14 @@ class Generator():
                 raise InvalidArguments('Every element of "output" must contain @BASENAME@ or @PLAINNAME@.')
             if '/' in rule or '\\' in rule:
                 raise InvalidArguments('"outputs" must not contain a directory separator.')
+        self.depfile = kwargs.get('depfile', None)
+        if self.depfile is not None:
+            if not isinstance(self.depfile, str):
+                raise InvalidArguments('Depfile must be a string.')
+            if not '@BASENAME@' in self.depfile and not '@PLAINNAME@' in self.depfile:
+                raise InvalidArguments('Depfile must contain @BASENAME@ or @PLAINNAME@.')
+            if '/' in self.depfile or '\\' in self.depfile:
+                raise InvalidArguments('Depfile must not contain a directory separator.')
         if len(outputs) > 1:
             for o in outputs:
                 if '@OUTPUT@' in o:
@@ -618,6 +639,11 @@ class Generator():
         basename = plainname.split('.')[0]
         return [x.replace('@BASENAME@', basename).replace('@PLAINNAME@', plainname) for x in self.outputs]
 
+    def get_dep_outname(self, inname):
+        plainname = os.path.split(inname)[1]
+        basename = plainname.split('.')[0]
+        return self.depfile.replace('@BASENAME@', basename).replace('@PLAINNAME@', plainname)
+
     def get_arglist(self):
         return self.arglist
 
@@ -775,6 +801,7 @@ class CustomTarget:
                     'build_always' : True,
                     'depends' : True,
                     'depend_files' : True,
+                    'depfile' : True,
                     }
 
     def __init__(self, name, subdir, kwargs):
@@ -853,6 +880,12 @@ class CustomTarget:
         self.build_always = kwargs.get('build_always', False)
         if not isinstance(self.build_always, bool):
             raise InvalidArguments('Argument build_always must be a boolean.')
+        self.depfile = kwargs.get('depfile', None)
+        if self.depfile is not None:
+            if not isinstance(self.depfile, str):
+                raise InvalidArguments('Depfile must be a string.')
+            if '/' in self.depfile:
+                raise InvalidArguments('Depfile must not contain a path segment.')
         extra_deps = kwargs.get('depends', [])
         if not isinstance(extra_deps, list):
             extra_deps = [extra_deps]
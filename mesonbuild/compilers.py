@@ -163,6 +163,21 @@ class Compiler():
     def get_option_link_args(self, options):
         return []
 
+    def get_linker_select_args(self, linker):
+        return []
+
+    def get_split_dwarf_args(self):
+        return []
+
+    def get_gdb_index_link_args(self):
+        return []
+
+    def get_lto_compile_args(self, mode):
+        return []
+
+    def get_lto_link_args(self, mode, jobs):
+        return []
+
     def has_header(self, *args, **kwargs):
         raise EnvironmentException('Language %s does not support header checks.' % self.language)
 
@@ -258,6 +273,48 @@ class CCompiler(Compiler):
     def get_coverage_args(self):
         return ['--coverage']
 
+    # Only ELF toolchains have alternative linkers and split DWARF.
+    def get_linker_select_args(self, linker):
+        if linker == 'default' or mesonlib.is_osx() or mesonlib.is_windows():
+            return []
+        return ['-fuse-ld=' + linker]
+
+    def get_split_dwarf_args(self):
+        if mesonlib.is_osx() or mesonlib.is_windows():
+            return []
+        return ['-gsplit-dwarf']
+
+    def get_gdb_index_link_args(self):
+        if mesonlib.is_osx() or mesonlib.is_windows():
+            return []
+        return ['-Wl,--gdb-index']
+
+    # GCC has no ThinLTO, it partitions the program for parallel
+    # code generation in both modes.
+    def get_lto_compile_args(self, mode):
+        if mode == 'none' or self.id not in ('gcc', 'clang'):
+            return []
+        if self.id == 'clang' and mode == 'thin':
+            return ['-flto=thin']
+        return ['-flto']
+
+    def get_lto_link_args(self, mode, jobs):
+        if mode == 'none' or self.id not in ('gcc', 'clang'):
+            return []
+        if self.id == 'clang':
+            args = self.get_lto_compile_args(mode)
+            if jobs > 0:
+                args.append('-flto-jobs=%d' % jobs)
+            return args
+        if jobs > 0:
+            return ['-flto=%d' % jobs]
+        try:
+            if mesonlib.version_compare(self.version, '>=10.0'):
+                return ['-flto=auto']
+        except MesonException:
+            pass
+        return ['-flto']
+
     def get_coverage_link_args(self):
         return ['-lgcov']
 
@@ -296,7 +353,7 @@ class CCompiler(Compiler):
         return os.path.split(header_name)[-1] + '.' + self.get_pch_suffix()
 
     def sanity_check(self, work_dir):
-        mlog.debug('Sanity testing C compiler:', ' '.join(self.exelist))
+        mlog.debug('Sanity testing C compiler:', lambda: ' '.join(self.exelist))
         mlog.debug('Is cross compiler: %s.' % str(self.is_cross))
 
         source_name = os.path.join(work_dir, 'sanitycheckc.c')
@@ -322,7 +379,7 @@ class CCompiler(Compiler):
         (stdo, stde) = pc.communicate()
         stdo = stdo.decode()
         stde = stde.decode()
-        mlog.debug('Sanity check compiler command line:', ' '.join(cmdlist))
+        mlog.debug('Sanity check compiler command line:', lambda: ' '.join(cmdlist))
         mlog.debug('Sanity check compile stdout:')
         mlog.debug(stdo)
         mlog.debug('-----\nSanity check compile stderr:')
@@ -337,7 +394,7 @@ class CCompiler(Compiler):
             cmdlist = self.exe_wrapper + [binary_name]
         else:
             cmdlist = [binary_name]
-        mlog.debug('Running test binary command: ' + ' '.join(cmdlist))
+        mlog.debug('Running test binary command:', lambda: ' '.join(cmdlist))
         pe = subprocess.Popen(cmdlist)
         pe.wait()
         if pe.returncode != 0:
@@ -354,7 +411,7 @@ int someSymbolHereJustForFun;
         commands.append(srcname)
         commands += extra_args
         mlog.debug('Running compile:')
-        mlog.debug('Command line: ', ' '.join(commands))
+        mlog.debug('Command line: ', lambda: ' '.join(commands))
         mlog.debug('Code:\n', code)
         p = subprocess.Popen(commands, cwd=os.path.split(srcname)[0], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         (stde, stdo) = p.communicate()
@@ -432,7 +489,7 @@ int someSymbolHereJustForFun;
         try:
             pe = subprocess.Popen(cmdlist, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         except Exception as e:
-            mlog.debug('Could not run: %s (error: %s)\n' % (cmdlist, e))
+            mlog.debug(lambda: 'Could not run: %s (error: %s)\n' % (cmdlist, e))
             return RunResult(False)
 
         (so, se) = pe.communicate()
@@ -598,7 +655,7 @@ class CPPCompiler(CCompiler):
         (stdo, stde) = pc.communicate()
         stdo = stdo.decode()
         stde = stde.decode()
-        mlog.debug('Sanity check compiler command line:', ' '.join(cmdlist))
+        mlog.debug('Sanity check compiler command line:', lambda: ' '.join(cmdlist))
         mlog.debug('Sanity check compile stdout:')
         mlog.debug(stdo)
         mlog.debug('-----\nSanity check compile stderr:')
@@ -1639,6 +1696,9 @@ end program prog
     def module_name_to_filename(self, module_name):
         return module_name.lower() + '.mod'
 
+    def submodule_name_to_filename(self, ancestor_name, submodule_name):
+        return '%s@%s.smod' % (ancestor_name.lower(), submodule_name.lower())
+
     def get_warn_args(self, level):
         return ['-Wall']
 
@@ -1833,6 +1893,12 @@ class ArLinker():
             self.std_args = ['csrD']
         else:
             self.std_args = ['csr']
+        # GNU ar can create thin archives that only refer to the
+        # object files instead of containing copies of them.
+        if b'[T]' in stdo:
+            self.thin_args = [self.std_args[0] + 'T']
+        else:
+            self.thin_args = None
 
     def build_rpath_args(self, build_dir, rpath_paths, install_rpath):
         return []
@@ -1843,6 +1909,9 @@ class ArLinker():
     def get_std_link_args(self):
         return self.std_args
 
+    def get_std_thin_link_args(self):
+        return self.thin_args
+
     def get_output_args(self, target):
         return [target]
 
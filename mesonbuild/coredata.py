@@ -20,12 +20,24 @@ build_types = ['plain', 'debug', 'debugoptimized', 'release']
 layouts = ['mirror', 'flat']
 warning_levels = ['1', '2', '3']
 libtypelist = ['shared', 'static']
+unity_groupings = ['files', 'cost']
+linkers = ['default', 'bfd', 'gold', 'lld']
+lto_modes = ['none', 'full', 'thin']
 
 builtin_options = {'buildtype': True,
                    'strip': True,
                    'coverage': True,
                    'pch': True,
+                   'auto_pch': True,
                    'unity': True,
+                   'unity_size': True,
+                   'unity_grouping': True,
+                   'thin_archives': True,
+                   'linker': True,
+                   'split_dwarf': True,
+                   'gdb_index': True,
+                   'lto': True,
+                   'lto_jobs': True,
                    'prefix': True,
                    'libdir' : True,
                    'bindir' : True,
@@ -95,6 +107,34 @@ class UserBooleanOption(UserOption):
             return True
         raise MesonException('Value "%s" for boolean option "%s" is not a boolean.' % (valuestring, self.name))
 
+class UserIntegerOption(UserOption):
+    def __init__(self, name, description, min_value, max_value, value):
+        super().__init__(name, description, '>= %d' % min_value)
+        self.min_value = min_value
+        self.max_value = max_value
+        self.set_value(value)
+
+    def toint(self, thing):
+        if isinstance(thing, bool):
+            raise MesonException('Value %s for option "%s" is not an integer.' % (str(thing), self.name))
+        if isinstance(thing, int):
+            return thing
+        try:
+            return int(thing)
+        except ValueError:
+            raise MesonException('Value "%s" for option "%s" is not an integer.' % (thing, self.name))
+
+    def set_value(self, newvalue):
+        newvalue = self.toint(newvalue)
+        if newvalue < self.min_value:
+            raise MesonException('Value %d for option "%s" is smaller than the minimum %d.' % (newvalue, self.name, self.min_value))
+        if self.max_value is not None and newvalue > self.max_value:
+            raise MesonException('Value %d for option "%s" is larger than the maximum %d.' % (newvalue, self.name, self.max_value))
+        self.value = newvalue
+
+    def parse_string(self, valuestring):
+        return self.toint(valuestring)
+
 class UserComboOption(UserOption):
     def __init__(self, name, description, choices, value):
         super().__init__(name, description, choices)
@@ -168,8 +208,17 @@ class CoreData():
         self.builtin_options['buildtype'] = UserComboOption('buildtype', 'Build type', build_types, options.buildtype)
         self.builtin_options['strip'] = UserBooleanOption('strip', 'Strip on install', options.strip)
         self.builtin_options['use_pch'] = UserBooleanOption('use_pch', 'Use precompiled headers', options.use_pch)
+        self.builtin_options['auto_pch'] = UserBooleanOption('auto_pch', 'Generate precompiled headers automatically', options.auto_pch)
         self.builtin_options['unity'] = UserBooleanOption('unity', 'Unity build', options.unity)
+        self.builtin_options['unity_size'] = UserIntegerOption('unity_size', 'Unity block size', 0, None, options.unity_size)
+        self.builtin_options['unity_grouping'] = UserComboOption('unity_grouping', 'Unity block grouping', unity_groupings, options.unity_grouping)
         self.builtin_options['coverage'] = UserBooleanOption('coverage', 'Enable coverage', options.coverage)
+        self.builtin_options['linker'] = UserComboOption('linker', 'Linker to use', linkers, options.linker)
+        self.builtin_options['split_dwarf'] = UserBooleanOption('split_dwarf', 'Put debug info in separate .dwo files', options.split_dwarf)
+        self.builtin_options['gdb_index'] = UserBooleanOption('gdb_index', 'Add a gdb index to linked binaries', options.gdb_index)
+        self.builtin_options['lto'] = UserComboOption('lto', 'Link time optimisation', lto_modes, options.lto)
+        self.builtin_options['lto_jobs'] = UserIntegerOption('lto_jobs', 'Parallel link time optimisation jobs', 0, None, options.lto_jobs)
+        self.builtin_options['thin_archives'] = UserBooleanOption('thin_archives', 'Use thin archives for static libraries that are not installed', options.thin_archives)
         self.builtin_options['warning_level'] = UserComboOption('warning_level', 'Warning level', warning_levels, options.warning_level)
         self.builtin_options['werror'] = UserBooleanOption('werror', 'Warnings are errors', options.werror)
         self.builtin_options['layout'] = UserComboOption('layout', 'Build dir layout', layouts, options.layout)
@@ -20,7 +20,7 @@
 # package before this gets too big.
 
 import re
-import os, stat, glob, subprocess, shutil
+import os, stat, glob, subprocess, pickle, copy
 import sysconfig
 from . coredata import MesonException
 from . import mlog
@@ -30,6 +30,111 @@ class DependencyException(MesonException):
     def __init__(self, *args, **kwargs):
         MesonException.__init__(self, *args, **kwargs)
 
+class DetectionCache():
+    """A persistent store for the results of dependency detection that
+    requires running helper tools or scanning directories. Entries are
+    keyed by the stat information of the files the result depends on,
+    relevant environment variables and any extra values such as the
+    requested modules, so they go stale by themselves when the tools or
+    libraries are changed. The file is shared by all build directories
+    of the user. New entries are written out once per run by save()."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.entries = self.load()
+        self.dirty = False
+
+    def load(self):
+        if self.fname is None:
+            return {}
+        try:
+            with open(self.fname, 'rb') as f:
+                entries = pickle.load(f)
+            if isinstance(entries, dict):
+                return entries
+        except Exception:
+            pass
+        return {}
+
+    def make_key(self, kind, files=(), envvars=(), extra=()):
+        stamps = []
+        for f in files:
+            try:
+                st = os.stat(f)
+                stamps.append((f, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamps.append((f, None, None))
+        env = [(v, os.environ.get(v)) for v in envvars]
+        return repr((kind, stamps, env, list(extra)))
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.dirty = True
+
+    def save(self):
+        if self.fname is None or not self.dirty:
+            return
+        # Other Meson processes may have added entries since we loaded.
+        merged = self.load()
+        merged.update(self.entries)
+        self.entries = merged
+        tmpname = '%s.tmp%d' % (self.fname, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+            with open(tmpname, 'wb') as f:
+                pickle.dump(self.entries, f)
+            os.replace(tmpname, self.fname)
+        except OSError as e:
+            mlog.debug('Could not write dependency cache %s: %s' % (self.fname, e))
+        self.dirty = False
+
+detection_cache = None
+
+# Helper tools are often wrappers that pick what to
+# run or where to look from these.
+tool_envvars = ('PATH', 'PKG_CONFIG_PATH', 'PKG_CONFIG_LIBDIR', 'QT_SELECT')
+
+def get_detection_cache():
+    global detection_cache
+    if detection_cache is None:
+        # The persistent cache is only used when asked for. Results are
+        # kept in memory for the current run in any case.
+        fname = os.environ.get('MESON_DEPENDENCY_CACHE') or None
+        detection_cache = DetectionCache(fname)
+    return detection_cache
+
+def save_detection_cache():
+    if detection_cache is not None:
+        detection_cache.save()
+
+def get_tool_output(cmd, envvars=()):
+    """Runs cmd and returns a tuple of its return code and its decoded
+    standard output and standard error. Successful runs are cached for
+    as long as the tool binary, the file it resolves to and the
+    environment variables that commonly affect such tools, plus the
+    given ones, stay the same. Raises FileNotFoundError if the tool
+    can not be found."""
+    toolpath = mesonlib.which(cmd[0])
+    if toolpath is None:
+        raise FileNotFoundError('Program %s not found.' % cmd[0])
+    cache = get_detection_cache()
+    # Shims like qtchooser are symlinks to one binary that
+    # behaves differently depending on the name it is run as.
+    files = [toolpath, os.path.realpath(toolpath)]
+    key = cache.make_key('tool', files, tool_envvars + tuple(envvars), cmd)
+    result = cache.get(key)
+    if result is not None:
+        return result
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (out, err) = p.communicate()
+    result = (p.returncode, out.decode(), err.decode())
+    if p.returncode == 0:
+        cache.put(key, result)
+    return result
+
 class Dependency():
     def __init__(self):
         self.name = "null"
@@ -49,6 +154,14 @@ class Dependency():
         As an example, gtest-all.cc when using GTest."""
         return []
 
+    def without_sources(self):
+        """Returns a copy of this dependency that provides the same
+        arguments but no sources. Used when the sources have already
+        been built into a library that is linked instead."""
+        dep = copy.copy(self)
+        dep.sources = []
+        return dep
+
     def get_name(self):
         return self.name
 
@@ -192,7 +305,7 @@ class PkgConfigDependency(Dependency):
                                  stderr=subprocess.PIPE)
             out = p.communicate()[0]
             if p.returncode == 0:
-                mlog.log('Found pkg-config:', mlog.bold(shutil.which('pkg-config')),
+                mlog.log('Found pkg-config:', mlog.bold(mesonlib.which('pkg-config')),
                          '(%s)' % out.decode().strip())
                 PkgConfigDependency.pkgconfig_found = True
                 return
@@ -240,6 +353,7 @@ class PkgConfigDependency(Dependency):
 
 class WxDependency(Dependency):
     wx_found = None
+    wxc = None
 
     def __init__(self, environment, kwargs):
         Dependency.__init__(self)
@@ -249,16 +363,13 @@ class WxDependency(Dependency):
         if not WxDependency.wx_found:
             raise DependencyException('Wx-config not found.')
         self.is_found = False
-        p = subprocess.Popen([self.wxc, '--version'],
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        out = p.communicate()[0]
-        if p.returncode != 0:
+        (returncode, out, _) = get_tool_output([self.wxc, '--version'])
+        if returncode != 0:
             mlog.log('Dependency wxwidgets found:', mlog.red('NO'))
             self.cargs = []
             self.libs = []
         else:
-            self.modversion = out.decode().strip()
+            self.modversion = out.strip()
             version_req = kwargs.get('version', None)
             if version_req is not None:
                 if not mesonlib.version_compare(self.modversion, version_req):
@@ -270,20 +381,15 @@ class WxDependency(Dependency):
             self.requested_modules = self.get_requested(kwargs)
             # wx-config seems to have a cflags as well but since it requires C++,
             # this should be good, at least for now.
-            p = subprocess.Popen([self.wxc, '--cxxflags'],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            out = p.communicate()[0]
-            if p.returncode != 0:
+            (returncode, out, _) = get_tool_output([self.wxc, '--cxxflags'])
+            if returncode != 0:
                 raise DependencyException('Could not generate cargs for wxwidgets.')
-            self.cargs = out.decode().split()
+            self.cargs = out.split()
 
-            p = subprocess.Popen([self.wxc, '--libs'] + self.requested_modules,
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out = p.communicate()[0]
-            if p.returncode != 0:
+            (returncode, out, _) = get_tool_output([self.wxc, '--libs'] + self.requested_modules)
+            if returncode != 0:
                 raise DependencyException('Could not generate libs for wxwidgets.')
-            self.libs = out.decode().split()
+            self.libs = out.split()
 
     def get_requested(self, kwargs):
         modules = 'modules'
@@ -309,18 +415,16 @@ class WxDependency(Dependency):
     def check_wxconfig(self):
         for wxc in ['wx-config-3.0', 'wx-config']:
             try:
-                p = subprocess.Popen([wxc, '--version'], stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-                out = p.communicate()[0]
-                if p.returncode == 0:
-                    mlog.log('Found wx-config:', mlog.bold(shutil.which(wxc)),
-                             '(%s)' % out.decode().strip())
-                    self.wxc = wxc
+                (returncode, out, _) = get_tool_output([wxc, '--version'])
+                if returncode == 0:
+                    mlog.log('Found wx-config:', mlog.bold(mesonlib.which(wxc)),
+                             '(%s)' % out.strip())
+                    WxDependency.wxc = wxc
                     WxDependency.wx_found = True
                     return
             except Exception:
                 pass
-        WxDependency.wxconfig_found = False
+        WxDependency.wx_found = False
         mlog.log('Found wx-config:', mlog.red('NO'))
 
     def found(self):
@@ -336,7 +440,7 @@ class ExternalProgram():
             else:
                 self.fullpath = fullpath
         else:
-            self.fullpath = [shutil.which(name)]
+            self.fullpath = [mesonlib.which(name)]
             if self.fullpath[0] is None and search_dir is not None:
                 trial = os.path.join(search_dir, name)
                 suffix = os.path.splitext(trial)[-1].lower()[1:]
@@ -425,12 +529,10 @@ class BoostDependency(Dependency):
         self.src_modules = {}
         self.lib_modules = {}
         self.lib_modules_mt = {}
-        self.detect_version()
         self.requested_modules = self.get_requested(kwargs)
         module_str = ', '.join(self.requested_modules)
+        self.detect_cached(environment.dir_index)
         if self.version is not None:
-            self.detect_src_modules()
-            self.detect_lib_modules()
             self.validate_requested()
             if self.boost_root is not None:
                 info = self.version + ', ' + self.boost_root
@@ -479,6 +581,27 @@ class BoostDependency(Dependency):
     def get_version(self):
         return self.version
 
+    def detect_cached(self, dir_index):
+        # The result depends on the headers and on the
+        # contents of every directory that is scanned.
+        if self.boost_root is None:
+            libdirs = mesonlib.get_library_dirs()
+        else:
+            libdirs = [self.boost_root, os.path.join(self.boost_root, 'lib')]
+        files = [self.boost_inc_subdir, os.path.join(self.boost_inc_subdir, 'version.hpp')] + libdirs
+        cache = get_detection_cache()
+        key = cache.make_key('boost', files, ['BOOST_ROOT'])
+        cached = cache.get(key)
+        if cached is not None:
+            (self.version, self.src_modules, self.lib_modules, self.lib_modules_mt, self.libdir) = cached
+            return
+        self.detect_version()
+        if self.version is None:
+            return
+        self.detect_src_modules()
+        self.detect_lib_modules(dir_index)
+        cache.put(key, (self.version, self.src_modules, self.lib_modules, self.lib_modules_mt, self.libdir))
+
     def detect_version(self):
         try:
             ifile = open(os.path.join(self.boost_inc_subdir, 'version.hpp'))
@@ -499,12 +622,12 @@ class BoostDependency(Dependency):
             if stat.S_ISDIR(os.stat(entry).st_mode):
                 self.src_modules[os.path.split(entry)[-1]] = True
 
-    def detect_lib_modules(self):
+    def detect_lib_modules(self, dir_index):
         if mesonlib.is_windows():
-            return self.detect_lib_modules_win()
-        return self.detect_lib_modules_nix()
+            return self.detect_lib_modules_win(dir_index)
+        return self.detect_lib_modules_nix(dir_index)
 
-    def detect_lib_modules_win(self):
+    def detect_lib_modules_win(self, dir_index):
         if mesonlib.is_32bit():
             gl = 'lib32*'
         else:
@@ -515,13 +638,13 @@ class BoostDependency(Dependency):
         libdir = libdir[0]
         self.libdir = libdir
         globber = 'boost_*-gd-*.lib' # FIXME
-        for entry in glob.glob(os.path.join(libdir, globber)):
+        for entry in dir_index.glob(libdir, globber):
             (_, fname) = os.path.split(entry)
             base = fname.split('_', 1)[1]
             modname = base.split('-', 1)[0]
             self.lib_modules_mt[modname] = fname
 
-    def detect_lib_modules_nix(self):
+    def detect_lib_modules_nix(self, dir_index):
         libsuffix = None
         if mesonlib.is_osx():
             libsuffix = 'dylib'
@@ -534,7 +657,7 @@ class BoostDependency(Dependency):
         else:
             libdirs = [os.path.join(self.boost_root, 'lib')]
         for libdir in libdirs:
-            for entry in glob.glob(os.path.join(libdir, globber)):
+            for entry in dir_index.glob(libdir, globber):
                 lib = os.path.basename(entry)
                 name = lib.split('.')[0].split('_', 1)[-1]
                 # I'm not 100% sure what to do here. Some distros
@@ -598,19 +721,19 @@ class GTestDependency(Dependency):
             os.path.join(self.src_dir, 'gtest-all.cc'))
         self.main_src = mesonlib.File.from_absolute_file(
             os.path.join(self.src_dir, 'gtest_main.cc'))
-        self.detect()
+        self.detect(environment.dir_index)
 
     def found(self):
         return self.is_found
 
-    def detect(self):
+    def detect(self, dir_index):
         trial_dirs = mesonlib.get_library_dirs()
         glib_found = False
         gmain_found = False
         for d in trial_dirs:
-            if os.path.isfile(os.path.join(d, self.libname)):
+            if dir_index.has_file(d, self.libname):
                 glib_found = True
-            if os.path.isfile(os.path.join(d, self.libmain_name)):
+            if dir_index.has_file(d, self.libmain_name):
                 gmain_found = True
         if glib_found and gmain_found:
             self.is_found = True
@@ -661,7 +784,7 @@ class GMockDependency(Dependency):
         trial_dirs = mesonlib.get_library_dirs()
         gmock_found = False
         for d in trial_dirs:
-            if os.path.isfile(os.path.join(d, self.libname)):
+            if environment.dir_index.has_file(d, self.libname):
                 gmock_found = True
         if gmock_found:
             self.is_found = True
@@ -722,9 +845,9 @@ class Qt5Dependency(Dependency):
         if environment.is_cross_build() and kwargs.get('native', False):
             type_text = 'cross'
             self.pkgconfig_detect(mods, environment, kwargs)
-        elif not environment.is_cross_build() and shutil.which('pkg-config') is not None:
+        elif not environment.is_cross_build() and mesonlib.which('pkg-config') is not None:
             self.pkgconfig_detect(mods, environment, kwargs)
-        elif shutil.which('qmake') is not None:
+        elif mesonlib.which('qmake') is not None:
             self.qmake_detect(mods, kwargs)
         else:
             self.version = 'none'
@@ -744,19 +867,18 @@ class Qt5Dependency(Dependency):
         self.version = modules[0].modversion
 
     def qmake_detect(self, mods, kwargs):
-        pc = subprocess.Popen(['qmake', '-v'], stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
-        (stdo, _) = pc.communicate()
-        if pc.returncode != 0:
+        # qtchooser picks the Qt version based on these.
+        qtenv = ('QT_SELECT', 'QTCHOOSER_RUNTOOL')
+        (returncode, stdo, _) = get_tool_output(['qmake', '-v'], qtenv)
+        if returncode != 0:
             return
-        stdo = stdo.decode()
         if not 'version 5' in stdo:
             mlog.log('QMake is not for Qt5.')
             return
         self.version = re.search('5(\.\d+)+', stdo).group(0)
-        (stdo, _) = subprocess.Popen(['qmake', '-query'], stdout=subprocess.PIPE).communicate()
+        (_, stdo, _) = get_tool_output(['qmake', '-query'], qtenv)
         qvars = {}
-        for line in stdo.decode().split('\n'):
+        for line in stdo.split('\n'):
             line = line.strip()
             if line == '':
                 continue
@@ -863,14 +985,12 @@ class GnuStepDependency(Dependency):
     def detect(self):
         confprog = 'gnustep-config'
         try:
-            gp = subprocess.Popen([confprog, '--help'],
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            gp.communicate()
+            (returncode, _, _) = get_tool_output([confprog, '--help'])
         except FileNotFoundError:
             self.args = None
             mlog.log('Dependency GnuStep found:', mlog.red('NO'), '(no gnustep-config)')
             return
-        if gp.returncode != 0:
+        if returncode != 0:
             self.args = None
             mlog.log('Dependency GnuStep found:', mlog.red('NO'))
             return
@@ -878,21 +998,13 @@ class GnuStepDependency(Dependency):
             arg = '--gui-libs'
         else:
             arg = '--base-libs'
-        fp = subprocess.Popen([confprog, '--objc-flags'],
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (flagtxt, flagerr) = fp.communicate()
-        flagtxt = flagtxt.decode()
-        flagerr = flagerr.decode()
-        if fp.returncode != 0:
+        (returncode, flagtxt, flagerr) = get_tool_output([confprog, '--objc-flags'])
+        if returncode != 0:
             raise DependencyException('Error getting objc-args: %s %s' % (flagtxt, flagerr))
         args = flagtxt.split()
         self.args = self.filter_arsg(args)
-        fp = subprocess.Popen([confprog, arg],
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (libtxt, liberr) = fp.communicate()
-        libtxt = libtxt.decode()
-        liberr = liberr.decode()
-        if fp.returncode != 0:
+        (returncode, libtxt, liberr) = get_tool_output([confprog, arg])
+        if returncode != 0:
             raise DependencyException('Error getting objc-lib args: %s %s' % (libtxt, liberr))
         self.libs = self.weird_filter(libtxt.split())
         mlog.log('Dependency GnuStep found:', mlog.green('YES'))
@@ -981,18 +1093,12 @@ class SDL2Dependency(Dependency):
         self.is_found = False
         self.cargs = []
         self.linkargs = []
-        sdlconf = shutil.which('sdl2-config')
+        sdlconf = mesonlib.which('sdl2-config')
         if sdlconf:
-            pc = subprocess.Popen(['sdl2-config', '--cflags'],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.DEVNULL)
-            (stdo, _) = pc.communicate()
-            self.cargs = stdo.decode().strip().split()
-            pc = subprocess.Popen(['sdl2-config', '--libs'],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.DEVNULL)
-            (stdo, _) = pc.communicate()
-            self.linkargs = stdo.decode().strip().split()
+            (_, stdo, _) = get_tool_output(['sdl2-config', '--cflags'])
+            self.cargs = stdo.strip().split()
+            (_, stdo, _) = get_tool_output(['sdl2-config', '--libs'])
+            self.linkargs = stdo.strip().split()
             self.is_found = True
             mlog.log('Dependency', mlog.bold('sdl2'), 'found:', mlog.green('YES'), '(%s)' % sdlconf)
             return
@@ -44,6 +44,8 @@ def find_valgrind():
 
 def detect_ninja():
     for n in ['ninja', 'ninja-build']:
+        if mesonlib.which(n) is None:
+            continue
         try:
             p = subprocess.Popen([n, '--version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except FileNotFoundError:
@@ -68,6 +70,8 @@ class Environment():
         self.log_dir = os.path.join(build_dir, Environment.log_dir)
         os.makedirs(self.scratch_dir, exist_ok=True)
         os.makedirs(self.log_dir, exist_ok=True)
+        self.dir_index = mesonlib.DirectoryIndex(os.path.join(self.scratch_dir, 'dir_index.dat'))
+        mesonlib.set_program_index(mesonlib.ProgramIndex(self.dir_index))
         try:
             cdf = os.path.join(self.get_build_dir(), Environment.coredata_file)
             self.coredata = coredata.load(cdf)
@@ -129,6 +133,7 @@ class Environment():
     def dump_coredata(self):
         cdf = os.path.join(self.get_build_dir(), Environment.coredata_file)
         coredata.save(self.coredata, cdf)
+        self.dir_index.save()
 
     def get_script_dir(self):
         return os.path.join(os.path.dirname(self.meson_script_file), '../scripts')
@@ -193,6 +198,8 @@ class Environment():
             is_cross = False
             exe_wrap = None
         for compiler in compilers:
+            if mesonlib.which(compiler) is None:
+                continue
             try:
                 basename = os.path.basename(compiler).lower()
                 if basename == 'cl' or basename == 'cl.exe':
@@ -245,6 +252,8 @@ class Environment():
             is_cross = False
             exe_wrap = None
         for compiler in compilers:
+            if mesonlib.which(compiler) is None:
+                continue
             for arg in ['--version', '-V']:
                 try:
                    p = subprocess.Popen([compiler] + [arg],
@@ -316,6 +325,8 @@ class Environment():
             is_cross = False
             exe_wrap = None
         for compiler in compilers:
+            if mesonlib.which(compiler) is None:
+                continue
             basename = os.path.basename(compiler).lower()
             if basename == 'cl' or basename == 'cl.exe':
                 arg = '/?'
@@ -499,6 +510,22 @@ class Environment():
             return SwiftCompiler(exelist, version)
         raise EnvironmentException('Unknown compiler "' + ' '.join(exelist) + '"')
 
+    def detect_lto_static_linker(self, compiler):
+        '''Archives of LTO objects need a symbol index that plain ar can
+        only create if it happens to find the compiler's plugin. Use
+        the archiver wrappers of the compilers instead.'''
+        if self.coredata.get_builtin_option('lto') == 'none':
+            return None
+        if compiler.get_id() == 'gcc':
+            linker = 'gcc-ar'
+        elif compiler.get_id() == 'clang':
+            linker = 'llvm-ar'
+        else:
+            return None
+        if mesonlib.which(linker) is None:
+            return None
+        return linker
+
     def detect_static_linker(self, compiler):
         if compiler.is_cross:
             linker = self.cross_info.config['binaries']['ar']
@@ -506,10 +533,12 @@ class Environment():
             evar = 'AR'
             if evar in os.environ:
                 linker = os.environ[evar].strip()
-            if isinstance(compiler, VisualStudioCCompiler):
+            elif isinstance(compiler, VisualStudioCCompiler):
                 linker= self.vs_static_linker
             else:
-                linker = self.default_static_linker
+                linker = self.detect_lto_static_linker(compiler)
+                if linker is None:
+                    linker = self.default_static_linker
         basename = os.path.basename(linker).lower()
         if basename == 'lib' or basename == 'lib.exe':
             arg = '/?'
@@ -531,6 +560,8 @@ class Environment():
         raise EnvironmentException('Unknown static linker "%s"' % linker)
 
     def detect_ccache(self):
+        if mesonlib.which('ccache') is None:
+            return []
         try:
             has_ccache = subprocess.call(['ccache', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         except OSError:
@@ -609,9 +640,9 @@ class Environment():
         prefix = self.get_shared_lib_prefix()
         for d in dirs:
             for suffix in suffixes:
-                trial = os.path.join(d, prefix + libname + '.' + suffix)
-                if os.path.isfile(trial):
-                    return trial
+                fname = prefix + libname + '.' + suffix
+                if self.dir_index.has_file(d, fname):
+                    return os.path.join(d, fname)
 
 
 def get_args_from_envvars(lang):
@@ -17,6 +17,7 @@ from . import environment
 from . import coredata
 from . import dependencies
 from . import mlog
+from . import mprofile
 from . import build
 from . import optinterpreter
 from .wrap import wrap
@@ -70,6 +71,19 @@ def stringArgs(f):
         return f(self, node, args, kwargs)
     return wrapped
 
+def profiled(category):
+    def decorator(f):
+        @wraps(f)
+        def wrapped(self, node, args, kwargs):
+            if not mprofile.enabled:
+                return f(self, node, args, kwargs)
+            name = '%s(%s)' % (category, args[0] if len(args) > 0 and isinstance(args[0], str) else '')
+            with mprofile.span(category, name, file=os.path.join(self.subdir, environment.build_filename),
+                               line=node.lineno):
+                return f(self, node, args, kwargs)
+        return wrapped
+    return decorator
+
 def stringifyUserArguments(args):
     if isinstance(args, list):
         return '[%s]' % ', '.join([stringifyUserArguments(x) for x in args])
@@ -141,7 +155,7 @@ class RunProcess(InterpreterObject):
         except FileNotFoundError:
             pass
         # Was not a command, is a program in path?
-        exe = shutil.which(cmd_name)
+        exe = mesonlib.which(cmd_name)
         if exe is not None:
             command_array = [exe] + command_array[1:]
             return subprocess.Popen(command_array, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
@@ -583,6 +597,10 @@ class CompilerHolder(InterpreterObject):
                              'cmd_array' : self.cmd_array_method,
                             })
 
+    def method_call(self, method_name, args, kwargs):
+        with mprofile.span('compiler', '%s.%s' % (self.compiler.get_language(), method_name)):
+            return super().method_call(method_name, args, kwargs)
+
     def version_method(self, args, kwargs):
         return self.compiler.version
 
@@ -898,7 +916,8 @@ class Interpreter():
             raise InvalidCode('Builder file is empty.')
         assert(isinstance(code, str))
         try:
-            self.ast = mparser.Parser(code).parse()
+            with mprofile.span('parse', os.path.join(self.subdir, environment.build_filename)):
+                self.ast = mparser.Parser(code).parse()
         except coredata.MesonException as me:
             me.file = environment.build_filename
             raise me
@@ -1029,10 +1048,10 @@ class Interpreter():
             raise InvalidCode('First statement must be a call to project')
 
     def run(self):
-        self.evaluate_codeblock(self.ast)
+        self.evaluate_codeblock(self.ast, toplevel=True)
         mlog.log('Build targets in project:', mlog.bold(str(len(self.build.targets))))
 
-    def evaluate_codeblock(self, node):
+    def evaluate_codeblock(self, node, toplevel=False):
         if node is None:
             return
         if not isinstance(node, mparser.CodeBlockNode):
@@ -1045,7 +1064,10 @@ class Interpreter():
         while i < len(statements):
             cur = statements[i]
             try:
-                self.evaluate_statement(cur)
+                if toplevel and mprofile.enabled:
+                    self.profile_statement(cur)
+                else:
+                    self.evaluate_statement(cur)
             except Exception as e:
                 if not(hasattr(e, 'lineno')):
                     e.lineno = cur.lineno
@@ -1054,6 +1076,15 @@ class Interpreter():
                 raise e
             i += 1 # In THE FUTURE jump over blocks and stuff.
 
+    def profile_statement(self, cur):
+        fname = os.path.join(self.subdir, environment.build_filename)
+        if isinstance(cur, mparser.FunctionNode):
+            name = '%s:%d %s()' % (fname, cur.lineno, cur.func_name)
+        else:
+            name = '%s:%d' % (fname, cur.lineno)
+        with mprofile.span('statement', name):
+            self.evaluate_statement(cur)
+
     def get_variable(self, varname):
         if varname in self.builtin:
             return self.builtin[varname]
@@ -1248,6 +1279,7 @@ class Interpreter():
         raise InterpreterException('Tried to call option() in build description file. All options must be in the option file.')
 
     @stringArgs
+    @profiled('subproject')
     def func_subproject(self, nodes, args, kwargs):
         if len(args) != 1:
             raise InterpreterException('Subproject takes exactly one argument')
@@ -1474,7 +1506,8 @@ class Interpreter():
                 cross_comp = self.coredata.cross_compilers.get(lang, None)
             else:
                 try:
-                    (comp, cross_comp) = self.detect_compilers(lang, need_cross_compiler)
+                    with mprofile.span('compiler', 'detect %s compiler' % lang):
+                        (comp, cross_comp) = self.detect_compilers(lang, need_cross_compiler)
                 except Exception:
                     if not required:
                         mlog.log('Compiler for language', mlog.bold(lang), 'not found.')
@@ -1495,6 +1528,7 @@ class Interpreter():
                 self.build.add_cross_compiler(comp)
         return success
 
+    @profiled('find_program')
     def func_find_program(self, node, args, kwargs):
         self.validate_arguments(args, 1, [str])
         required = kwargs.get('required', True)
@@ -1543,6 +1577,7 @@ class Interpreter():
             raise InvalidArguments('External library "%s" not found.' % libname)
         return libobj
 
+    @profiled('dependency')
     def func_dependency(self, node, args, kwargs):
         self.validate_arguments(args, 1, [str])
         name = args[0]
@@ -1567,7 +1602,8 @@ class Interpreter():
         if len(fbinfo) != 2:
             raise InterpreterException('Fallback info must have exactly two items.')
         dirname, varname = fbinfo
-        self.do_subproject(dirname, kwargs)
+        with mprofile.span('subproject', 'subproject(%s)' % dirname):
+            self.do_subproject(dirname, kwargs)
         return self.subprojects[dirname].get_variable_method([varname], {})
 
     def func_executable(self, node, args, kwargs):
@@ -1781,11 +1817,12 @@ class Interpreter():
         code = open(absname).read()
         assert(isinstance(code, str))
         try:
-            codeblock = mparser.Parser(code).parse()
+            with mprofile.span('parse', buildfilename):
+                codeblock = mparser.Parser(code).parse()
         except coredata.MesonException as me:
             me.file = buildfilename
             raise me
-        self.evaluate_codeblock(codeblock)
+        self.evaluate_codeblock(codeblock, toplevel=True)
         self.subdir = prev_subdir
 
     @stringArgs
@@ -1833,7 +1870,9 @@ class Interpreter():
             os.makedirs(os.path.join(self.environment.build_dir, self.subdir), exist_ok=True)
             ifile_abs = os.path.join(self.environment.source_dir, self.subdir, inputfile)
             ofile_abs = os.path.join(self.environment.build_dir, self.subdir, output)
-            mesonlib.do_conf_file(ifile_abs, ofile_abs, conf.held_object)
+            stampfile = os.path.join(self.environment.get_scratch_dir(), 'configure_file',
+                                     self.subdir, output + '.stamp')
+            mesonlib.do_conf_file(ifile_abs, ofile_abs, conf.held_object, stampfile)
             conf.mark_used()
         elif 'command' in kwargs:
             res = self.func_run_command(node, kwargs['command'], {})
@@ -1938,7 +1977,10 @@ class Interpreter():
         sources += kw_src
         sources = self.source_strings_to_files(sources)
         objs = self.flatten(kwargs.get('objects', []))
-        kwargs['dependencies'] = self.flatten(kwargs.get('dependencies', []))
+        deps = self.flatten(kwargs.get('dependencies', []))
+        if not isinstance(deps, list):
+            deps = [deps]
+        kwargs['dependencies'] = self.build_dependency_sources(deps, is_cross)
         if not isinstance(objs, list):
             objs = [objs]
         self.check_sources_exist(os.path.join(self.source_root, self.subdir), sources)
@@ -1959,6 +2001,57 @@ class Interpreter():
         self.global_args_frozen = True
         return l
 
+    def build_dependency_sources(self, deps, is_cross):
+        """Replaces external dependencies that provide source files (such as
+        GTest and GMock when no prebuilt library is available) with internal
+        dependencies on static libraries built from those sources. Each
+        source file is compiled once per build tree no matter how many
+        targets use the dependency."""
+        result = []
+        for d in deps:
+            held = getattr(d, 'held_object', d)
+            if isinstance(held, dependencies.InternalDependency):
+                ext_deps = self.build_dependency_sources(held.ext_deps, is_cross)
+                if ext_deps != held.ext_deps:
+                    held = dependencies.InternalDependency(held.include_directories, held.libraries,
+                                                           held.sources, ext_deps)
+                    d = held
+            elif isinstance(held, dependencies.Dependency) and len(held.get_sources()) > 0:
+                libs = []
+                sources = []
+                for s in held.get_sources():
+                    if isinstance(s, mesonlib.File):
+                        libs = [self.get_dependency_source_library(held, s, libs, is_cross)]
+                    else:
+                        sources.append(s)
+                d = dependencies.InternalDependency([], libs, sources, [held.without_sources()])
+            result.append(d)
+        return result
+
+    def get_dependency_source_library(self, dep, source, link_with, is_cross):
+        # Later sources of a dependency, such as the file providing main(),
+        # use symbols of the earlier ones so they link with them.
+        # The library is compiled with the dependency's own flags only,
+        # not with the c_args or cpp_args of the targets using it.
+        key = (source.subdir, source.fname, is_cross)
+        if key in self.build.dependency_source_libs:
+            return self.build.dependency_source_libs[key]
+        name = os.path.splitext(os.path.basename(source.fname))[0]
+        if is_cross != self.environment.is_cross_build():
+            name += '-native'
+        mlog.debug('Building sources of dependency %s as library %s.' % (dep.get_name(), name))
+        kwargs = {'dependencies': [dep.without_sources()],
+                  'link_with': link_with,
+                  'native': not is_cross}
+        # The library lives in Meson's private build directory and its
+        # target id is prefixed like that of a subproject target, so it
+        # does not clash with user targets of the same name.
+        lib = build.StaticLibrary(name, 'meson-private', 'meson-private', is_cross,
+                                  [source], [], self.environment, kwargs)
+        self.add_target(name, lib)
+        self.build.dependency_source_libs[key] = lib
+        return lib
+
     def check_sources_exist(self, subdir, sources):
         for s in sources:
             if not isinstance(s, str):
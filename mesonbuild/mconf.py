@@ -18,7 +18,7 @@ import sys, os
 import pickle
 import argparse
 from . import coredata, mesonlib
-from .coredata import build_types, warning_levels, libtypelist
+from .coredata import build_types, warning_levels, libtypelist, unity_groupings, linkers, lto_modes
 
 parser = argparse.ArgumentParser()
 
@@ -127,7 +127,16 @@ class Conf:
         carr.append(['strip', 'Strip on install', self.coredata.get_builtin_option('strip'), booleans])
         carr.append(['coverage', 'Coverage report', self.coredata.get_builtin_option('coverage'), booleans])
         carr.append(['use_pch', 'Precompiled headers', self.coredata.get_builtin_option('use_pch'), booleans])
+        carr.append(['auto_pch', 'Automatic precompiled headers', self.coredata.get_builtin_option('auto_pch'), booleans])
         carr.append(['unity', 'Unity build', self.coredata.get_builtin_option('unity'), booleans])
+        carr.append(['unity_size', 'Unity block size', self.coredata.get_builtin_option('unity_size'), '>= 0'])
+        carr.append(['unity_grouping', 'Unity block grouping', self.coredata.get_builtin_option('unity_grouping'), unity_groupings])
+        carr.append(['linker', 'Linker', self.coredata.get_builtin_option('linker'), linkers])
+        carr.append(['split_dwarf', 'Split debug info', self.coredata.get_builtin_option('split_dwarf'), booleans])
+        carr.append(['gdb_index', 'Gdb index', self.coredata.get_builtin_option('gdb_index'), booleans])
+        carr.append(['lto', 'Link time optimisation', self.coredata.get_builtin_option('lto'), lto_modes])
+        carr.append(['lto_jobs', 'Parallel LTO jobs', self.coredata.get_builtin_option('lto_jobs'), '>= 0'])
+        carr.append(['thin_archives', 'Thin archives for uninstalled static libraries', self.coredata.get_builtin_option('thin_archives'), booleans])
         carr.append(['default_library', 'Default library type', self.coredata.get_builtin_option('default_library'), libtypelist])
         self.print_aligned(carr)
         print('')
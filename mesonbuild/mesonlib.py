@@ -15,6 +15,7 @@
 """A library of random helper functionality."""
 
 import platform, subprocess, operator, os, shutil, re, sys
+import filecmp, hashlib, fnmatch, pickle
 
 from glob import glob
 
@@ -173,7 +174,15 @@ def default_libdir():
         return 'lib64'
     return 'lib'
 
+library_dirs = None
+
 def get_library_dirs():
+    global library_dirs
+    if library_dirs is None:
+        library_dirs = detect_library_dirs()
+    return library_dirs[:]
+
+def detect_library_dirs():
     if is_windows():
         return ['C:/mingw/lib'] # Fixme
     if is_osx():
@@ -184,7 +193,7 @@ def get_library_dirs():
     # than /usr/lib. If you feel that this search order is
     # problematic, please raise the issue on the mailing list.
     unixdirs = ['/usr/local/lib', '/usr/lib', '/lib']
-    plat = subprocess.check_output(['uname', '-m']).decode().strip()
+    plat = platform.machine()
     # This is a terrible hack. I admit it and I'm really sorry.
     # I just don't know what the correct solution is.
     if plat == 'i686':
@@ -197,27 +206,162 @@ def get_library_dirs():
     unixdirs += glob('/lib/' + plat + '*')
     if os.path.exists('/lib64'):
         unixdirs.append('/lib64')
-    unixdirs += glob('/lib/' + plat + '*')
-    return unixdirs
+    result = []
+    for d in unixdirs:
+        if d not in result:
+            result.append(d)
+    return result
 
+class DirectoryIndex():
+    """Remembers which files exist in directories so that looking for
+    a file in a large directory does not need a system call per
+    candidate name. Each directory is listed at most once per run. If
+    a cache file is given, the listings are stored in it and reused by
+    later runs for as long as the directory's mtime stays the same.
+    Symlinks are checked again in every run because their targets can
+    change without the directory changing."""
+
+    def __init__(self, cachefile=None):
+        self.cachefile = cachefile
+        self.dirs = {}
+        self.files = {}
+        self.dirty = False
+        if cachefile is not None:
+            try:
+                with open(cachefile, 'rb') as f:
+                    self.dirs = pickle.load(f)
+            except Exception:
+                self.dirs = {}
+
+    def __getstate__(self):
+        # The index is pickled into the build data along with the
+        # environment. The listings belong in the cache file only.
+        return {'cachefile': self.cachefile}
+
+    def __setstate__(self, state):
+        self.__init__(state['cachefile'])
+
+    def get_files(self, dirname):
+        """Returns the set of names of regular files (or symlinks to
+        them) in dirname. A missing directory has no files."""
+        if dirname in self.files:
+            return self.files[dirname]
+        try:
+            mtime = os.stat(dirname).st_mtime_ns
+        except OSError:
+            self.files[dirname] = frozenset()
+            return self.files[dirname]
+        cached = self.dirs.get(dirname)
+        if cached is None or len(cached) != 3 or cached[0] != mtime:
+            (regular, links) = list_files(dirname)
+            cached = (mtime, frozenset(regular), frozenset(links))
+            self.dirs[dirname] = cached
+            self.dirty = True
+        (_, regular, links) = cached
+        files = regular | frozenset([l for l in links if os.path.isfile(os.path.join(dirname, l))])
+        self.files[dirname] = files
+        return files
+
+    def has_file(self, dirname, fname):
+        return fname in self.get_files(dirname)
+
+    def glob(self, dirname, pattern):
+        """Returns the full paths of the files in dirname matching a
+        shell pattern, like glob.glob(os.path.join(dirname, pattern)).
+        As with glob, hidden files only match patterns starting with
+        a dot."""
+        names = self.get_files(dirname)
+        if not pattern.startswith('.'):
+            names = [n for n in names if not n.startswith('.')]
+        return [os.path.join(dirname, f) for f in sorted(fnmatch.filter(names, pattern))]
+
+    def save(self):
+        if self.cachefile is None or not self.dirty:
+            return
+        with open(self.cachefile, 'wb') as f:
+            pickle.dump(self.dirs, f)
+        self.dirty = False
+
+class ProgramIndex():
+    """Looks up executables in PATH using a DirectoryIndex, so each PATH
+    entry is listed once per run no matter how many programs are looked
+    for. Results are remembered for the lifetime of the index."""
+
+    def __init__(self, dir_index):
+        self.dir_index = dir_index
+        self.found = {}
+
+    def which(self, name):
+        # Windows has PATHEXT and case insensitive names to deal with,
+        # leave those to the standard library.
+        if is_windows() or os.path.dirname(name) != '':
+            return shutil.which(name)
+        path = os.environ.get('PATH', os.defpath)
+        key = (name, path)
+        if key in self.found:
+            return self.found[key]
+        result = None
+        for d in path.split(os.pathsep):
+            if d == '':
+                d = os.curdir
+            if self.dir_index.has_file(d, name):
+                fullpath = os.path.join(d, name)
+                if os.access(fullpath, os.X_OK):
+                    result = fullpath
+                    break
+        self.found[key] = result
+        return result
+
+program_index = ProgramIndex(DirectoryIndex())
+
+def which(name):
+    """Like shutil.which() but answered from the current program index."""
+    return program_index.which(name)
+
+def set_program_index(index):
+    global program_index
+    program_index = index
+
+def list_files(dirname):
+    """Returns a tuple of the names of the regular files and the
+    names of the symlinks in dirname."""
+    regular = []
+    links = []
+    if hasattr(os, 'scandir'):
+        try:
+            for e in os.scandir(dirname):
+                if e.is_symlink():
+                    links.append(e.name)
+                elif e.is_file():
+                    regular.append(e.name)
+        except OSError:
+            pass
+        return (regular, links)
+    try:
+        names = os.listdir(dirname)
+    except OSError:
+        return (regular, links)
+    for n in names:
+        fullname = os.path.join(dirname, n)
+        if os.path.islink(fullname):
+            links.append(n)
+        elif os.path.isfile(fullname):
+            regular.append(n)
+    return (regular, links)
+
+
+def get_replacement(varname, confdata):
+    if varname not in confdata.values:
+        return ''
+    var = confdata.values[varname]
+    if isinstance(var, str):
+        return var
+    elif isinstance(var, int):
+        return str(var)
+    raise RuntimeError('Tried to replace a variable with something other than a string or int.')
 
 def do_replacement(regex, line, confdata):
-    match = re.search(regex, line)
-    while match:
-        varname = match.group(1)
-        if varname in confdata.keys():
-            var = confdata.get(varname)
-            if isinstance(var, str):
-                pass
-            elif isinstance(var, int):
-                var = str(var)
-            else:
-                raise RuntimeError('Tried to replace a variable with something other than a string or int.')
-        else:
-            var = ''
-        line = line.replace('@' + varname + '@', var)
-        match = re.search(regex, line)
-    return line
+    return regex.sub(lambda match: get_replacement(match.group(1), confdata), line)
 
 def do_mesondefine(line, confdata):
     arr = line.split()
@@ -240,28 +384,56 @@ def do_mesondefine(line, confdata):
     else:
         raise MesonException('#mesondefine argument "%s" is of unknown type.' % varname)
 
-
-def do_conf_file(src, dst, confdata):
-    data = open(src).readlines()
-    regex = re.compile('@(.*?)@')
-    result = []
-    for line in data:
-        if line.startswith('#mesondefine'):
-            line = do_mesondefine(line, confdata)
-        else:
-            line = do_replacement(regex, line, confdata)
-        result.append(line)
+def get_conf_file_stamp(src, dst, confdata):
+    """Returns a string that changes whenever the output of
+    do_conf_file(src, dst, confdata) could change, or None if
+    the output file does not exist."""
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        return None
+    src_st = os.stat(src)
+    values = sorted((k, type(v).__name__, v) for (k, v) in confdata.values.items())
+    h = hashlib.sha1()
+    h.update(repr((src, src_st.st_size, src_st.st_mtime_ns, src_st.st_mode,
+                  dst_st.st_size, dst_st.st_mtime_ns)).encode())
+    h.update(repr(values).encode())
+    return h.hexdigest()
+
+conf_regex = re.compile('@(.*?)@')
+
+def do_conf_file(src, dst, confdata, stampfile=None):
+    """Writes src to dst substituting @VAR@ strings and #mesondefine lines
+    with values from confdata. If stampfile is given, the file is not
+    regenerated when neither the input file nor confdata have changed
+    since the previous call."""
+    if stampfile is not None:
+        stamp = get_conf_file_stamp(src, dst, confdata)
+        try:
+            if stamp is not None and open(stampfile).read() == stamp:
+                return
+        except FileNotFoundError:
+            pass
     dst_tmp = dst + '~'
-    open(dst_tmp, 'w').writelines(result)
+    with open(src) as ifile, open(dst_tmp, 'w') as ofile:
+        for line in ifile:
+            if line.startswith('#mesondefine'):
+                line = do_mesondefine(line, confdata)
+            elif '@' in line:
+                line = do_replacement(conf_regex, line, confdata)
+            ofile.write(line)
     shutil.copymode(src, dst_tmp)
     replace_if_different(dst, dst_tmp)
+    if stampfile is not None:
+        os.makedirs(os.path.dirname(stampfile), exist_ok=True)
+        open(stampfile, 'w').write(get_conf_file_stamp(src, dst, confdata))
 
 
 def replace_if_different(dst, dst_tmp):
     # If contents are identical, don't touch the file to prevent
     # unnecessary rebuilds.
     try:
-        if open(dst, 'r').read() == open(dst_tmp, 'r').read():
+        if filecmp.cmp(dst, dst_tmp, shallow=False):
             os.unlink(dst_tmp)
             return
     except FileNotFoundError:
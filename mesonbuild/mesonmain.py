@@ -17,12 +17,13 @@
 import sys, stat, traceback, pickle, argparse
 import datetime
 import os.path
-from . import environment, interpreter, mesonlib
+from . import environment, interpreter, mesonlib, dependencies
 from . import build
+from .wrap import wrap
 import platform
-from . import mlog, coredata
+from . import mlog, mprofile, coredata
 
-from .coredata import MesonException, build_types, layouts, warning_levels, libtypelist
+from .coredata import MesonException, build_types, layouts, warning_levels, libtypelist, unity_groupings, linkers, lto_modes
 
 backendlist = ['ninja', 'vs2010', 'xcode']
 
@@ -59,8 +60,26 @@ parser.add_argument('--enable-gcov', action='store_true', dest='coverage', defau
                     help='measure test coverage')
 parser.add_argument('--disable-pch', action='store_false', dest='use_pch', default=True,\
                     help='do not use precompiled headers')
+parser.add_argument('--auto-pch', action='store_true', dest='auto_pch', default=False,\
+                    help='generate precompiled headers from the #include <...> lines at the top of most sources')
 parser.add_argument('--unity', action='store_true', dest='unity', default=False,\
                     help='unity build')
+parser.add_argument('--unity-size', default=0, type=int, dest='unity_size',\
+                    help='maximum number of sources in one unity file, 0 means no limit (default: %(default)s)')
+parser.add_argument('--unity-grouping', choices=unity_groupings, dest='unity_grouping', default='files',\
+                    help='split unity blocks by file count or by compile times measured in builds before the last regeneration (default: %(default)s)')
+parser.add_argument('--linker', choices=linkers, dest='linker', default='default',\
+                    help='linker to use with GCC and Clang (default: %(default)s)')
+parser.add_argument('--split-dwarf', action='store_true', dest='split_dwarf', default=False,\
+                    help='keep debug info in separate .dwo files instead of passing it through the linker')
+parser.add_argument('--gdb-index', action='store_true', dest='gdb_index', default=False,\
+                    help='add a gdb index to linked binaries, needs the gold or lld linker')
+parser.add_argument('--lto', choices=lto_modes, dest='lto', default='none',\
+                    help='link time optimisation with GCC and Clang, thin is ThinLTO with Clang (default: %(default)s)')
+parser.add_argument('--lto-jobs', default=0, type=int, dest='lto_jobs',\
+                    help='number of parallel link time optimisation jobs, 0 means automatic (default: %(default)s)')
+parser.add_argument('--thin-archives', action='store_true', dest='thin_archives', default=False,\
+                    help='create static libraries that are not installed as thin archives')
 parser.add_argument('--werror', action='store_true', dest='werror', default=False,\
                     help='Treat warnings as errors')
 parser.add_argument('--layout', choices=layouts, dest='layout', default='mirror',\
@@ -73,6 +92,16 @@ parser.add_argument('--cross-file', default=None, dest='cross_file',
                     help='file describing cross compilation environment')
 parser.add_argument('-D', action='append', dest='projectoptions', default=[],
                     help='Set project options.')
+parser.add_argument('--log-level', choices=sorted(mlog.log_levels.keys()), dest='log_level', default='debug',
+                    help='amount of information written to the log file')
+parser.add_argument('--log-compress', action='store_true', dest='log_compress', default=False,
+                    help='write the log gzip compressed to meson-log.txt.gz')
+parser.add_argument('--log-max-size', default=0, type=int, dest='log_max_size',
+                    help='maximum size of debug output in the log in thousands of characters (0 for unlimited)')
+parser.add_argument('--prefetch-wraps', action='store_true', dest='prefetch_wraps', default=False,
+                    help='download and extract all subproject wraps in parallel before configuring')
+parser.add_argument('--profile-self', action='store_true', dest='profile', default=False,
+                    help='write a timing profile of this Meson run to the log directory and print the slowest calls')
 parser.add_argument('-v', '--version', action='store_true', dest='print_version', default=False,
                     help='Print version.')
 parser.add_argument('directories', nargs='*')
@@ -131,8 +160,11 @@ itself as required.'''
         return (src_dir, build_dir)
 
     def generate(self):
+        if self.options.profile:
+            mprofile.initialize()
         env = environment.Environment(self.source_dir, self.build_dir, self.meson_script_file, self.options, self.original_cmd_line_args)
-        mlog.initialize(env.get_log_dir())
+        mlog.initialize(env.get_log_dir(), self.options.log_level, self.options.log_compress,
+                        self.options.log_max_size * 1000)
         mlog.debug('Build started at', datetime.datetime.now().isoformat())
         mlog.debug('Python binary:', sys.executable)
         mlog.debug('Python system:', platform.system())
@@ -144,6 +176,8 @@ itself as required.'''
             mlog.log('Build type:', mlog.bold('cross build'))
         else:
             mlog.log('Build type:', mlog.bold('native build'))
+        if env.coredata.get_builtin_option('lto') != 'none' and env.coredata.get_builtin_option('coverage'):
+            mlog.log(mlog.bold('Warning:'), 'Link time optimisation is disabled in coverage builds.')
         b = build.Build(env)
         if self.options.backend == 'ninja':
             from .backend import ninjabackend
@@ -157,6 +191,8 @@ itself as required.'''
         else:
             raise RuntimeError('Unknown backend "%s".' % self.options.backend)
 
+        if self.options.prefetch_wraps:
+            self.prefetch_wraps()
         intr = interpreter.Interpreter(b, g)
         if env.is_cross_build():
             mlog.log('Host machine cpu family:', mlog.bold(intr.builtin['host_machine'].cpu_family_method([], {})))
@@ -165,11 +201,37 @@ itself as required.'''
             mlog.log('Target machine cpu:', mlog.bold(intr.builtin['target_machine'].cpu_method([], {})))
         mlog.log('Build machine cpu family:', mlog.bold(intr.builtin['build_machine'].cpu_family_method([], {})))
         mlog.log('Build machine cpu:', mlog.bold(intr.builtin['build_machine'].cpu_method([], {})))
-        intr.run()
-        env.dump_coredata()
-        g.generate(intr)
-        dumpfile = os.path.join(env.get_scratch_dir(), 'build.dat')
-        pickle.dump(b, open(dumpfile, 'wb'))
+        try:
+            with mprofile.span('interpreter', 'Interpreting build files'):
+                intr.run()
+            env.dump_coredata()
+            dependencies.save_detection_cache()
+            with mprofile.span('backend', 'Generating %s backend' % self.options.backend):
+                g.generate(intr)
+            dumpfile = os.path.join(env.get_scratch_dir(), 'build.dat')
+            pickle.dump(b, open(dumpfile, 'wb'))
+        finally:
+            if mprofile.enabled:
+                self.write_profile(env.get_log_dir())
+
+    def prefetch_wraps(self):
+        # Only the default subproject dir can be known before
+        # the build files have been interpreted.
+        resolver = wrap.Resolver(os.path.join(self.source_dir, 'subprojects'))
+        with mprofile.span('wrap', 'Prefetching wraps'):
+            failures = resolver.prefetch()
+        for (name, msg) in failures:
+            mlog.log(mlog.red('Warning:'), 'could not prefetch subproject', mlog.bold(name) + ':', msg)
+
+    def write_profile(self, logdir):
+        # The summary goes to the console on purpose. It is what the
+        # user asked for with --profile-self, while the full trace is
+        # only useful in a trace viewer.
+        fname = mprofile.write_trace(logdir)
+        mlog.log('Profile written to', mlog.bold(fname))
+        mlog.log('\nSlowest calls:')
+        for (duration, category, name) in mprofile.get_slowest(25, ('interpreter', 'statement')):
+            mlog.log('%8.3f s  %-12s %s' % (duration, category, name))
 
 def run_script_command(args):
     cmdname = args[0]
@@ -201,6 +263,12 @@ def run_script_command(args):
     elif cmdname == 'regencheck':
         import mesonbuild.scripts.regen_checker as abc
         cmdfunc = abc.run
+    elif cmdname == 'javacompile':
+        import mesonbuild.scripts.javacompile as abc
+        cmdfunc = abc.run
+    elif cmdname == 'resourcedeps':
+        import mesonbuild.scripts.resourcedeps as abc
+        cmdfunc = abc.run
     elif cmdname == 'symbolextractor':
         import mesonbuild.scripts.symbolextractor as abc
         cmdfunc = abc.run
@@ -272,5 +340,9 @@ def run(mainfile, args):
             mlog.log(e)
         else:
             traceback.print_exc()
+        if mlog.get_log_path() is not None:
+            mlog.log('\nA full log can be found at', mlog.bold(mlog.get_log_path()))
         return 1
+    finally:
+        mlog.shutdown()
     return 0
@@ -12,25 +12,72 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys, os, platform
+import sys, os, platform, gzip
 
 """This is (mostly) a standalone module used to write logging
 information about Meson runs. Some output goes to screen,
-some to logging dir and some goes to both."""
+some to logging dir and some goes to both.
+
+Messages written with debug() only go to the log file and are dropped
+entirely when the log level is above DEBUG. Arguments may be callables
+taking no arguments, in which case they are only called if the message
+is actually written. This way expensive strings such as long command
+lines are never built unless somebody is going to read them."""
+
+DEBUG = 10
+INFO = 20
+
+log_levels = {'debug': DEBUG, 'info': INFO}
 
 colorize_console = platform.system().lower() != 'windows' and os.isatty(sys.stdout.fileno())
 log_dir = None
 log_file = None
-
-def initialize(logdir):
-    global log_dir, log_file
+log_fname = None
+log_level = DEBUG
+# Maximum number of characters of debug output written to the log
+# file, or 0 for no limit. Messages written with log() are not capped.
+debug_limit = 0
+debug_written = 0
+debug_truncated = False
+
+log_buffer_size = 64 * 1024
+
+def initialize(logdir, level='debug', compress=False, max_debug_size=0):
+    global log_dir, log_file, log_fname, log_level, debug_limit, debug_written, debug_truncated
+    shutdown()
     log_dir = logdir
-    log_file = open(os.path.join(logdir, 'meson-log.txt'), 'w')
+    log_level = log_levels[level]
+    debug_limit = max_debug_size
+    debug_written = 0
+    debug_truncated = False
+    fname = os.path.join(logdir, 'meson-log.txt')
+    # Remove the log of the previous run so it is not mistaken for this one.
+    for f in (fname, fname + '.gz'):
+        if os.path.exists(f):
+            os.unlink(f)
+    if compress:
+        log_fname = fname + '.gz'
+        log_file = gzip.open(log_fname, 'wt', compresslevel=1)
+    else:
+        log_fname = fname
+        log_file = open(fname, 'w', buffering=log_buffer_size)
 
 def shutdown():
     global log_file
     if log_file is not None:
         log_file.close()
+        log_file = None
+
+def get_log_path():
+    '''The file the log is written to, which depends on compression.'''
+    return log_fname
+
+def flush():
+    if log_file is not None:
+        log_file.flush()
+
+def is_debug_enabled():
+    return log_file is not None and log_level <= DEBUG and not debug_truncated
 
 class AnsiDecorator():
     plain_code = "\033[0m"
@@ -59,6 +106,8 @@ def cyan(text):
 def process_markup(args, keep):
     arr = []
     for arg in args:
+        if callable(arg):
+            arg = arg()
         if isinstance(arg, str):
             arr.append(arg)
         elif isinstance(arg, AnsiDecorator):
@@ -68,9 +117,17 @@ def process_markup(args, keep):
     return arr
 
 def debug(*args, **kwargs):
+    global debug_written, debug_truncated
+    if not is_debug_enabled():
+        return
     arr = process_markup(args, False)
-    if log_file is not None:
-        print(*arr, file=log_file, **kwargs) # Log file never gets ANSI codes.
+    if debug_limit > 0:
+        debug_written += sum(len(x) for x in arr) + len(arr)
+        if debug_written > debug_limit:
+            debug_truncated = True
+            print('[Debug output truncated after %d characters.]' % debug_limit, file=log_file)
+            return
+    print(*arr, file=log_file, **kwargs) # Log file never gets ANSI codes.
 
 def log(*args, **kwargs):
     arr = process_markup(args, False)
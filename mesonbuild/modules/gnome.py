@@ -26,14 +26,17 @@ girwarning_printed = False
 class GnomeModule:
 
     def compile_resources(self, state, args, kwargs):
-        cmd = ['glib-compile-resources', '@INPUT@']
+        # The files listed in the resource description are only
+        # discovered at build time and recorded in a depfile, so
+        # editing them does not require a reconfigure.
+        cmd = [sys.executable, state.environment.get_build_command(),
+               '--internal', 'resourcedeps', 'gresource', '@INPUT@', '@OUTPUT@', '@DEPFILE@',
+               'glib-compile-resources', '@INPUT@']
 
         source_dirs = kwargs.pop('source_dir', [])
         if not isinstance(source_dirs, list):
             source_dirs = [source_dirs]
 
-        kwargs['depend_files'] = self.get_gresource_dependencies(state, args[1], source_dirs)
-
         for source_dir in source_dirs:
             sourcedir = os.path.join(state.build_to_src, state.subdir, source_dir)
             cmd += ['--sourcedir', sourcedir]
@@ -45,28 +48,13 @@ class GnomeModule:
         kwargs['command'] = cmd
         kwargs['input'] = args[1]
         kwargs['output'] = args[0] + '.c'
+        kwargs['depfile'] = args[0] + '.c.d'
         target_c = build.CustomTarget(args[0] + '_c', state.subdir, kwargs)
         kwargs['output'] = args[0] + '.h'
+        kwargs['depfile'] = args[0] + '.h.d'
         target_h = build.CustomTarget(args[0] + '_h', state.subdir, kwargs)
         return [target_c, target_h]
 
-    def get_gresource_dependencies(self, state, input_file, source_dirs):
-        cmd = ['glib-compile-resources',
-               os.path.join(state.subdir, input_file),
-               '--generate-dependencies']
-
-        for source_dir in source_dirs:
-            cmd += ['--sourcedir', os.path.join(state.subdir, source_dir)]
-
-        pc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True,
-                              cwd=state.environment.get_source_dir())
-        (stdout, _) = pc.communicate()
-        if pc.returncode != 0:
-            mlog.log(mlog.bold('Warning:'), 'glib-compile-resources has failed to get the dependencies for {}'.format(cmd[1]))
-            raise subprocess.CalledProcessError(pc.returncode, cmd)
-
-        return stdout.split('\n')[:-1]
-
     def generate_gir(self, state, args, kwargs):
         if len(args) != 1:
             raise MesonException('Gir takes one argument')
@@ -306,8 +294,6 @@ class GnomeModule:
         return build.CustomTarget(namebase + '-gdbus', state.subdir, custom_kwargs)
 
 def initialize():
-    mlog.log('Warning, glib compiled dependencies will not work reliably until this upstream issue is fixed:',
-             mlog.bold('https://bugzilla.gnome.org/show_bug.cgi?id=745754'))
     return GnomeModule()
 
 class GirTarget(build.CustomTarget):
@@ -13,10 +13,9 @@
 # limitations under the License.
 
 from .. import dependencies, mlog
-import os, subprocess
+import os, sys, subprocess
 from .. import build
 from ..coredata import MesonException
-import xml.etree.ElementTree as ET
 
 class Qt5Module():
 
@@ -88,23 +87,6 @@ class Qt5Module():
         else:
             mlog.log(' rcc:', mlog.red('NO'))
 
-    def parse_qrc(self, state, fname):
-        abspath = os.path.join(state.environment.source_dir, state.subdir, fname)
-        relative_part = os.path.split(fname)[0]
-        try:
-            tree = ET.parse(abspath)
-            root = tree.getroot()
-            result = []
-            for child in root[0]:
-                if child.tag != 'file':
-                    mlog.log("Warning, malformed rcc file: ", os.path.join(state.subdir, fname))
-                    break
-                else:
-                    result.append(os.path.join(state.subdir, relative_part, child.text))
-            return result
-        except Exception:
-            return []
-
     def preprocess(self, state, args, kwargs):
         rcc_files = kwargs.pop('qresources', [])
         if not isinstance(rcc_files, list):
@@ -123,14 +105,18 @@ class Qt5Module():
             srctmp = [srctmp]
         sources = args[1:] + srctmp
         if len(rcc_files) > 0:
+            # The files listed in the .qrc are discovered when rcc runs
+            # and recorded in a depfile, see scripts/resourcedeps.py.
+            rcc_wrapper = dependencies.ExternalProgram('resourcedeps', silent=True,
+                                                       fullpath=[sys.executable,
+                                                                 state.environment.get_build_command(),
+                                                                 '--internal', 'resourcedeps'])
             rcc_kwargs = {'output' : '@BASENAME@.cpp',
-                          'arguments' : ['@INPUT@', '-o', '@OUTPUT@']}
-            rcc_gen = build.Generator([self.rcc], rcc_kwargs)
+                          'depfile' : '@BASENAME@.cpp.d',
+                          'arguments' : ['qrc', '@INPUT@', '@OUTPUT@', '@DEPFILE@'] +
+                                        self.rcc.get_command() + ['@INPUT@', '-o', '@OUTPUT@']}
+            rcc_gen = build.Generator([rcc_wrapper], rcc_kwargs)
             rcc_output = build.GeneratedList(rcc_gen)
-            qrc_deps = []
-            for i in rcc_files:
-                qrc_deps += self.parse_qrc(state, i)
-            rcc_output.extra_depends = qrc_deps
             [rcc_output.add_file(os.path.join(state.subdir, a)) for a in rcc_files]
             sources.append(rcc_output)
         if len(ui_files) > 0:
@@ -157,6 +143,4 @@ class Qt5Module():
         return sources
 
 def initialize():
-    mlog.log('Warning, rcc dependencies will not work reliably until this upstream issue is fixed:',
-             mlog.bold('https://bugreports.qt.io/browse/QTBUG-45460'))
     return Qt5Module()
@@ -0,0 +1,83 @@
+# Copyright 2016 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A standalone module that records how long the different parts of
+a Meson run take. The result is written in the Chrome trace event
+format, which can be loaded into chrome://tracing or any other
+compatible viewer."""
+
+import os, json, time
+
+enabled = False
+start_time = None
+events = []
+
+def initialize():
+    global enabled, start_time
+    enabled = True
+    start_time = time.perf_counter()
+
+class Span():
+    def __init__(self, category, name, args):
+        self.category = category
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        event = {'name': self.name,
+                 'cat': self.category,
+                 'ph': 'X',
+                 'pid': os.getpid(),
+                 'tid': 0,
+                 'ts': (self.start - start_time) * 1000000,
+                 'dur': (end - self.start) * 1000000,
+                }
+        if self.args:
+            event['args'] = self.args
+        events.append(event)
+
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+null_span = NullSpan()
+
+def span(category, name, **args):
+    """Returns a context manager that records the time spent inside it.
+    When profiling is disabled this costs next to nothing."""
+    if not enabled:
+        return null_span
+    return Span(category, name, args)
+
+def write_trace(logdir):
+    fname = os.path.join(logdir, 'meson-profile.json')
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return fname
+
+def get_slowest(count, exclude_categories=()):
+    """Returns the count slowest spans as (duration in seconds, category,
+    name) tuples, longest first."""
+    spans = [(e['dur'] / 1000000, e['cat'], e['name']) for e in events
+             if e['cat'] not in exclude_categories]
+    spans.sort(key=lambda x: x[0], reverse=True)
+    return spans[:count]
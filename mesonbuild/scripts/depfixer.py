@@ -15,13 +15,22 @@
 # limitations under the License.
 
 
-import sys, struct
+import sys, os, struct, mmap
 
 SHT_STRTAB = 3
+SHT_DYNSYM = 11
+SHT_GNU_verdef = 0x6ffffffd
+SHT_GNU_versym = 0x6fffffff
+SHN_UNDEF = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STB_GNU_UNIQUE = 10
 DT_NEEDED = 1
 DT_RPATH = 15
 DT_STRTAB = 5
 DT_SONAME = 14
+VER_FLG_BASE = 1
+VERSYM_HIDDEN = 0x8000
 
 class DataSizes():
     def __init__(self, ptrsize, is_le):
@@ -29,6 +38,7 @@ class DataSizes():
             p = '<'
         else:
             p = '>'
+        self.endian = p
         self.Half = p+'h'
         self.HalfSize = 2
         self.Word = p+'I'
@@ -51,153 +61,161 @@ class DataSizes():
             self.OffSize = 4
 
 class DynamicEntry(DataSizes):
-    def __init__(self, ifile, ptrsize, is_le):
+    def __init__(self, data, offset, ptrsize, is_le):
         super().__init__(ptrsize, is_le)
         self.ptrsize = ptrsize
+        self.offset = offset
         if ptrsize == 64:
-            self.d_tag = struct.unpack(self.Sxword, ifile.read(self.SxwordSize))[0];
-            self.val = struct.unpack(self.XWord, ifile.read(self.XWordSize))[0];
+            (self.d_tag, self.val) = struct.unpack_from(self.endian + 'qQ', data, offset)
+            self.size = self.SxwordSize + self.XWordSize
         else:
-            self.d_tag = struct.unpack(self.Sword, ifile.read(self.SwordSize))[0]
-            self.val = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
+            (self.d_tag, self.val) = struct.unpack_from(self.endian + 'iI', data, offset)
+            self.size = self.SwordSize + self.WordSize
 
-    def write(self, ofile):
+    def write(self, data, offset):
         if self.ptrsize == 64:
-            ofile.write(struct.pack(self.Sxword, self.d_tag))
-            ofile.write(struct.pack(self.XWord, self.val))
+            struct.pack_into(self.endian + 'qQ', data, offset, self.d_tag, self.val)
         else:
-            ofile.write(struct.pack(self.Sword, self.d_tag))
-            ofile.write(struct.pack(self.Word, self.val))
+            struct.pack_into(self.endian + 'iI', data, offset, self.d_tag, self.val)
 
 class SectionHeader(DataSizes):
-    def __init__(self, ifile, ptrsize, is_le):
+    def __init__(self, data, offset, ptrsize, is_le):
         super().__init__(ptrsize, is_le)
+        p = self.endian
         if ptrsize == 64:
-            is_64 = True
+            fmt = p + 'IIQQQQIIQQ'
         else:
-            is_64 = False
-#Elf64_Word
-        self.sh_name = struct.unpack(self.Word, ifile.read(self.WordSize))[0];
-#Elf64_Word
-        self.sh_type = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
-#Elf64_Xword
-        if is_64:
-            self.sh_flags = struct.unpack(self.XWord, ifile.read(self.XWordSize))[0]
-        else:
-            self.sh_flags = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
-#Elf64_Addr
-        self.sh_addr = struct.unpack(self.Addr, ifile.read(self.AddrSize))[0];
-#Elf64_Off
-        self.sh_offset = struct.unpack(self.Off, ifile.read(self.OffSize))[0]
-#Elf64_Xword
-        if is_64:
-            self.sh_size = struct.unpack(self.XWord, ifile.read(self.XWordSize))[0]
-        else:
-            self.sh_size = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
-#Elf64_Word
-        self.sh_link = struct.unpack(self.Word, ifile.read(self.WordSize))[0];
-#Elf64_Word
-        self.sh_info = struct.unpack(self.Word, ifile.read(self.WordSize))[0];
-#Elf64_Xword
-        if is_64:
-            self.sh_addralign = struct.unpack(self.XWord, ifile.read(self.XWordSize))[0]
-        else:
-            self.sh_addralign = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
-#Elf64_Xword
-        if is_64:
-            self.sh_entsize = struct.unpack(self.XWord, ifile.read(self.XWordSize))[0]
+            fmt = p + 'IIIIIIIIII'
+        (self.sh_name, self.sh_type, self.sh_flags, self.sh_addr,
+         self.sh_offset, self.sh_size, self.sh_link, self.sh_info,
+         self.sh_addralign, self.sh_entsize) = struct.unpack_from(fmt, data, offset)
+
+class Symbol(DataSizes):
+    def __init__(self, data, offset, ptrsize, is_le):
+        super().__init__(ptrsize, is_le)
+        if ptrsize == 64:
+            (self.st_name, self.st_info, self.st_other, self.st_shndx,
+             self.st_value, self.st_size) = struct.unpack_from(self.endian + 'IBBHQQ', data, offset)
         else:
-            self.sh_entsize = struct.unpack(self.Word, ifile.read(self.WordSize))[0]
+            (self.st_name, self.st_value, self.st_size, self.st_info,
+             self.st_other, self.st_shndx) = struct.unpack_from(self.endian + 'IIIBBH', data, offset)
+        self.binding = self.st_info >> 4
+        self.type = self.st_info & 0xf
+
+class NotElfError(Exception):
+    pass
+
+class ElfFormatError(RuntimeError):
+    pass
 
 class Elf(DataSizes):
-    def __init__(self, bfile):
+    def __init__(self, bfile, readonly=False):
         self.bfile = bfile
-        self.bf = open(bfile, 'r+b')
-        (self.ptrsize, self.is_le) = self.detect_elf_type()
-        super().__init__(self.ptrsize, self.is_le)
-        self.parse_header()
-        self.parse_sections()
-        self.parse_dynamic()
+        if readonly:
+            self.bf = open(bfile, 'rb')
+            access = mmap.ACCESS_READ
+        else:
+            self.bf = open(bfile, 'r+b')
+            access = mmap.ACCESS_WRITE
+        try:
+            # mmap refuses to map empty files, which are
+            # the stamp files of some languages.
+            if os.fstat(self.bf.fileno()).st_size < 16:
+                raise NotElfError('File "%s" is not an ELF file.' % bfile)
+            self.data = mmap.mmap(self.bf.fileno(), 0, access=access)
+            (self.ptrsize, self.is_le) = self.detect_elf_type()
+            super().__init__(self.ptrsize, self.is_le)
+            self.parse_header()
+            self.parse_sections()
+            self.parse_dynamic()
+        except struct.error as e:
+            self.close()
+            raise ElfFormatError('File "%s" is truncated: %s' % (bfile, str(e)))
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if hasattr(self, 'data'):
+            self.data.close()
+        self.bf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def detect_elf_type(self):
-        data = self.bf.read(6)
+        data = self.data[0:6]
         if data[1:4] != b'ELF':
             # This script gets called to non-elf targets too
             # so just ignore them.
-            print('File "%s" is not an ELF file.' % self.bfile)
-            sys.exit(0)
+            raise NotElfError('File "%s" is not an ELF file.' % self.bfile)
         if data[4] == 1:
             ptrsize = 32
         elif data[4] == 2:
             ptrsize = 64
         else:
-            print('File "%s" has unknown ELF class.' % self.bfile)
-            sys.exit(1)
+            raise ElfFormatError('File "%s" has unknown ELF class.' % self.bfile)
         if data[5] == 1:
             is_le = True
         elif data[5] == 2:
             is_le = False
         else:
-            print('File "%s" has unknown ELF endianness.' % self.bfile)
-            sys.exit(1)
+            raise ElfFormatError('File "%s" has unknown ELF endianness.' % self.bfile)
         return (ptrsize, is_le)
 
     def parse_header(self):
-        self.bf.seek(0)
-        self.e_ident = struct.unpack('16s', self.bf.read(16))[0]
-        self.e_type = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_machine = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_version = struct.unpack(self.Word, self.bf.read(self.WordSize))[0]
-        self.e_entry = struct.unpack(self.Addr, self.bf.read(self.AddrSize))[0]
-        self.e_phoff = struct.unpack(self.Off, self.bf.read(self.OffSize))[0]
-        self.e_shoff = struct.unpack(self.Off, self.bf.read(self.OffSize))[0]
-        self.e_flags = struct.unpack(self.Word, self.bf.read(self.WordSize))[0]
-        self.e_ehsize = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_phentsize = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_phnum = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_shentsize = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_shnum = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
-        self.e_shstrndx = struct.unpack(self.Half, self.bf.read(self.HalfSize))[0]
+        p = self.endian
+        if self.ptrsize == 64:
+            fmt = p + '16sHHIQQQIHHHHHH'
+        else:
+            fmt = p + '16sHHIIIIIHHHHHH'
+        (self.e_ident, self.e_type, self.e_machine, self.e_version,
+         self.e_entry, self.e_phoff, self.e_shoff, self.e_flags,
+         self.e_ehsize, self.e_phentsize, self.e_phnum,
+         self.e_shentsize, self.e_shnum, self.e_shstrndx) = struct.unpack_from(fmt, self.data, 0)
 
     def parse_sections(self):
-        self.bf.seek(self.e_shoff)
         self.sections = []
         for i in range(self.e_shnum):
-            self.sections.append(SectionHeader(self.bf, self.ptrsize, self.is_le))
-
-    def read_str(self):
-        arr = []
-        x = self.bf.read(1)
-        while x != b'\0':
-            arr.append(x)
-            x = self.bf.read(1)
-            if x == b'':
-                raise RuntimeError('Tried to read past the end of the file')
-        return b''.join(arr)
+            offset = self.e_shoff + i * self.e_shentsize
+            self.sections.append(SectionHeader(self.data, offset, self.ptrsize, self.is_le))
+
+    def read_str(self, offset):
+        end = self.data.find(b'\0', offset)
+        if end < 0:
+            raise ElfFormatError('Tried to read past the end of the file')
+        return self.data[offset:end]
 
     def find_section(self, target_name):
+        if len(self.sections) == 0:
+            return None
         section_names = self.sections[self.e_shstrndx]
         for i in self.sections:
-            self.bf.seek(section_names.sh_offset + i.sh_name)
-            name = self.read_str()
+            name = self.read_str(section_names.sh_offset + i.sh_name)
             if name == target_name:
                 return i
 
     def parse_dynamic(self):
         sec = self.find_section(b'.dynamic')
         self.dynamic = []
-        self.bf.seek(sec.sh_offset)
-        while True:
-            e = DynamicEntry(self.bf, self.ptrsize, self.is_le)
+        if sec is None:
+            return
+        offset = sec.sh_offset
+        end = sec.sh_offset + sec.sh_size
+        while offset < end:
+            e = DynamicEntry(self.data, offset, self.ptrsize, self.is_le)
             self.dynamic.append(e)
             if e.d_tag == 0:
                 break
+            offset += e.size
 
     def print_section_names(self):
         section_names = self.sections[self.e_shstrndx]
         for i in self.sections:
-            self.bf.seek(section_names.sh_offset + i.sh_name)
-            name = self.read_str()
+            name = self.read_str(section_names.sh_offset + i.sh_name)
             print(name.decode())
 
     def print_soname(self):
@@ -208,8 +226,77 @@ class Elf(DataSizes):
                 soname = i
             if i.d_tag == DT_STRTAB:
                 strtab = i
-        self.bf.seek(strtab.val + soname.val)
-        print(self.read_str())
+        print(self.read_str(strtab.val + soname.val))
+
+    def get_soname(self):
+        sec = self.find_section(b'.dynstr')
+        for i in self.dynamic:
+            if i.d_tag == DT_SONAME:
+                return self.read_str(sec.sh_offset + i.val)
+        return None
+
+    def get_linked_section(self, sec):
+        if sec.sh_link >= len(self.sections):
+            raise ElfFormatError('File "%s" has an invalid section link.' % self.bfile)
+        return self.sections[sec.sh_link]
+
+    def get_version_definitions(self):
+        '''Returns a dict that maps the indexes of the symbol versions
+        this file defines, other than the base version, to their names.'''
+        versions = {}
+        for sec in self.sections:
+            if sec.sh_type != SHT_GNU_verdef:
+                continue
+            strtab = self.get_linked_section(sec)
+            offset = sec.sh_offset
+            for _ in range(sec.sh_info):
+                (vd_version, vd_flags, vd_ndx, vd_cnt, vd_hash, vd_aux, vd_next) = \
+                    struct.unpack_from(self.endian + 'HHHHIII', self.data, offset)
+                if not vd_flags & VER_FLG_BASE and vd_cnt > 0:
+                    vda_name = struct.unpack_from(self.Word, self.data, offset + vd_aux)[0]
+                    versions[vd_ndx] = self.read_str(strtab.sh_offset + vda_name)
+                if vd_next == 0:
+                    break
+                offset += vd_next
+        return versions
+
+    def get_exported_symbols(self):
+        '''Returns a sorted list of (name, type) tuples of all
+        global symbols that this file defines in its dynamic
+        symbol table. Versioned symbols are named like nm names
+        them, name@@VERSION for the default version and
+        name@VERSION for the others.'''
+        try:
+            return self.parse_exported_symbols()
+        except struct.error as e:
+            raise ElfFormatError('File "%s" is truncated: %s' % (self.bfile, str(e)))
+
+    def parse_exported_symbols(self):
+        versions = self.get_version_definitions()
+        versym = None
+        for sec in self.sections:
+            if sec.sh_type == SHT_GNU_versym:
+                versym = sec
+        syms = []
+        for sec in self.sections:
+            if sec.sh_type != SHT_DYNSYM or sec.sh_entsize == 0:
+                continue
+            strtab = self.get_linked_section(sec)
+            for i in range(sec.sh_size // sec.sh_entsize):
+                sym = Symbol(self.data, sec.sh_offset + i * sec.sh_entsize, self.ptrsize, self.is_le)
+                if sym.st_name == 0 or sym.st_shndx == SHN_UNDEF:
+                    continue
+                if sym.binding not in (STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE):
+                    continue
+                name = self.read_str(strtab.sh_offset + sym.st_name)
+                if versym is not None:
+                    ver = struct.unpack_from(self.endian + 'H', self.data, versym.sh_offset + 2 * i)[0]
+                    vername = versions.get(ver & ~VERSYM_HIDDEN)
+                    # The symbols that define the versions are named after them.
+                    if vername is not None and vername != name:
+                        name += (b'@' if ver & VERSYM_HIDDEN else b'@@') + vername
+                syms.append((name, sym.type))
+        return sorted(syms)
 
     def get_rpath_offset(self):
         sec = self.find_section(b'.dynstr')
@@ -223,8 +310,7 @@ class Elf(DataSizes):
         if offset is None:
             print("This file does not have an rpath.")
         else:
-            self.bf.seek(offset)
-            print(self.read_str())
+            print(self.read_str(offset))
 
     def print_deps(self):
         sec = self.find_section(b'.dynstr')
@@ -234,8 +320,7 @@ class Elf(DataSizes):
                 deps.append(i)
         for i in deps:
             offset = sec.sh_offset + i.val
-            self.bf.seek(offset)
-            name = self.read_str()
+            name = self.read_str(offset)
             print(name)
 
     def fix_deps(self, prefix):
@@ -246,28 +331,23 @@ class Elf(DataSizes):
                 deps.append(i)
         for i in deps:
             offset = sec.sh_offset + i.val
-            self.bf.seek(offset)
-            name = self.read_str()
+            name = self.read_str(offset)
             if name.startswith(prefix):
                 basename = name.split(b'/')[-1]
                 padding = b'\0'*(len(name) - len(basename))
                 newname = basename + padding
                 assert(len(newname) == len(name))
-                self.bf.seek(offset)
-                self.bf.write(newname)
+                self.data[offset:offset+len(newname)] = newname
 
     def fix_rpath(self, new_rpath):
         rp_off = self.get_rpath_offset()
         if rp_off is None:
             print('File does not have rpath. It should be a fully static executable.')
             return
-        self.bf.seek(rp_off)
-        old_rpath = self.read_str()
+        old_rpath = self.read_str(rp_off)
         if len(old_rpath) < len(new_rpath):
-            print("New rpath must not be longer than the old one.")
-        self.bf.seek(rp_off)
-        self.bf.write(new_rpath)
-        self.bf.write(b'\0'*(len(old_rpath) - len(new_rpath) + 1))
+            raise RuntimeError('New rpath must not be longer than the old one.')
+        self.data[rp_off:rp_off+len(old_rpath)+1] = new_rpath + b'\0'*(len(old_rpath) - len(new_rpath) + 1)
         if len(new_rpath) == 0:
             self.remove_rpath_entry()
 
@@ -279,24 +359,63 @@ class Elf(DataSizes):
                 rpentry.d_tag = 0
                 self.dynamic = self.dynamic[:i] + self.dynamic[i+1:] + [rpentry]
                 break;
-        self.bf.seek(sec.sh_offset)
+        offset = sec.sh_offset
         for entry in self.dynamic:
-            entry.write(self.bf)
+            entry.write(self.data, offset)
+            offset += entry.size
         return None
 
+def fix_rpath(fname, new_rpath):
+    try:
+        e = Elf(fname)
+    except NotElfError:
+        return
+    with e:
+        if e.get_rpath_offset() is not None:
+            e.fix_rpath(new_rpath.encode('utf8'))
+
+def fix_rpaths(files):
+    """Sets the rpath of every (file name, new rpath) pair in files.
+    All of the files are processed in this one process. Files that are
+    not ELF binaries are skipped. A file that can not be fixed does not
+    stop the others from being processed. Returns a list of (file name,
+    error) pairs for the files that failed."""
+    failures = []
+    for (fname, new_rpath) in files:
+        try:
+            fix_rpath(fname, new_rpath)
+        except (OSError, RuntimeError, struct.error) as err:
+            failures.append((fname, err))
+    return failures
+
 def run(args):
+    if len(args) >= 1 and args[0] == '--batch':
+        pairs = args[1:]
+        if len(pairs) % 2 != 0:
+            print('%s --batch: <binary file> <prefix> [<binary file> <prefix> ...]' % sys.argv[0])
+            return 1
+        failures = fix_rpaths(zip(pairs[0::2], pairs[1::2]))
+        for (fname, err) in failures:
+            print('Could not fix the rpath of %s: %s' % (fname, err))
+        return 1 if failures else 0
     if len(args) < 1 or len(args) > 2:
         print('This application resets target rpath.')
         print('Don\'t run this unless you know what you are doing.')
         print('%s: <binary file> <prefix>' % sys.argv[0])
+        print('%s --batch: <binary file> <prefix> [<binary file> <prefix> ...]' % sys.argv[0])
         exit(1)
-    e = Elf(args[0])
-    if len(args) == 1:
-        e.print_rpath()
-    else:
-        new_rpath = args[1]
-        e.fix_rpath(new_rpath.encode('utf8'))
+    try:
+        e = Elf(args[0])
+    except NotElfError as err:
+        print(err)
+        return 0
+    with e:
+        if len(args) == 1:
+            e.print_rpath()
+        else:
+            new_rpath = args[1]
+            e.fix_rpath(new_rpath.encode('utf8'))
     return 0
 
 if __name__ == '__main__':
-    run(sys.argv[1:])
+    sys.exit(run(sys.argv[1:]))
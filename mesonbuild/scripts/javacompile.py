@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+# Copyright 2016 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Runs javac for all sources of a jar target and writes a stamp file
+listing the class files it produced. Which class files javac writes
+is only known afterwards, because inner and anonymous classes get
+files of their own. The class files of the previous run are deleted
+first so that classes which no longer exist do not end up in the jar.'''
+
+import sys, os, subprocess
+
+def find_classes(classdir):
+    result = []
+    for root, _, files in os.walk(classdir):
+        for f in files:
+            if f.endswith('.class'):
+                result.append(os.path.relpath(os.path.join(root, f), classdir))
+    return sorted(result)
+
+def run(args):
+    if len(args) < 3:
+        print('Usage: javacompile <class dir> <stamp file> <javac command>')
+        return 1
+    classdir, stampfile = args[0:2]
+    command = args[2:]
+    for f in find_classes(classdir):
+        os.unlink(os.path.join(classdir, f))
+    os.makedirs(classdir, exist_ok=True)
+    rc = subprocess.call(command)
+    if rc != 0:
+        return rc
+    with open(stampfile, 'w') as f:
+        for c in find_classes(classdir):
+            f.write(c.replace('\\', '/') + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
@@ -15,25 +15,145 @@
 # limitations under the License.
 
 import sys, pickle, os, shutil, subprocess, gzip, platform
+import tarfile, tempfile, io, time
 from glob import glob
+from mesonbuild.scripts import depfixer
+
+archive_formats = {'.tar' : 'w',
+                   '.tar.gz' : 'w:gz',
+                   '.tgz' : 'w:gz',
+                   '.tar.xz' : 'w:xz',
+                   '.txz' : 'w:xz',
+                  }
+
+class ArchiveInstaller():
+    '''Writes the install tree directly into a tar archive instead
+    of a directory. Entries are owned by root and keep the permission
+    bits of the files they were created from.'''
+
+    def __init__(self, filename):
+        mode = None
+        for (suffix, m) in archive_formats.items():
+            if filename.endswith(suffix):
+                mode = m
+                break
+        if mode is None:
+            raise RuntimeError('Unknown archive format for file %s. Supported suffixes: %s.' %
+                               (filename, ', '.join(sorted(archive_formats.keys()))))
+        self.filename = filename
+        self.tar = tarfile.open(filename, mode)
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='meson-install-')
+        self.tmpcounter = 0
+        self.dirs = set()
+        self.mtime = time.time()
+
+    def close(self):
+        self.tar.close()
+        self.tmpdir.cleanup()
+
+    def get_temp_file(self, basename):
+        self.tmpcounter += 1
+        return os.path.join(self.tmpdir.name, '%d-%s' % (self.tmpcounter, basename))
+
+    def arcname(self, outfilename):
+        name = os.path.splitdrive(outfilename)[1].replace('\\', '/')
+        return os.path.normpath(name).lstrip('/')
+
+    def reset_owner(self, info):
+        info.uid = info.gid = 0
+        info.uname = info.gname = 'root'
+        return info
+
+    def add_parent_dirs(self, arcname):
+        parent = os.path.split(arcname)[0]
+        missing = []
+        while parent != '' and parent not in self.dirs:
+            missing.append(parent)
+            parent = os.path.split(parent)[0]
+        for dirname in reversed(missing):
+            info = tarfile.TarInfo(dirname)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = self.mtime
+            self.tar.addfile(self.reset_owner(info))
+            self.dirs.add(dirname)
+
+    def add_file(self, srcfile, outfilename, mode_from=None):
+        arcname = self.arcname(outfilename)
+        self.add_parent_dirs(arcname)
+        info = self.tar.gettarinfo(srcfile, arcname)
+        if mode_from is not None:
+            info.mode = os.stat(mode_from).st_mode & 0o7777
+        with open(srcfile, 'rb') as f:
+            self.tar.addfile(self.reset_owner(info), f)
+
+    def add_bytes(self, data, outfilename, mode_from):
+        arcname = self.arcname(outfilename)
+        self.add_parent_dirs(arcname)
+        st = os.stat(mode_from)
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mode = st.st_mode & 0o7777
+        info.mtime = st.st_mtime
+        self.tar.addfile(self.reset_owner(info), io.BytesIO(data))
+
+    def add_symlink(self, target, outfilename):
+        arcname = self.arcname(outfilename)
+        self.add_parent_dirs(arcname)
+        info = tarfile.TarInfo(arcname)
+        info.type = tarfile.SYMTYPE
+        info.linkname = target
+        info.mode = 0o777
+        info.mtime = self.mtime
+        self.tar.addfile(self.reset_owner(info))
+
+    def add_tree(self, src_dir, outdirname):
+        arcname = self.arcname(outdirname)
+        self.add_parent_dirs(arcname)
+        self.tar.add(src_dir, arcname, filter=self.reset_owner)
+        for root, dirs, _ in os.walk(src_dir):
+            relroot = os.path.relpath(root, src_dir)
+            self.dirs.add(os.path.normpath(os.path.join(arcname, relroot)))
 
 def do_install(datafilename):
     ifile = open(datafilename, 'rb')
     d = pickle.load(ifile)
     destdir_var = 'DESTDIR'
-    if destdir_var in os.environ:
-        d.destdir = os.environ[destdir_var]
-    else:
+    archive_var = 'MESON_INSTALL_ARCHIVE'
+    if archive_var in os.environ:
+        # Everything is written straight into the archive, so
+        # all paths are computed as if DESTDIR were empty.
+        d.archive = ArchiveInstaller(os.path.abspath(os.environ[archive_var]))
         d.destdir = ''
+    else:
+        d.archive = None
+        if destdir_var in os.environ:
+            d.destdir = os.environ[destdir_var]
+        else:
+            d.destdir = ''
     d.fullprefix = d.destdir + d.prefix
 
-    install_subdirs(d) # Must be first, because it needs to delete the old subtree.
-    install_targets(d)
-    install_headers(d)
-    install_man(d)
-    install_data(d)
-    install_po(d)
-    run_install_script(d)
+    try:
+        install_subdirs(d) # Must be first, because it needs to delete the old subtree.
+        install_targets(d)
+        install_headers(d)
+        install_man(d)
+        install_data(d)
+        install_po(d)
+        run_install_script(d)
+    finally:
+        if d.archive is not None:
+            d.archive.close()
+    if d.archive is not None:
+        print('Wrote install archive %s.' % d.archive.filename)
+
+def install_file(d, srcfile, outfilename):
+    if d.archive is not None:
+        d.archive.add_file(srcfile, outfilename)
+        return
+    os.makedirs(os.path.split(outfilename)[0], exist_ok=True)
+    shutil.copyfile(srcfile, outfilename)
+    shutil.copystat(srcfile, outfilename)
 
 def install_subdirs(d):
     for (src_dir, dst_dir) in d.install_subdirs:
@@ -44,6 +164,10 @@ def install_subdirs(d):
         # Python's copytree works in strange ways.
         last_level = os.path.split(src_dir)[-1]
         final_dst = os.path.join(dst_dir, last_level)
+        if d.archive is not None:
+            d.archive.add_tree(src_dir, final_dst)
+            print('Installing subdir %s to %s.' % (src_dir, dst_dir))
+            continue
 # Don't do rmtree because final_dst might point to e.g. /var/www
 # We might need to revert to walking the directory tree by hand.
 #        shutil.rmtree(final_dst, ignore_errors=True)
@@ -58,9 +182,7 @@ def install_po(d):
         languagename = f[2]
         outfile = os.path.join(d.fullprefix, localedir, languagename, 'LC_MESSAGES',
                                packagename + '.mo')
-        os.makedirs(os.path.split(outfile)[0], exist_ok=True)
-        shutil.copyfile(srcfile, outfile)
-        shutil.copystat(srcfile, outfile)
+        install_file(d, srcfile, outfile)
         print('Installing %s to %s.' % (srcfile, outfile))
 
 def install_data(d):
@@ -73,10 +195,8 @@ def install_data(d):
         else:
             outdir = os.path.join(d.fullprefix, os.path.split(outfilename)[0])
             outfilename = os.path.join(outdir, os.path.split(outfilename)[1])
-        os.makedirs(outdir, exist_ok=True)
         print('Installing %s to %s.' % (fullfilename, outdir))
-        shutil.copyfile(fullfilename, outfilename)
-        shutil.copystat(fullfilename, outfilename)
+        install_file(d, fullfilename, outfilename)
 
 def install_man(d):
     for m in d.man:
@@ -84,13 +204,17 @@ def install_man(d):
         outfilename = os.path.join(d.fullprefix, outfileroot)
         full_source_filename = m[0]
         outdir = os.path.split(outfilename)[0]
-        os.makedirs(outdir, exist_ok=True)
         print('Installing %s to %s.' % (full_source_filename, outdir))
         if outfilename.endswith('.gz') and not full_source_filename.endswith('.gz'):
-            open(outfilename, 'wb').write(gzip.compress(open(full_source_filename, 'rb').read()))
+            data = gzip.compress(open(full_source_filename, 'rb').read())
+            if d.archive is not None:
+                d.archive.add_bytes(data, outfilename, full_source_filename)
+                continue
+            os.makedirs(outdir, exist_ok=True)
+            open(outfilename, 'wb').write(data)
+            shutil.copystat(full_source_filename, outfilename)
         else:
-            shutil.copyfile(full_source_filename, outfilename)
-        shutil.copystat(full_source_filename, outfilename)
+            install_file(d, full_source_filename, outfilename)
 
 def install_headers(d):
     for t in d.headers:
@@ -99,17 +223,24 @@ def install_headers(d):
         fname = os.path.split(fullfilename)[1]
         outfilename = os.path.join(outdir, fname)
         print('Installing %s to %s' % (fname, outdir))
-        os.makedirs(outdir, exist_ok=True)
-        shutil.copyfile(fullfilename, outfilename)
-        shutil.copystat(fullfilename, outfilename)
+        install_file(d, fullfilename, outfilename)
 
 def run_install_script(d):
+    if len(d.install_scripts) == 0:
+        return
     env = {'MESON_SOURCE_ROOT' : d.source_dir,
            'MESON_BUILD_ROOT' : d.build_dir,
            'MESON_INSTALL_PREFIX' : d.prefix
           }
     child_env = os.environ.copy()
     child_env.update(env)
+    if d.archive is not None:
+        # Install scripts only know how to write to the file system,
+        # so give them a private DESTDIR and put its contents
+        # into the archive afterwards.
+        staging_dir = d.archive.get_temp_file('staging')
+        os.mkdir(staging_dir)
+        child_env['DESTDIR'] = staging_dir
 
     for i in d.install_scripts:
         script = i.cmd_arr[0]
@@ -132,6 +263,9 @@ def run_install_script(d):
         except Exception:
             print('Failed to run install script:', i.cmd_arr[0])
             sys.exit(1)
+    if d.archive is not None:
+        for entry in sorted(os.listdir(staging_dir)):
+            d.archive.add_tree(os.path.join(staging_dir, entry), os.path.join('/', entry))
 
 def is_elf_platform():
     platname = platform.system().lower()
@@ -164,7 +298,74 @@ def check_for_stampfile(fname):
                 return files[0]
     return fname
 
+def strip_file(cmd):
+    print('Stripping target')
+    ps = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdo, stde) = ps.communicate()
+    if ps.returncode != 0:
+        print('Could not strip file.\n')
+        print('Stdout:\n%s\n' % stdo.decode())
+        print('Stderr:\n%s\n' % stde.decode())
+        sys.exit(1)
+
+def fix_rpaths(rpath_fixes):
+    if len(rpath_fixes) == 0 or not is_elf_platform():
+        return
+    failures = depfixer.fix_rpaths(rpath_fixes)
+    if len(failures) > 0:
+        for (fname, err) in failures:
+            print('Could not fix dependency info of %s: %s' % (fname, err))
+        sys.exit(1)
+
+def install_target_to_archive(d, fname, should_strip, install_rpath, rpath_fixes):
+    # Stripping and rpath fixing modify the file, so they are done on
+    # a scratch copy. Strip writes its output there directly so
+    # the binary is only copied once. Returns the file that should
+    # be put in the archive once rpaths have been fixed.
+    needs_fixing = is_elf_platform()
+    if should_strip or needs_fixing:
+        workfile = d.archive.get_temp_file(os.path.split(fname)[-1])
+        if should_strip:
+            strip_file(['strip', '-o', workfile, fname])
+        else:
+            shutil.copyfile(fname, workfile)
+        if needs_fixing:
+            rpath_fixes.append((workfile, install_rpath))
+    else:
+        workfile = fname
+    return workfile
+
+def install_dwp(d, fname, outname, dwodir):
+    '''With split DWARF the debug info stays in .dwo files next to the
+    object files in the build directory. Package it into a .dwp file
+    next to the installed binary, which is where gdb looks for it.
+    The .dwo files are passed to dwp directly, since dwp -e can not
+    read the DWARF 5 skeletons of current compilers. The package is
+    written to a temporary file so nothing is left in the build dir.'''
+    dwofiles = []
+    for root, _, files in os.walk(dwodir):
+        dwofiles += [os.path.join(root, f) for f in files if f.endswith('.dwo')]
+    if len(dwofiles) == 0:
+        return
+    (fd, dwpfile) = tempfile.mkstemp(suffix='.dwp')
+    os.close(fd)
+    try:
+        try:
+            subprocess.check_call(['dwp', '-o', dwpfile] + sorted(dwofiles))
+        except (OSError, subprocess.CalledProcessError):
+            print('Could not package the split debug info of %s with dwp.' % fname)
+            return
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(dwpfile, 0o644)
+        install_file(d, dwpfile, outname + '.dwp')
+    finally:
+        os.unlink(dwpfile)
+
 def install_targets(d):
+    # The rpaths of all installed binaries are fixed in one go
+    # at the end rather than spawning a process per target.
+    rpath_fixes = []
+    archive_files = []
     for t in d.targets:
         fname = check_for_stampfile(t[0])
         outdir = os.path.join(d.fullprefix, t[1])
@@ -172,19 +373,20 @@ def install_targets(d):
         outname = os.path.join(outdir, os.path.split(fname)[-1])
         should_strip = t[3]
         install_rpath = t[4]
+        dwodir = t[5]
         print('Installing %s to %s' % (fname, outname))
+        # Stripping removes the references to the split debug info.
+        if dwodir is not None and not should_strip:
+            install_dwp(d, fname, outname, dwodir)
+        if d.archive is not None:
+            workfile = install_target_to_archive(d, fname, should_strip, install_rpath, rpath_fixes)
+            archive_files.append((workfile, outname, fname, aliases))
+            continue
         os.makedirs(outdir, exist_ok=True)
         shutil.copyfile(fname, outname)
         shutil.copystat(fname, outname)
         if should_strip:
-            print('Stripping target')
-            ps = subprocess.Popen(['strip', outname], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            (stdo, stde) = ps.communicate()
-            if ps.returncode != 0:
-                print('Could not strip file.\n')
-                print('Stdout:\n%s\n' % stdo.decode())
-                print('Stderr:\n%s\n' % stde.decode())
-                sys.exit(1)
+            strip_file(['strip', outname])
         printed_symlink_error = False
         for alias in aliases:
             try:
@@ -198,16 +400,16 @@ def install_targets(d):
                 if not printed_symlink_error:
                     print("Symlink creation does not work on this platform.")
                     printed_symlink_error = True
-        if is_elf_platform():
-            p = subprocess.Popen(d.depfixer + [outname, install_rpath],
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            (stdo, stde) = p.communicate()
-            if p.returncode != 0:
-                print('Could not fix dependency info.\n')
-                print('Stdout:\n%s\n' % stdo.decode())
-                print('Stderr:\n%s\n' % stde.decode())
-                sys.exit(1)
+        rpath_fixes.append((outname, install_rpath))
+    fix_rpaths(rpath_fixes)
+    for (workfile, outname, fname, aliases) in archive_files:
+        d.archive.add_file(workfile, outname, mode_from=fname)
+        if workfile != fname:
+            os.unlink(workfile)
+        # Like in a directory install, aliases come after their target.
+        outdir = os.path.split(outname)[0]
+        for alias in aliases:
+            d.archive.add_symlink(os.path.split(fname)[-1], os.path.join(outdir, alias))
 
 def run(args):
     if len(args) != 1:
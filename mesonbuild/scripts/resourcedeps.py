@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Copyright 2016 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Runs a resource compiler and writes a Makefile style dependency file
+listing the files the resource description refers to, so Ninja rebuilds
+the resources when any of them changes without Meson having to scan the
+descriptions at configure time.'''
+
+import sys, os, subprocess
+import xml.etree.ElementTree as ET
+
+def gresource_deps(infile, command):
+    cmd = [command[0], infile, '--generate-dependencies']
+    for i in range(len(command) - 1):
+        if command[i] == '--sourcedir':
+            cmd += ['--sourcedir', command[i + 1]]
+    pc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    (stdout, _) = pc.communicate()
+    if pc.returncode != 0:
+        raise subprocess.CalledProcessError(pc.returncode, cmd)
+    return [x for x in stdout.split('\n') if x != '']
+
+def qrc_deps(infile, command):
+    relative_part = os.path.split(infile)[0]
+    root = ET.parse(infile).getroot()
+    result = []
+    for child in root.iter('file'):
+        result.append(os.path.join(relative_part, child.text.strip()))
+    return result
+
+dep_scanners = {'gresource': gresource_deps,
+                'qrc': qrc_deps,
+               }
+
+def quote_make(fname):
+    return fname.replace('\\', '/').replace('$', '$$').replace(' ', '\\ ').replace('#', '\\#')
+
+def write_depfile(depfile, outfile, deps):
+    tmpfile = depfile + '~'
+    with open(tmpfile, 'w') as f:
+        f.write('%s: %s\n' % (quote_make(outfile), ' '.join([quote_make(x) for x in deps])))
+    os.replace(tmpfile, depfile)
+
+def run(args):
+    if len(args) < 5 or args[0] not in dep_scanners:
+        print('Usage: resourcedeps <%s> <input> <output> <depfile> <command>' % '|'.join(sorted(dep_scanners.keys())))
+        return 1
+    kind, infile, outfile, depfile = args[0:4]
+    command = args[4:]
+    rc = subprocess.call(command)
+    if rc != 0:
+        return rc
+    try:
+        deps = dep_scanners[kind](infile, command)
+    except Exception as e:
+        print('Could not determine the dependencies of %s: %s' % (infile, str(e)))
+        return 1
+    write_depfile(depfile, outfile, [infile] + deps)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
@@ -23,7 +23,8 @@
 # http://cgit.freedesktop.org/libreoffice/core/commit/?id=3213cd54b76bc80a6f0516aac75a48ff3b2ad67c
 
 import sys, subprocess
-from mesonbuild import mesonlib
+from mesonbuild import mesonlib, mlog
+from mesonbuild.scripts import depfixer
 import argparse
 
 parser = argparse.ArgumentParser()
@@ -45,7 +46,25 @@ def write_if_changed(text, outfilename):
         pass
     open(outfilename, 'w').write(text)
 
+def elf_syms(libfilename, outfilename):
+    '''Reads the soname and exported symbols straight from the
+    ELF file without spawning any helper tools.'''
+    with depfixer.Elf(libfilename, readonly=True) as elf:
+        result = []
+        soname = elf.get_soname()
+        if soname is not None:
+            result.append('SONAME ' + soname.decode())
+        result += ['%s %d' % (name.decode(), symtype) for (name, symtype) in elf.get_exported_symbols()]
+    write_if_changed('\n'.join(result) + '\n', outfilename)
+
 def linux_syms(libfilename, outfilename):
+    try:
+        elf_syms(libfilename, outfilename)
+        return
+    except (depfixer.NotElfError, depfixer.ElfFormatError) as e:
+        # Fall back to the binutils tools for anything
+        # the built in parser does not understand.
+        mlog.debug('Could not read symbols of %s, using readelf and nm: %s' % (libfilename, str(e)))
     pe = subprocess.Popen(['readelf', '-d', libfilename], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     output = pe.communicate()[0].decode()
     if pe.returncode != 0:
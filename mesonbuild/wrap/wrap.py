@@ -13,9 +13,11 @@
 # limitations under the License.
 
 from .. import mlog
-import urllib.request, os, hashlib, shutil
+import urllib.request, urllib.error, os, hashlib, shutil, tempfile, stat
 import subprocess
 import sys
+import concurrent.futures
+from glob import glob
 
 try:
     import ssl
@@ -27,6 +29,9 @@ except ImportError:
 
 ssl_warning_printed = False
 
+min_blocksize = 64*1024
+max_blocksize = 1024*1024
+
 def build_ssl_context():
     ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
     ctx.options |= ssl.OP_NO_SSLv2
@@ -82,10 +87,108 @@ class PackageDefinition:
     def has_patch(self):
         return 'patch_url' in self.values
 
+def link_file(src, dst):
+    """Hardlinks src to dst, falling back to a copy
+    when they are on different file systems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+cp_reflink_supported = None
+
+def has_cp_reflink():
+    """Whether cp can share the data blocks of copies with the
+    originals on file systems that support it, like GNU cp does."""
+    global cp_reflink_supported
+    if cp_reflink_supported is None:
+        try:
+            p = subprocess.Popen(['cp', '--help'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            cp_reflink_supported = b'--reflink' in p.communicate()[0]
+        except OSError:
+            cp_reflink_supported = False
+    return cp_reflink_supported
+
+def make_read_only(treedir):
+    for (root, _, files) in os.walk(treedir):
+        for f in files:
+            fname = os.path.join(root, f)
+            if not os.path.islink(fname):
+                mode = os.stat(fname).st_mode
+                os.chmod(fname, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+def make_writable(treedir):
+    for (root, _, files) in os.walk(treedir):
+        for f in files:
+            fname = os.path.join(root, f)
+            if not os.path.islink(fname):
+                os.chmod(fname, os.stat(fname).st_mode | stat.S_IWUSR)
+
+def get_range_start(content_range):
+    """Returns the first byte position of a Content-Range
+    header such as 'bytes 100-199/200', or None."""
+    if content_range is None:
+        return None
+    parts = content_range.strip().split()
+    if len(parts) != 2 or parts[0] != 'bytes':
+        return None
+    try:
+        return int(parts[1].split('-', 1)[0])
+    except ValueError:
+        return None
+
+def git_rev_parse(repodir, rev):
+    """Returns the commit id rev refers to in repodir,
+    or None if it is not known there."""
+    p = subprocess.Popen(['git', 'rev-parse', '-q', '--verify', rev + '^{commit}'], cwd=repodir,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        return None
+    return out.decode().strip()
+
+def git_config_get(repodir, key):
+    p = subprocess.Popen(['git', 'config', '--get', key], cwd=repodir,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        return None
+    return out.decode().strip()
+
 class Resolver:
     def __init__(self, subdir_root):
         self.subdir_root = subdir_root
         self.cachedir = os.path.join(self.subdir_root, 'packagecache')
+        # An optional store shared between all projects of the user. Downloads
+        # are kept in it by hash and extracted packages by the hashes of their
+        # source and patch, so each of them is only fetched and unpacked once.
+        self.storedir = os.environ.get('MESON_WRAP_CACHE', None)
+        # Progress output is turned off when several packages
+        # are downloaded at the same time.
+        self.show_progress = True
+
+    def prefetch(self, max_workers=4):
+        """Downloads, verifies and extracts every package that has a wrap
+        file in the subproject dir, several at a time, so that resolving
+        them later does not need to touch the network. Returns a list of
+        (packagename, error message) tuples for packages that failed."""
+        names = [os.path.basename(f)[:-5] for f in sorted(glob(os.path.join(self.subdir_root, '*.wrap')))]
+        if len(names) == 0:
+            return []
+        os.makedirs(self.cachedir, exist_ok=True)
+        self.show_progress = False
+        failures = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = dict((executor.submit(self.resolve, name), name) for name in names)
+                for f in concurrent.futures.as_completed(futures):
+                    try:
+                        f.result()
+                    except Exception as e:
+                        failures.append((futures[f], str(e)))
+        finally:
+            self.show_progress = True
+        return sorted(failures)
 
     def resolve(self, packagename):
         fname = os.path.join(self.subdir_root, packagename + '.wrap')
@@ -97,8 +200,7 @@ class Resolver:
             return None
         p = PackageDefinition(fname)
         if p.type == 'file':
-            if not os.path.isdir(self.cachedir):
-                os.mkdir(self.cachedir)
+            os.makedirs(self.cachedir, exist_ok=True)
             self.download(p, packagename)
             self.extract_package(p)
         elif p.type == 'git':
@@ -110,79 +212,226 @@ class Resolver:
     def get_git(self, p):
         checkoutdir = os.path.join(self.subdir_root, p.get('directory'))
         revno = p.get('revision')
-        is_there = os.path.isdir(checkoutdir)
-        if is_there:
-            if revno.lower() == 'head':
+        is_head = revno.lower() == 'head'
+        if os.path.isdir(checkoutdir):
+            if is_head:
+                # Following the branch is what head asks for, so there is
+                # no cached state to reuse. Pin a revision to configure
+                # without contacting the server.
                 subprocess.check_call(['git', 'pull'], cwd=checkoutdir)
-            else:
-                if subprocess.call(['git', 'checkout', revno], cwd=checkoutdir) != 0:
-                    subprocess.check_call(['git', 'fetch'], cwd=checkoutdir)
-                    subprocess.check_call(['git', 'checkout', revno],
-                                          cwd=checkoutdir)
-        else:
-            subprocess.check_call(['git', 'clone', p.get('url'),
+                return
+            # Nothing to do if the checkout already is at the wanted revision.
+            # Revisions fetched shallowly have no local ref, so the one
+            # checked out last is remembered in the repository config.
+            head = git_rev_parse(checkoutdir, 'HEAD')
+            if git_config_get(checkoutdir, 'meson.revision') == revno and \
+               git_config_get(checkoutdir, 'meson.commit') == head:
+                return
+            wanted = git_rev_parse(checkoutdir, revno)
+            if wanted is not None and wanted == head:
+                return
+            ref = revno
+            if wanted is None:
+                ref = self.git_fetch_revision(checkoutdir, revno)
+            self.git_checkout(checkoutdir, ref, revno)
+            return
+        mirror = self.get_git_mirror(p.get('url'), None if is_head else revno)
+        if mirror is not None:
+            # All objects come from the local mirror, so a shallow clone
+            # would not save anything. They are copied rather than
+            # borrowed because updating the mirror may prune them.
+            subprocess.check_call(['git', 'clone', '--reference', mirror, '--dissociate',
+                                   p.get('url'), p.get('directory')], cwd=self.subdir_root)
+            if not is_head:
+                self.git_checkout(checkoutdir, revno, revno)
+        elif is_head:
+            subprocess.check_call(['git', 'clone', '--depth', '1', '--single-branch', p.get('url'),
                                    p.get('directory')], cwd=self.subdir_root)
-            if revno.lower() != 'head':
-                subprocess.check_call(['git', 'checkout', revno],
-                                      cwd=checkoutdir)
+        else:
+            subprocess.check_call(['git', 'init', '-q', p.get('directory')], cwd=self.subdir_root)
+            subprocess.check_call(['git', 'remote', 'add', 'origin', p.get('url')], cwd=checkoutdir)
+            self.git_checkout(checkoutdir, self.git_fetch_revision(checkoutdir, revno), revno)
 
+    def git_checkout(self, checkoutdir, ref, revno):
+        subprocess.check_call(['git', '-c', 'advice.detachedHead=false', 'checkout', ref],
+                              cwd=checkoutdir)
+        subprocess.check_call(['git', 'config', 'meson.revision', revno], cwd=checkoutdir)
+        subprocess.check_call(['git', 'config', 'meson.commit', git_rev_parse(checkoutdir, 'HEAD')],
+                              cwd=checkoutdir)
 
-    def get_data(self, url):
-        blocksize = 10*1024
+    def git_fetch_revision(self, checkoutdir, revno):
+        """Fetches revno from origin and returns what to check out to get it."""
+        # Servers that do not allow fetching arbitrary commits reject the
+        # shallow fetch. Fall back to fetching everything for them.
+        if subprocess.call(['git', 'fetch', '--depth', '1', 'origin', revno], cwd=checkoutdir) == 0:
+            return 'FETCH_HEAD'
+        subprocess.check_call(['git', 'fetch', '--tags', 'origin'], cwd=checkoutdir)
+        return revno
+
+    def get_git_mirror(self, url, revno):
+        """Returns the path of a bare mirror of url in the shared wrap
+        store, creating or updating it if it does not have revno. Returns
+        None if the store is not in use."""
+        if self.storedir is None:
+            return None
+        mirror = os.path.join(self.storedir, 'git', hashlib.sha256(url.encode()).hexdigest() + '.git')
+        if not os.path.isdir(mirror):
+            os.makedirs(os.path.dirname(mirror), exist_ok=True)
+            tmpdir = '%s.tmp%d' % (mirror, os.getpid())
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            subprocess.check_call(['git', 'clone', '--mirror', url, tmpdir])
+            try:
+                os.rename(tmpdir, mirror)
+            except OSError:
+                shutil.rmtree(tmpdir)
+        elif revno is None or git_rev_parse(mirror, revno) is None:
+            subprocess.check_call(['git', 'remote', 'update', '--prune'], cwd=mirror)
+        return mirror
+
+    def open_url(self, url, offset=0):
         if url.startswith('https://wrapdb.mesonbuild.com'):
-            resp = open_wrapdburl(url)
+            return open_wrapdburl(url)
+        req = urllib.request.Request(url)
+        if offset > 0:
+            req.add_header('Range', 'bytes=%d-' % offset)
+        return urllib.request.urlopen(req)
+
+    def open_resumed(self, url, offset):
+        """Requests url from byte offset on. Returns None if the
+        server can not continue the download there."""
+        try:
+            resp = self.open_url(url, offset)
+        except urllib.error.HTTPError as e:
+            # The partial file is as long as the whole one or longer,
+            # for example because it was complete but never renamed.
+            if e.code == 416:
+                return None
+            raise
+        if resp.getcode() != 206 or get_range_start(resp.info()['Content-Range']) != offset:
+            resp.close()
+            return None
+        return resp
+
+    def download_file(self, url, ofname, expected, tmpname=None):
+        """Downloads url to ofname, verifying that its SHA-256 hash is
+        expected. Data is streamed to tmpname, by default a file next to
+        ofname, which is renamed into place only once the hash matches. If an
+        earlier download was interrupted, it is resumed when the server
+        supports range requests. If resuming fails, the download starts
+        over from the beginning."""
+        if tmpname is None:
+            tmpname = ofname + '.part'
+        h = hashlib.sha256()
+        offset = 0
+        if os.path.exists(tmpname):
+            offset = os.path.getsize(tmpname)
+        resp = None
+        if offset > 0:
+            resp = self.open_resumed(url, offset)
+            if resp is None:
+                mlog.log('Can not resume the download, starting over.')
+        if resp is not None:
+            mlog.log('Resuming download at byte', str(offset))
+            with open(tmpname, 'rb') as f:
+                while True:
+                    block = f.read(max_blocksize)
+                    if not block:
+                        break
+                    h.update(block)
+            ofile = open(tmpname, 'ab')
         else:
-            resp = urllib.request.urlopen(url)
-        dlsize = int(resp.info()['Content-Length'])
-        print('Download size:', dlsize)
-        print('Downloading: ', end='')
-        sys.stdout.flush()
-        printed_dots = 0
-        blocks = []
-        downloaded = 0
-        while True:
-            block = resp.read(blocksize)
-            if block == b'':
-                break
-            downloaded += len(block)
-            blocks.append(block)
-            ratio = int(downloaded/dlsize * 10)
-            while printed_dots < ratio:
-                print('.', end='')
+            offset = 0
+            resp = self.open_url(url)
+            ofile = open(tmpname, 'wb')
+        try:
+            dlsize = resp.info()['Content-Length']
+            if dlsize is not None:
+                dlsize = int(dlsize) + offset
+            if self.show_progress:
+                if dlsize is not None:
+                    print('Download size:', dlsize)
+                print('Downloading: ', end='')
                 sys.stdout.flush()
-                printed_dots += 1
-        print('')
-        resp.close()
-        return b''.join(blocks)
+            printed_dots = 0
+            downloaded = offset
+            blocksize = min_blocksize
+            while True:
+                block = resp.read(blocksize)
+                if block == b'':
+                    break
+                # Grow the block size while the connection keeps up
+                # so fast downloads do not spend their time in Python.
+                if len(block) == blocksize and blocksize < max_blocksize:
+                    blocksize *= 2
+                h.update(block)
+                ofile.write(block)
+                downloaded += len(block)
+                if dlsize and self.show_progress:
+                    ratio = int(downloaded/dlsize * 10)
+                    while printed_dots < ratio:
+                        print('.', end='')
+                        sys.stdout.flush()
+                        printed_dots += 1
+            if self.show_progress:
+                print('')
+        finally:
+            ofile.close()
+            resp.close()
+        dhash = h.hexdigest()
+        if dhash != expected:
+            os.unlink(tmpname)
+            if offset > 0:
+                # The partial file may have been corrupt or belonged
+                # to an older version of the file.
+                mlog.log('Resumed download is corrupt, starting over.')
+                return self.download_file(url, ofname, expected, tmpname)
+            raise RuntimeError('Incorrect hash for %s:\n %s expected\n %s actual.' % (url, expected, dhash))
+        os.replace(tmpname, ofname)
 
-    def get_hash(self, data):
+    def get_hash(self, fname):
         h = hashlib.sha256()
-        h.update(data)
-        hashvalue = h.hexdigest()
-        return hashvalue
+        with open(fname, 'rb') as f:
+            while True:
+                block = f.read(max_blocksize)
+                if not block:
+                    break
+                h.update(block)
+        return h.hexdigest()
+
+    def fetch(self, what, url, ofname, expected):
+        if self.storedir is None:
+            mlog.log('Downloading', mlog.bold(what), 'from', mlog.bold(url))
+            self.download_file(url, ofname, expected)
+            return
+        storefile = os.path.join(self.storedir, 'files', expected)
+        if os.path.exists(storefile):
+            mlog.log('Using', mlog.bold(what), 'from the shared wrap cache.')
+        else:
+            mlog.log('Downloading', mlog.bold(what), 'from', mlog.bold(url))
+            filesdir = os.path.dirname(storefile)
+            os.makedirs(filesdir, exist_ok=True)
+            # Other processes may be downloading the same file into the
+            # store, so each one writes to a file of its own.
+            (fd, tmpname) = tempfile.mkstemp(prefix=expected, suffix='.part', dir=filesdir)
+            os.close(fd)
+            try:
+                self.download_file(url, storefile, expected, tmpname)
+            finally:
+                if os.path.exists(tmpname):
+                    os.unlink(tmpname)
+        link_file(storefile, ofname)
 
     def download(self, p, packagename):
         ofname = os.path.join(self.cachedir, p.get('source_filename'))
         if os.path.exists(ofname):
             mlog.log('Using', mlog.bold(packagename), 'from cache.')
-            return
-        srcurl = p.get('source_url')
-        mlog.log('Dowloading', mlog.bold(packagename), 'from', mlog.bold(srcurl))
-        srcdata = self.get_data(srcurl)
-        dhash = self.get_hash(srcdata)
-        expected = p.get('source_hash')
-        if dhash != expected:
-            raise RuntimeError('Incorrect hash for source %s:\n %s expected\n %s actual.' % (packagename, expected, dhash))
-        open(ofname, 'wb').write(srcdata)
+        else:
+            self.fetch(packagename, p.get('source_url'), ofname, p.get('source_hash'))
         if p.has_patch():
-            purl = p.get('patch_url')
-            mlog.log('Downloading patch from', mlog.bold(purl))
-            pdata = self.get_data(purl)
-            phash = self.get_hash(pdata)
-            expected = p.get('patch_hash')
-            if phash != expected:
-                raise RuntimeError('Incorrect hash for patch %s:\n %s expected\n %s actual' % (packagename, expected, phash))
-            open(os.path.join(self.cachedir, p.get('patch_filename')), 'wb').write(pdata)
+            pfname = os.path.join(self.cachedir, p.get('patch_filename'))
+            if os.path.exists(pfname):
+                return
+            self.fetch(packagename + ' patch', p.get('patch_url'), pfname, p.get('patch_hash'))
         else:
             mlog.log('Package does not require patch.')
 
@@ -200,7 +449,43 @@ class Resolver:
         target_dir = os.path.join(self.subdir_root, package.get('directory'))
         if os.path.isdir(target_dir):
             return
-        extract_dir = self.subdir_root
+        if self.storedir is None:
+            self.unpack_package(package, self.subdir_root)
+            return
+        treedir = os.path.join(self.get_store_tree(package), package.get('directory'))
+        # Users edit their subprojects, which must not change the store.
+        # Reflinked copies share their data with the store until they are
+        # written to. Without reflinks the files are hardlinked, and the
+        # files in the store are read-only so they are not edited in place.
+        if has_cp_reflink():
+            subprocess.check_call(['cp', '-R', '--reflink=auto', '--preserve=mode,timestamps,links',
+                                   treedir, target_dir])
+            make_writable(target_dir)
+        else:
+            shutil.copytree(treedir, target_dir, symlinks=True, copy_function=link_file)
+
+    def get_store_tree(self, package):
+        h = hashlib.sha256()
+        for key in ('directory', 'source_hash', 'patch_hash', 'lead_directory_missing'):
+            h.update(('%s=%s\n' % (key, package.values.get(key, ''))).encode())
+        treedir = os.path.join(self.storedir, 'trees', h.hexdigest())
+        if os.path.isdir(treedir):
+            return treedir
+        tmpdir = '%s.tmp%d' % (treedir, os.getpid())
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        os.makedirs(tmpdir)
+        self.unpack_package(package, tmpdir)
+        make_read_only(tmpdir)
+        try:
+            os.rename(tmpdir, treedir)
+        except OSError:
+            # Another process stored the same package first.
+            shutil.rmtree(tmpdir)
+        return treedir
+
+    def unpack_package(self, package, extract_root):
+        target_dir = os.path.join(extract_root, package.get('directory'))
+        extract_dir = extract_root
         # Some upstreams ship packages that do not have a leading directory.
         # Create one for them.
         try:
@@ -211,4 +496,4 @@ class Resolver:
             pass
         shutil.unpack_archive(os.path.join(self.cachedir, package.get('source_filename')), extract_dir)
         if package.has_patch():
-            shutil.unpack_archive(os.path.join(self.cachedir, package.get('patch_filename')), self.subdir_root)
+            shutil.unpack_archive(os.path.join(self.cachedir, package.get('patch_filename')), extract_root)
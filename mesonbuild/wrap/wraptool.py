@@ -21,7 +21,7 @@ import shutil
 
 from glob import glob
 
-from .wrap import API_ROOT, open_wrapdburl
+from .wrap import API_ROOT, open_wrapdburl, Resolver
 
 help_templ = '''This program allows you to manage your Wrap dependencies
 using the online wrap database http://wrapdb.mesonbuild.com.
@@ -40,6 +40,7 @@ Commands:
  update - update the project to its newest available release
  info - show available versions of a project
  status - show installed and available versions of your projects
+ prefetch [-j N] - download and extract all wraps, N at a time
 
 '''
 
@@ -161,6 +162,16 @@ def status():
         else:
             print('', name, 'not up to date. Have %s %d, but %s %d is available.' % (current_branch, current_revision, latest_branch, latest_revision))
 
+def prefetch(max_workers):
+    if not os.path.isdir('subprojects'):
+        print('Subprojects dir not found. Run this command in your source root directory.')
+        sys.exit(1)
+    failures = Resolver('subprojects').prefetch(max_workers)
+    for (name, msg) in failures:
+        print('Could not prefetch %s: %s' % (name, msg))
+    if len(failures) > 0:
+        sys.exit(1)
+
 def run(args):
     if len(args) == 0 or args[0] == '-h' or args[0] == '--help':
         print_help()
@@ -191,6 +202,14 @@ def run(args):
         info(args[0])
     elif command == 'status':
         status()
+    elif command == 'prefetch':
+        max_workers = 4
+        if len(args) == 2 and args[0] == '-j':
+            max_workers = int(args[1])
+        elif len(args) != 0:
+            print('prefetch takes only the -j option.')
+            return 1
+        prefetch(max_workers)
     else:
         print('Unknown command', command)
         return 1
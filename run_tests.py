@@ -30,8 +30,9 @@ import time
 from mesonbuild.mesonmain import backendlist
 
 class TestResult:
-    def __init__(self, msg, stdo, stde, conftime=0, buildtime=0, testtime=0):
+    def __init__(self, msg, stdo, stde, conftime=0, buildtime=0, testtime=0, skipped=False):
         self.msg = msg
+        self.skipped = skipped
         self.stdo = stdo
         self.stde = stde
         self.conftime = conftime
@@ -130,9 +131,12 @@ def validate_install(srcdir, installdir):
         return 'Found extra file %s.' % fname
     return ''
 
-def log_text_file(logfile, testdir, msg, stdo, stde):
-    global passing_tests, failing_tests, stop
-    if msg != '':
+def log_text_file(logfile, testdir, msg, stdo, stde, skipped=False):
+    global passing_tests, failing_tests, skipped_tests, stop
+    if skipped:
+        print('Skipped')
+        skipped_tests += 1
+    elif msg != '':
         print('Fail:', msg)
         failing_tests += 1
     else:
@@ -196,6 +200,10 @@ def run_test(testdir, extra_args, should_succeed):
             return TestResult('', stdo, stde, gen_time)
         return TestResult('Test that should have failed succeeded', stdo, stde, gen_time)
     if returncode != 0:
+        # Tests whose requirements are missing on this machine bail
+        # out with error('MESON_SKIP_TEST <reason>').
+        if 'MESON_SKIP_TEST' in stdo:
+            return TestResult('', stdo, stde, gen_time, skipped=True)
         return TestResult('Generating the build system failed.', stdo, stde, gen_time)
     if 'msbuild' in compile_commands[0]:
         sln_name = glob(os.path.join(test_build_dir, '*.sln'))[0]
@@ -236,6 +244,23 @@ def run_test(testdir, extra_args, should_succeed):
             return TestResult('Running install failed.', stdo, stde, gen_time, build_time, test_time)
         return TestResult(validate_install(testdir, install_dir), stdo, stde, gen_time, build_time, test_time)
 
+def run_unit_test(testdir):
+    # Unit tests are Python scripts that exercise Meson's modules
+    # directly. They import them from this source tree.
+    print('Running test: ' + testdir)
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.path.split(os.path.abspath(__file__))[0]
+    test_start = time.time()
+    pc = subprocess.Popen([sys.executable, 'test.py'], cwd=testdir, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (o, e) = pc.communicate()
+    test_time = time.time() - test_start
+    stdo = o.decode(sys.stdout.encoding)
+    stde = e.decode(sys.stdout.encoding)
+    if pc.returncode != 0:
+        return TestResult('Running unit tests failed.', stdo, stde, testtime=test_time)
+    return TestResult('', stdo, stde, testtime=test_time)
+
 def gather_tests(testdir):
     tests = [t.replace('\\', '/').split('/', 2)[2] for t in glob(os.path.join(testdir, '*'))]
     testlist = [(int(t.split()[0]), t) for t in tests]
@@ -246,6 +271,7 @@ def gather_tests(testdir):
 def detect_tests_to_run():
     all_tests = []
     all_tests.append(('common', gather_tests('test cases/common'), False))
+    all_tests.append(('unit', gather_tests('test cases/unit'), False))
     all_tests.append(('failing', gather_tests('test cases/failing'), False))
     all_tests.append(('prebuilt object', gather_tests('test cases/prebuilt object'), False))
 
@@ -298,16 +324,21 @@ def run_tests(extra_args):
                 skipped_tests += 1
             else:
                 ts = time.time()
-                result = run_test(t, extra_args, name != 'failing')
+                if name == 'unit':
+                    result = run_unit_test(t)
+                else:
+                    result = run_test(t, extra_args, name != 'failing')
                 te = time.time()
                 conf_time += result.conftime
                 build_time += result.buildtime
                 test_time += result.testtime
-                log_text_file(logfile, t, result.msg, result.stdo, result.stde)
+                log_text_file(logfile, t, result.msg, result.stdo, result.stde, result.skipped)
                 current_test = ET.SubElement(current_suite, 'testcase', {'name' : testname,
                                                                          'classname' : name,
                                                                          'time' : '%.3f' % (te - ts)})
-                if result.msg != '':
+                if result.skipped:
+                    ET.SubElement(current_test, 'skipped', {})
+                elif result.msg != '':
                     ET.SubElement(current_test, 'failure', {'message' : result.msg})
                 stdoel = ET.SubElement(current_test, 'system-out')
                 stdoel.text = result.stdo
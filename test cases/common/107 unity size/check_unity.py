@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+import os, sys
+from glob import glob
+
+(privdir, unity_size, num_sources) = (sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+unity_files = glob(os.path.join(privdir, '*-unity*.c'))
+included = []
+for f in unity_files:
+    includes = [l for l in open(f) if l.startswith('#include')]
+    if len(includes) > unity_size:
+        print('Unity file %s has %d sources, more than %d.' % (f, len(includes), unity_size))
+        sys.exit(1)
+    included += includes
+if len(unity_files) < (num_sources + unity_size - 1) // unity_size:
+    print('Only %d unity files were generated.' % len(unity_files))
+    sys.exit(1)
+if len(included) != num_sources or len(set(included)) != num_sources:
+    print('Unity files include %d sources instead of %d.' % (len(included), num_sources))
+    sys.exit(1)
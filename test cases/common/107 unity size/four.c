@@ -0,0 +1 @@
+int func_four(void) { return 1; }
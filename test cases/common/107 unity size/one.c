@@ -0,0 +1 @@
+int func_one(void) { return 1; }
@@ -0,0 +1,8 @@
+int func_one(void);
+int func_two(void);
+int func_three(void);
+int func_four(void);
+
+int main(int argc, char **argv) {
+    return func_one() + func_two() + func_three() + func_four() == 4 ? 0 : 1;
+}
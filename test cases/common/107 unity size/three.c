@@ -0,0 +1 @@
+int func_three(void) { return 1; }
@@ -0,0 +1 @@
+int func_two(void) { return 1; }
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+# Checks that a precompiled header was generated from the common
+# standard headers, compiled and used by every source of the target.
+
+import os, sys, json, glob
+
+builddir = sys.argv[1]
+with open(os.path.join(builddir, 'compile_commands.json')) as f:
+    commands = json.load(f)
+
+headers = glob.glob(os.path.join(builddir, 'prog@exe', 'cpp_autopch_*.h'))
+if len(headers) != 1:
+    print('Expected one automatic precompiled header, found %s.' % headers)
+    sys.exit(1)
+header = headers[0]
+with open(header) as f:
+    contents = f.read()
+for h in ('#include<string>', '#include<vector>'):
+    if h not in contents:
+        print('Automatic precompiled header does not contain %s.' % h)
+        sys.exit(1)
+if len(glob.glob(header + '.gch') + glob.glob(header[:-2] + '.pch')) == 0:
+    print('Automatic precompiled header was not compiled.')
+    sys.exit(1)
+
+basename = os.path.basename(header)
+sources = [c for c in commands if os.path.basename(c['file']) in ('prog.cpp', 'names.cpp', 'numbers.cpp')]
+if len(sources) != 3:
+    print('Expected three sources in compile_commands.json, found %d.' % len(sources))
+    sys.exit(1)
+for c in sources:
+    if basename not in c['command']:
+        print('%s is not compiled with the automatic precompiled header.' % c['file'])
+        sys.exit(1)
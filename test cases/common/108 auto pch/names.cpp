@@ -0,0 +1,10 @@
+#include<string>
+#include<vector>
+#include"prog.h"
+
+std::vector<std::string> names() {
+    std::vector<std::string> n;
+    n.push_back("one");
+    n.push_back("two");
+    return n;
+}
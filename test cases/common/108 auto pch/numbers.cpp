@@ -0,0 +1,16 @@
+#include<vector>
+#include"prog.h"
+
+#define NUMBER_COUNT 3
+
+int sum_numbers() {
+    std::vector<int> v;
+    for(int i=1; i<=NUMBER_COUNT; i++) {
+        v.push_back(i);
+    }
+    int sum = 0;
+    for(size_t i=0; i<v.size(); i++) {
+        sum += v[i];
+    }
+    return sum;
+}
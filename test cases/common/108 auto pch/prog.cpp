@@ -0,0 +1,8 @@
+#include<string>
+#include<vector>
+#include"prog.h"
+
+int main(int argc, char **argv) {
+    std::vector<std::string> n = names();
+    return n.size() == 2 && sum_numbers() == 6 ? 0 : 1;
+}
@@ -0,0 +1,7 @@
+#pragma once
+
+#include<string>
+#include<vector>
+
+std::vector<std::string> names();
+int sum_numbers();
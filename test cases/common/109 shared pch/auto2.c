@@ -0,0 +1,9 @@
+#include<stdio.h>
+#include<string.h>
+
+int auto_helper(const char *s);
+
+int main(int argc, char **argv) {
+    printf("%d\n", auto_helper("auto2"));
+    return 0;
+}
@@ -0,0 +1,6 @@
+#include<stdio.h>
+#include<string.h>
+
+int auto_helper(const char *s) {
+    return strlen(s) == 5 ? 0 : 1;
+}
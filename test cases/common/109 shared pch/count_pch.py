@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import os, sys
+
+builddir = sys.argv[1]
+expected = int(sys.argv[2])
+found = []
+for root, dirs, files in os.walk(builddir):
+    for f in files:
+        if f.endswith('.gch') or f.endswith('.pch'):
+            found.append(os.path.join(root, f))
+if len(found) != expected:
+    print('Expected %d precompiled headers, found %d:' % (expected, len(found)))
+    for f in sorted(found):
+        print(f)
+    sys.exit(1)
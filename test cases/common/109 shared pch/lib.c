@@ -0,0 +1,5 @@
+// No includes here, they need to come from the PCH.
+
+int libfunc() {
+    return (int)strlen("lib");
+}
@@ -0,0 +1,5 @@
+// No includes here, they need to come from the PCH.
+
+int main(int argc, char **argv) {
+    return strlen("prog1") == 5 ? 0 : 1;
+}
@@ -0,0 +1,6 @@
+// No includes here, they need to come from the PCH.
+
+int main(int argc, char **argv) {
+    printf("prog2\n");
+    return 0;
+}
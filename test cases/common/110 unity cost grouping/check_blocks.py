@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+import os, sys, json
+from glob import glob
+
+(privdir, unity_size) = (sys.argv[1], int(sys.argv[2]))
+blocks = json.load(open(glob(os.path.join(privdir, '*-unity-blocks.json'))[0]))
+seen = set()
+for block in blocks['c']['blocks']:
+    if len(block) > unity_size:
+        print('Block has %d sources, more than %d.' % (len(block), unity_size))
+        sys.exit(1)
+    for src in block:
+        if src in seen:
+            print('Source %s is in several blocks.' % src)
+            sys.exit(1)
+        seen.add(src)
+unity_files = glob(os.path.join(privdir, '*-unity*.c'))
+if len(unity_files) != len(blocks['c']['blocks']):
+    print('There are %d unity files for %d blocks.' % (len(unity_files), len(blocks['c']['blocks'])))
+    sys.exit(1)
@@ -0,0 +1,9 @@
+int one(void);
+int two(void);
+int three(void);
+int four(void);
+int five(void);
+
+int main(int argc, char **argv) {
+    return one() + two() + three() + four() + five() == 5 ? 0 : 1;
+}
@@ -0,0 +1,3 @@
+int three(void) {
+    return 1;
+}
@@ -0,0 +1,3 @@
+int two(void) {
+    return 1;
+}
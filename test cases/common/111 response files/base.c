@@ -0,0 +1,3 @@
+int base_func() {
+    return 1;
+}
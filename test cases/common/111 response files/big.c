@@ -0,0 +1,5 @@
+int base_func();
+
+int big_func() {
+    return base_func() + 1;
+}
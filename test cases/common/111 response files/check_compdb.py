@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+# Checks that the compilation database shows the real command of a
+# compilation that went through a response file.
+
+import sys, os, json, subprocess
+
+builddir = sys.argv[1]
+ninja = os.environ.get('NINJA', 'ninja')
+try:
+    version = subprocess.check_output([ninja, '--version'], universal_newlines=True).strip()
+except OSError:
+    print('Ninja not found, skipping.')
+    sys.exit(0)
+if tuple(int(x) for x in version.split('.')[:2]) < (1, 9):
+    print('Ninja %s can not expand response files, skipping.' % version)
+    sys.exit(0)
+
+with open(os.path.join(builddir, 'compile_commands.json')) as f:
+    db = json.load(f)
+entries = [e for e in db if os.path.basename(e['file']) == 'base.c']
+if len(entries) != 1:
+    sys.exit('Expected one entry for base.c, got %d.' % len(entries))
+command = entries[0]['command']
+if '-DLONGLONG' not in command:
+    sys.exit('The response file was not expanded: %s' % command[:200])
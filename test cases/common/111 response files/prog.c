@@ -0,0 +1,5 @@
+int big_func();
+
+int main(int argc, char **argv) {
+    return big_func() == 2 ? 0 : 1;
+}
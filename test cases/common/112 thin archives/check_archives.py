@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+# Thin archives start with a different magic string than normal ones.
+
+import os, sys, subprocess
+
+builddir = sys.argv[1]
+if sys.platform == 'win32':
+    print('Thin archives are not used on Windows.')
+    sys.exit(0)
+
+def magic(name):
+    with open(os.path.join(builddir, name), 'rb') as f:
+        return f.read(8)
+
+if magic('libinstalled.a') != b'!<arch>\n':
+    print('The installed library is not a normal archive.')
+    sys.exit(1)
+
+# Thin archives are a GNU ar feature.
+try:
+    ar_help = subprocess.check_output(['ar', '--help'], stderr=subprocess.STDOUT)
+except (OSError, subprocess.CalledProcessError):
+    ar_help = b''
+if b'[T]' in ar_help and magic('libinternal.a') != b'!<thin>\n':
+    print('The internal library is not a thin archive.')
+    sys.exit(1)
@@ -0,0 +1,3 @@
+int installed_func() {
+    return 2;
+}
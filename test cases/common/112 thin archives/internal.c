@@ -0,0 +1,3 @@
+int internal_func() {
+    return 1;
+}
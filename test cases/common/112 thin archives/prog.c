@@ -0,0 +1,6 @@
+int internal_func();
+int installed_func();
+
+int main(int argc, char **argv) {
+    return internal_func() + installed_func() == 3 ? 0 : 1;
+}
@@ -0,0 +1,5 @@
+int splitlib_func();
+
+int main(int argc, char **argv) {
+    return splitlib_func();
+}
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Checks that -flto reaches the compile and link commands and that the
+# static library is created with the archiver wrapper of the compiler.
+
+import os, sys, json, shutil
+
+(builddir, compiler_id, lto) = sys.argv[1:4]
+if compiler_id not in ('gcc', 'clang') or lto == 'none':
+    print('LTO is not used.')
+    sys.exit(0)
+
+with open(os.path.join(builddir, 'compile_commands.json')) as f:
+    commands = json.load(f)
+if len(commands) != 3:
+    print('Expected three compile commands, found %d.' % len(commands))
+    sys.exit(1)
+for c in commands:
+    if '-flto' not in c['command']:
+        print('%s is not compiled with -flto.' % c['file'])
+        sys.exit(1)
+
+rules = {}
+rule = None
+with open(os.path.join(builddir, 'build.ninja')) as f:
+    for line in f:
+        if line.startswith('rule '):
+            rule = line.split()[1]
+        elif rule is not None and line.startswith(' command = '):
+            rules[rule] = line[len(' command = '):].split()
+            rule = None
+
+if not any(a.startswith('-flto') for a in rules['c_LINKER']):
+    print('The link rule does not use -flto: %s' % ' '.join(rules['c_LINKER']))
+    sys.exit(1)
+
+archiver = 'gcc-ar' if compiler_id == 'gcc' else 'llvm-ar'
+if 'AR' not in os.environ and shutil.which(archiver) is not None:
+    if os.path.basename(rules['STATIC_LINKER'][0]) != archiver:
+        print('Static libraries are not created with %s: %s' % (archiver, ' '.join(rules['STATIC_LINKER'])))
+        sys.exit(1)
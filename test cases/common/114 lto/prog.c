@@ -0,0 +1,6 @@
+int static_func();
+int shared_func();
+
+int main(int argc, char **argv) {
+    return static_func() + shared_func() == 3 ? 0 : 1;
+}
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+# Touches a file that is only listed in the depfiles of the generated
+# headers and checks that Ninja wants to generate them again.
+
+import os, sys, shutil, subprocess, time
+
+(builddir, depfile_input) = sys.argv[1:3]
+ninja = shutil.which('ninja') or shutil.which('ninja-build')
+if ninja is None:
+    print('Ninja not found.')
+    sys.exit(1)
+
+def planned_commands():
+    return subprocess.check_output([ninja, '-C', builddir, '-n', '-v'], universal_newlines=True)
+
+if 'gen_header.py' in planned_commands():
+    print('Headers are regenerated without any change.')
+    sys.exit(1)
+now = time.time() + 2
+os.utime(depfile_input, (now, now))
+commands = [l for l in planned_commands().split('\n') if 'gen_header.py' in l]
+for header in ('ct.h', 'gen.h'):
+    if not any(header in l for l in commands):
+        print('%s is not regenerated after its dependency changed.' % header)
+        sys.exit(1)
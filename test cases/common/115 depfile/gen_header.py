@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+# Defines a macro named after the output with the sum of the numbers in
+# the files listed in the input, and writes a depfile naming those files.
+
+import os, sys
+
+(infile, outfile, depfile, basedir) = sys.argv[1:5]
+name = os.path.splitext(os.path.basename(outfile))[0].upper()
+deps = []
+total = 0
+for line in open(infile):
+    line = line.strip()
+    if line == '':
+        continue
+    fname = os.path.join(basedir, line)
+    deps.append(fname)
+    total += int(open(fname).read().strip())
+with open(outfile, 'w') as f:
+    f.write('#define %s %d\n' % (name, total))
+with open(depfile, 'w') as f:
+    f.write('%s: %s\n' % (outfile.replace(' ', '\\ '), ' '.join([d.replace(' ', '\\ ') for d in deps])))
@@ -0,0 +1,6 @@
+#include"ct.h"
+#include"gen.h"
+
+int main(int argc, char **argv) {
+    return CT == 42 && GEN == 42 ? 0 : 1;
+}
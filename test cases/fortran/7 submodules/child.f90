@@ -0,0 +1,6 @@
+submodule (points:points_a) points_b
+contains
+  module procedure point_dist
+    distance = sqrt(square(a%x - b%x) + square(a%y - b%y))
+  end procedure point_dist
+end submodule points_b
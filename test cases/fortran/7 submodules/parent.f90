@@ -0,0 +1,7 @@
+submodule (points) points_a
+contains
+  real function square(v)
+    real, intent(in) :: v
+    square = v * v
+  end function square
+end submodule points_a
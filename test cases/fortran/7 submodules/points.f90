@@ -0,0 +1,13 @@
+module points
+  implicit none
+  type :: point
+    real :: x, y
+  end type point
+
+  interface
+    module function point_dist(a, b) result(distance)
+      type(point), intent(in) :: a, b
+      real :: distance
+    end function point_dist
+  end interface
+end module points
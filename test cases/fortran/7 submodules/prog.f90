@@ -0,0 +1,8 @@
+program subprog
+  use points
+  implicit none
+  type(point) :: a, b
+  a = point(0.0, 0.0)
+  b = point(3.0, 4.0)
+  if (abs(point_dist(a, b) - 5.0) > 1e-6) stop 1
+end program subprog
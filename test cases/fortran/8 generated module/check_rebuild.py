@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# Touches the generated source and checks that Ninja wants to compile
+# the source that uses its module again.
+
+import os, sys, shutil, subprocess, time
+
+(builddir, generated) = sys.argv[1:3]
+ninja = shutil.which('ninja') or shutil.which('ninja-build')
+if ninja is None:
+    print('Ninja not found.')
+    sys.exit(1)
+
+now = time.time() + 2
+os.utime(generated, (now, now))
+commands = subprocess.check_output([ninja, '-C', builddir, '-n', '-v'], universal_newlines=True)
+if not any('prog.f90' in l and '-c' in l.split() for l in commands.split('\n')):
+    print('prog.f90 is not compiled again after the module changed.')
+    print(commands)
+    sys.exit(1)
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+
+import sys
+
+with open(sys.argv[1]) as f:
+    answer = f.read().strip()
+
+with open(sys.argv[2], 'w') as f:
+    f.write('''module generated
+  implicit none
+  integer, parameter :: answer = %s
+end module generated
+''' % answer)
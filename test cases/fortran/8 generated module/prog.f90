@@ -0,0 +1,5 @@
+program prog
+  use generated
+  implicit none
+  if (answer /= 42) stop 1
+end program prog
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# The GTest sources are compiled once, with the flags of the dependency
+# only and not with the cpp_args of the executables using it.
+
+import os, sys, json
+
+with open(os.path.join(sys.argv[1], 'compile_commands.json')) as f:
+    commands = json.load(f)
+
+found = False
+for c in commands:
+    if os.path.basename(c['file']) in ('gtest-all.cc', 'gtest_main.cc'):
+        found = True
+        if 'EXPECTED' in c['command']:
+            print('GTest source compiled with target arguments: %s' % c['command'])
+            sys.exit(1)
+if not found:
+    print('GTest sources were not built.')
+    sys.exit(1)
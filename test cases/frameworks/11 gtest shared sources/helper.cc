@@ -0,0 +1,3 @@
+int helper_value() {
+    return 42;
+}
@@ -0,0 +1,15 @@
+#include<gtest/gtest.h>
+
+#ifndef EXPECTED
+#error "Target compiler arguments were not used."
+#endif
+
+int helper_value();
+
+TEST(shared_sources, helper) {
+    ASSERT_EQ(42, helper_value());
+}
+
+TEST(shared_sources, args) {
+    ASSERT_GT(EXPECTED, 0);
+}
@@ -0,0 +1,22 @@
+package com.mesonbuild;
+
+class Simple {
+    class Inner {
+        public String getText() {
+            return "Inner class is working.\n";
+        }
+    }
+
+    public static void main(String [] args) {
+        Simple s = new Simple();
+        Simple.Inner i = s.new Inner();
+        System.out.println(i.getText());
+
+        Runnable r = new Runnable() {
+            public void run() {
+                System.out.println("Anonymous class is working.\n");
+            }
+        };
+        r.run();
+    }
+}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import os, sys, shutil, subprocess, tarfile, tempfile
+
+builddir = sys.argv[1]
+archive = os.path.join(builddir, 'install-archive-test.tar.gz')
+ninja = shutil.which('ninja') or shutil.which('ninja-build')
+if ninja is None:
+    print('Ninja not found.')
+    sys.exit(1)
+
+env = os.environ.copy()
+env['MESON_INSTALL_ARCHIVE'] = archive
+env.pop('DESTDIR', None)
+subprocess.check_call([ninja, '-C', builddir, 'install'], env=env,
+                      stdout=subprocess.DEVNULL)
+
+def has_symtab(fname):
+    out = subprocess.check_output(['readelf', '-S', fname], universal_newlines=True)
+    return '.symtab' in out
+
+realname = 'libarchived.so.1.2.3'
+tmpdir = tempfile.mkdtemp()
+try:
+    with tarfile.open(archive) as tf:
+        members = [m for m in tf.getmembers() if os.path.basename(m.name).startswith('libarchived.so')]
+        binaries = [m for m in tf.getmembers() if m.isfile() and os.path.basename(m.name) in ('prog', realname)]
+        tf.extractall(tmpdir, members=binaries)
+    if len(binaries) != 2:
+        print('Unexpected binaries in the archive:', [m.name for m in binaries])
+        sys.exit(1)
+    # Stripping happens on the copies in the archive only.
+    if shutil.which('readelf') is not None:
+        for m in binaries:
+            if has_symtab(os.path.join(tmpdir, m.name)):
+                print('Archived file %s was not stripped.' % m.name)
+                sys.exit(1)
+        for name in ('prog', realname):
+            if not has_symtab(os.path.join(builddir, name)):
+                print('File %s in the build directory was stripped.' % name)
+                sys.exit(1)
+finally:
+    shutil.rmtree(tmpdir)
+names = [os.path.basename(m.name) for m in members]
+if sorted(names) != ['libarchived.so', 'libarchived.so.1', realname]:
+    print('Unexpected archive members:', names)
+    sys.exit(1)
+if len(set(os.path.dirname(m.name) for m in members)) != 1:
+    print('Library files are in different directories.')
+    sys.exit(1)
+# The library must be in the archive before the links pointing to it.
+if not members[0].isfile() or names[0] != realname:
+    print('First member is not the library itself:', names[0])
+    sys.exit(1)
+for m in members[1:]:
+    if not m.issym() or m.linkname != realname:
+        print('Member %s is not a link to %s.' % (m.name, realname))
+        sys.exit(1)
+os.unlink(archive)
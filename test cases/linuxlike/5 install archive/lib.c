@@ -0,0 +1,3 @@
+int archived_func() {
+    return 0;
+}
@@ -0,0 +1,5 @@
+int archived_func(void);
+
+int main(int argc, char **argv) {
+    return archived_func();
+}
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import os, sys, subprocess
+
+(builddir, privdir, libname) = sys.argv[1:4]
+libfile = os.path.join(builddir, libname)
+symfile = os.path.join(builddir, privdir, libname + '.symbols')
+
+lines = open(symfile).read().split('\n')
+soname = [x[7:] for x in lines if x.startswith('SONAME ')]
+names = sorted([x.split()[0] for x in lines if x != '' and not x.startswith('SONAME ')])
+
+out = subprocess.check_output(['readelf', '-d', libfile], universal_newlines=True)
+expected_soname = [x.split('[')[1].split(']')[0] for x in out.split('\n') if '(SONAME)' in x]
+out = subprocess.check_output(['nm', '--dynamic', '--extern-only', '--defined-only',
+                               '--format=posix', libfile], universal_newlines=True)
+expected_names = sorted([x.split()[0] for x in out.split('\n') if x != ''])
+
+if soname != expected_soname:
+    print('Soname mismatch:', soname, expected_soname)
+    sys.exit(1)
+if names != expected_names:
+    print('Symbol mismatch:')
+    print(' Meson:', ' '.join(names))
+    print(' nm:   ', ' '.join(expected_names))
+    sys.exit(1)
+if 'foo@@VER_2' not in names or 'foo@VER_1' not in names:
+    print('Symbol versions are missing.')
+    sys.exit(1)
@@ -0,0 +1,16 @@
+int foo_v1(void) {
+    return 1;
+}
+
+int foo_v2(void) {
+    return 2;
+}
+
+int bar(void) {
+    return 3;
+}
+
+int versioned_data = 4;
+
+__asm__(".symver foo_v1,foo@VER_1");
+__asm__(".symver foo_v2,foo@@VER_2");
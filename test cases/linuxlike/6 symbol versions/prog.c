@@ -0,0 +1,6 @@
+int foo(void);
+int bar(void);
+
+int main(int argc, char **argv) {
+    return foo() + bar() == 5 ? 0 : 1;
+}
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import os, sys, shutil, subprocess, tarfile
+
+builddir = sys.argv[1]
+
+for fname in ('prog', 'libfastlib.so'):
+    sections = subprocess.check_output(['readelf', '-S', '-W', os.path.join(builddir, fname)],
+                                       universal_newlines=True)
+    if '.gdb_index' not in sections:
+        print('%s has no gdb index.' % fname)
+        sys.exit(1)
+
+archive = os.path.join(builddir, 'fast-link-test.tar')
+ninja = shutil.which('ninja') or shutil.which('ninja-build')
+if ninja is None:
+    print('Ninja not found.')
+    sys.exit(1)
+env = os.environ.copy()
+env['MESON_INSTALL_ARCHIVE'] = archive
+env.pop('DESTDIR', None)
+subprocess.check_call([ninja, '-C', builddir, 'install'], env=env,
+                      stdout=subprocess.DEVNULL)
+with tarfile.open(archive) as tf:
+    names = sorted(os.path.basename(m.name) for m in tf.getmembers() if m.isfile())
+os.unlink(archive)
+if names != ['libfastlib.so', 'libfastlib.so.dwp', 'prog', 'prog.dwp']:
+    print('Unexpected archive members:', names)
+    sys.exit(1)
+
+# The packages are only written to temporary files during install.
+for root, _, files in os.walk(builddir):
+    for f in files:
+        if f.endswith('.dwp'):
+            print('Split debug package %s left in the build directory.' % os.path.join(root, f))
+            sys.exit(1)
@@ -0,0 +1,3 @@
+int fastlib_func() {
+    return 0;
+}
@@ -0,0 +1,5 @@
+int fastlib_func();
+
+int main(int argc, char **argv) {
+    return fastlib_func();
+}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Checks that wrap downloads are verified while they are streamed to
+# disk, resumed with range requests and started over when resuming
+# is not possible. A local HTTP server stands in for the wrap server.
+
+import os, shutil, tempfile, hashlib, threading, unittest
+import http.server
+
+from mesonbuild.wrap import wrap
+
+payload = os.urandom(3*1024*1024 + 123)
+payload_hash = hashlib.sha256(payload).hexdigest()
+bad_payload = b'This is not the file you are looking for.\n'
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # The start offsets of the requests, None when there was no Range.
+    requests = []
+
+    def do_GET(self):
+        if self.path == '/bad.tar.gz':
+            data = bad_payload
+        else:
+            data = payload
+        start = None
+        rng = self.headers.get('Range')
+        if rng is not None and rng.startswith('bytes='):
+            start = int(rng[6:].split('-')[0])
+        Handler.requests.append(start)
+        if start is None or self.path == '/norange.tar.gz':
+            self.send_response(200)
+            start = 0
+        elif start >= len(data):
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % len(data))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        else:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+class WrapDownloadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.baseurl = 'http://127.0.0.1:%d/' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.requests = []
+        self.workdir = tempfile.mkdtemp()
+        self.resolver = wrap.Resolver(self.workdir)
+        self.resolver.show_progress = False
+        self.ofname = os.path.join(self.workdir, 'source.tar.gz')
+        self.partname = self.ofname + '.part'
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write_part(self, data):
+        with open(self.partname, 'wb') as f:
+            f.write(data)
+
+    def assertDownloaded(self):
+        with open(self.ofname, 'rb') as f:
+            self.assertEqual(f.read(), payload)
+        self.assertFalse(os.path.exists(self.partname))
+
+    def test_full(self):
+        self.resolver.download_file(self.baseurl + 'source.tar.gz', self.ofname, payload_hash)
+        self.assertDownloaded()
+        self.assertEqual(Handler.requests, [None])
+
+    def test_resume(self):
+        self.write_part(payload[:1000000])
+        self.resolver.download_file(self.baseurl + 'source.tar.gz', self.ofname, payload_hash)
+        self.assertDownloaded()
+        self.assertEqual(Handler.requests, [1000000])
+
+    def test_restart_after_416(self):
+        # A complete download that was never renamed into place.
+        self.write_part(payload)
+        self.resolver.download_file(self.baseurl + 'source.tar.gz', self.ofname, payload_hash)
+        self.assertDownloaded()
+        self.assertEqual(Handler.requests, [len(payload), None])
+
+    def test_restart_without_range_support(self):
+        self.write_part(payload[:1000])
+        self.resolver.download_file(self.baseurl + 'norange.tar.gz', self.ofname, payload_hash)
+        self.assertDownloaded()
+        self.assertEqual(Handler.requests, [1000, None])
+
+    def test_restart_after_corrupt_resume(self):
+        self.write_part(b'\0' * 1000)
+        self.resolver.download_file(self.baseurl + 'source.tar.gz', self.ofname, payload_hash)
+        self.assertDownloaded()
+        self.assertEqual(Handler.requests, [1000, None])
+
+    def test_bad_hash(self):
+        with self.assertRaises(RuntimeError):
+            self.resolver.download_file(self.baseurl + 'bad.tar.gz', self.ofname, payload_hash)
+        self.assertFalse(os.path.exists(self.ofname))
+        self.assertFalse(os.path.exists(self.partname))
+        self.assertEqual(Handler.requests, [None])
+
+if __name__ == '__main__':
+    unittest.main()
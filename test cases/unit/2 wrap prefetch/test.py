@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Checks that wraps are prefetched in parallel and that a failing
+# package is reported without stopping the others. A local HTTP
+# server stands in for the wrap server.
+
+import os, io, shutil, tempfile, hashlib, threading, tarfile, unittest
+import http.server, socketserver
+
+from mesonbuild.wrap import wrap
+
+def make_package(name):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as tf:
+        content = ('project(\'%s\', \'c\')\n' % name).encode()
+        info = tarfile.TarInfo('%s-1.0/meson.build' % name)
+        info.size = len(content)
+        tf.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+packages = dict((name, make_package(name)) for name in ('alpha', 'beta'))
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Both packages are only sent once both have been requested, which
+    # only happens when they are downloaded at the same time.
+    barrier = None
+
+    def do_GET(self):
+        name = self.path.strip('/').split('.')[0]
+        if name not in packages:
+            self.send_error(404)
+            return
+        try:
+            Handler.barrier.wait()
+        except threading.BrokenBarrierError:
+            self.send_error(503, 'Downloads were not done in parallel')
+            return
+        data = packages[name]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class WrapPrefetchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.baseurl = 'http://127.0.0.1:%d/' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.barrier = threading.Barrier(2, timeout=20)
+        self.workdir = tempfile.mkdtemp()
+        self.subdir = os.path.join(self.workdir, 'subprojects')
+        os.mkdir(self.subdir)
+        for name in packages:
+            self.write_wrap(name, name + '.tar.gz', hashlib.sha256(packages[name]).hexdigest())
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write_wrap(self, name, fname, hexhash):
+        with open(os.path.join(self.subdir, name + '.wrap'), 'w') as f:
+            f.write('''[wrap-file]
+directory = %s-1.0
+source_url = %s%s
+source_filename = %s
+source_hash = %s
+''' % (name, self.baseurl, fname, fname, hexhash))
+
+    def prefetch(self, max_workers):
+        # A worker that never finishes would hang the test, so give up
+        # waiting after a while.
+        result = []
+        t = threading.Thread(target=lambda: result.append(wrap.Resolver(self.subdir).prefetch(max_workers)))
+        t.daemon = True
+        t.start()
+        t.join(60)
+        self.assertFalse(t.is_alive(), 'Prefetching did not finish.')
+        return result[0]
+
+    def test_parallel(self):
+        self.assertEqual(self.prefetch(2), [])
+        for name in packages:
+            self.assertTrue(os.path.isfile(os.path.join(self.subdir, name + '-1.0', 'meson.build')))
+
+    def test_failure_is_reported(self):
+        self.write_wrap('missing', 'missing.tar.gz', '0' * 64)
+        failures = self.prefetch(3)
+        self.assertEqual([name for (name, _) in failures], ['missing'])
+        self.assertIn('404', failures[0][1])
+        # The other packages are still fetched.
+        for name in packages:
+            self.assertTrue(os.path.isfile(os.path.join(self.subdir, name + '-1.0', 'meson.build')))
+        self.assertFalse(os.path.exists(os.path.join(self.subdir, 'missing-1.0')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Checks that git wraps are cloned shallowly, that pinned checkouts are
+# not fetched again and that the mirror in MESON_WRAP_CACHE is reused.
+# Local file:// repositories stand in for the servers.
+
+import os, shutil, tempfile, subprocess, unittest
+
+from mesonbuild.wrap import wrap
+
+def git(repodir, *args):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                                   cwd=repodir, stderr=subprocess.DEVNULL).decode().strip()
+
+class GitWrapTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.upstream = os.path.join(self.workdir, 'upstream')
+        os.mkdir(self.upstream)
+        git(self.upstream, 'init', '-q')
+        self.commits = []
+        for i in range(3):
+            with open(os.path.join(self.upstream, 'meson.build'), 'w') as f:
+                f.write("project('sub%d', 'c')\n" % i)
+            git(self.upstream, 'add', 'meson.build')
+            git(self.upstream, 'commit', '-q', '-m', 'Commit %d' % i)
+            self.commits.append(git(self.upstream, 'rev-parse', 'HEAD'))
+        git(self.upstream, 'tag', 'v1', self.commits[1])
+        # Fetching single commits by id needs this on the server side.
+        git(self.upstream, 'config', 'uploadpack.allowAnySHA1InWant', 'true')
+        self.url = 'file://' + self.upstream
+        self.old_store = os.environ.pop('MESON_WRAP_CACHE', None)
+
+    def tearDown(self):
+        os.environ.pop('MESON_WRAP_CACHE', None)
+        if self.old_store is not None:
+            os.environ['MESON_WRAP_CACHE'] = self.old_store
+        shutil.rmtree(self.workdir)
+
+    def make_subprojdir(self, name):
+        subprojdir = os.path.join(self.workdir, name)
+        os.mkdir(subprojdir)
+        return subprojdir
+
+    def write_wrap(self, subprojdir, name, revision):
+        with open(os.path.join(subprojdir, name + '.wrap'), 'w') as f:
+            f.write('[wrap-git]\ndirectory=%s\nurl=%s\nrevision=%s\n' % (name, self.url, revision))
+
+    def head_of(self, checkout):
+        return git(checkout, 'rev-parse', 'HEAD')
+
+    def test_shallow_and_pinned(self):
+        subprojdir = self.make_subprojdir('subprojects')
+        self.write_wrap(subprojdir, 'pinned', self.commits[0])
+        self.write_wrap(subprojdir, 'tagged', 'v1')
+        self.write_wrap(subprojdir, 'tip', 'head')
+        r = wrap.Resolver(subprojdir)
+        for name in ('pinned', 'tagged', 'tip'):
+            r.resolve(name)
+            self.assertTrue(os.path.exists(os.path.join(subprojdir, name, '.git', 'shallow')), name)
+        self.assertEqual(self.head_of(os.path.join(subprojdir, 'pinned')), self.commits[0])
+        self.assertEqual(self.head_of(os.path.join(subprojdir, 'tagged')), self.commits[1])
+        self.assertEqual(self.head_of(os.path.join(subprojdir, 'tip')), self.commits[2])
+
+        # Pinned checkouts resolve without contacting the server.
+        os.rename(self.upstream, self.upstream + '.away')
+        r.resolve('pinned')
+        r.resolve('tagged')
+        os.rename(self.upstream + '.away', self.upstream)
+
+        # Moving a pin fetches the new revision.
+        self.write_wrap(subprojdir, 'pinned', self.commits[2])
+        r.resolve('pinned')
+        self.assertEqual(self.head_of(os.path.join(subprojdir, 'pinned')), self.commits[2])
+
+    def test_mirror(self):
+        store = os.path.join(self.workdir, 'store')
+        os.environ['MESON_WRAP_CACHE'] = store
+        first = self.make_subprojdir('first')
+        self.write_wrap(first, 'pinned', self.commits[1])
+        wrap.Resolver(first).resolve('pinned')
+        mirrors = os.listdir(os.path.join(store, 'git'))
+        self.assertEqual(len(mirrors), 1)
+        marker = os.path.join(store, 'git', mirrors[0], 'marker')
+        open(marker, 'w').close()
+
+        second = self.make_subprojdir('second')
+        self.write_wrap(second, 'pinned', self.commits[0])
+        wrap.Resolver(second).resolve('pinned')
+        # The mirror already had the revision, so it was used as it was.
+        self.assertEqual(os.listdir(os.path.join(store, 'git')), mirrors)
+        self.assertTrue(os.path.exists(marker))
+        for (subprojdir, commit) in ((first, self.commits[1]), (second, self.commits[0])):
+            checkout = os.path.join(subprojdir, 'pinned')
+            self.assertEqual(self.head_of(checkout), commit)
+            # Checkouts must not depend on the objects of the mirror,
+            # which updating it may prune.
+            self.assertFalse(os.path.exists(os.path.join(checkout, '.git', 'objects', 'info', 'alternates')))
+        shutil.rmtree(store)
+        self.assertEqual(git(os.path.join(second, 'pinned'), 'fsck', '--no-progress'), '')
+
+if __name__ == '__main__':
+    unittest.main()
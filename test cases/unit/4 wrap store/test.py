@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Checks that a package in the MESON_WRAP_CACHE store is downloaded and
+# extracted once, and that editing a subproject does not change the
+# store. A local HTTP server stands in for the wrap server.
+
+import os, io, shutil, tempfile, hashlib, threading, tarfile, unittest
+import http.server
+
+from mesonbuild.wrap import wrap
+
+def make_package():
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as tf:
+        content = b"project('stored', 'c')\n"
+        info = tarfile.TarInfo('stored-1.0/meson.build')
+        info.size = len(content)
+        tf.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+package = make_package()
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        Handler.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(package)))
+        self.end_headers()
+        self.wfile.write(package)
+
+    def log_message(self, *args):
+        pass
+
+class WrapStoreTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:%d/stored-1.0.tar.gz' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.requests = 0
+        self.workdir = tempfile.mkdtemp()
+        self.store = os.path.join(self.workdir, 'store')
+        self.old_store = os.environ.get('MESON_WRAP_CACHE', None)
+        os.environ['MESON_WRAP_CACHE'] = self.store
+        self.old_reflink = wrap.cp_reflink_supported
+
+    def tearDown(self):
+        wrap.cp_reflink_supported = self.old_reflink
+        if self.old_store is None:
+            del os.environ['MESON_WRAP_CACHE']
+        else:
+            os.environ['MESON_WRAP_CACHE'] = self.old_store
+        wrap.make_writable(self.workdir)
+        shutil.rmtree(self.workdir)
+
+    def resolve(self, name):
+        subprojdir = os.path.join(self.workdir, name)
+        os.mkdir(subprojdir)
+        with open(os.path.join(subprojdir, 'stored.wrap'), 'w') as f:
+            f.write('''[wrap-file]
+directory = stored-1.0
+source_url = %s
+source_filename = stored-1.0.tar.gz
+source_hash = %s
+''' % (self.url, hashlib.sha256(package).hexdigest()))
+        self.assertEqual(wrap.Resolver(subprojdir).resolve('stored'), 'stored-1.0')
+        return os.path.join(subprojdir, 'stored-1.0', 'meson.build')
+
+    def check_store(self):
+        first = self.resolve('first')
+        self.assertEqual(Handler.requests, 1)
+        second = self.resolve('second')
+        # The second project gets the package from the store.
+        self.assertEqual(Handler.requests, 1)
+        self.assertEqual(os.listdir(os.path.join(self.store, 'files')),
+                         [hashlib.sha256(package).hexdigest()])
+        self.assertEqual(len(os.listdir(os.path.join(self.store, 'trees'))), 1)
+        for fname in (first, second):
+            with open(fname) as f:
+                self.assertEqual(f.read(), "project('stored', 'c')\n")
+        return second
+
+    def check_edit(self, fname):
+        try:
+            with open(fname, 'a') as f:
+                f.write('# edited\n')
+        except PermissionError:
+            return False
+        third = self.resolve('third')
+        with open(third) as f:
+            self.assertEqual(f.read(), "project('stored', 'c')\n")
+        return True
+
+    def test_store_with_reflink(self):
+        if not wrap.has_cp_reflink():
+            self.skipTest('cp does not support reflinks.')
+        fname = self.check_store()
+        # Copies are writable and independent of the store.
+        self.assertTrue(self.check_edit(fname))
+
+    def test_store_with_hardlinks(self):
+        wrap.cp_reflink_supported = False
+        fname = self.check_store()
+        # Files shared with the store are read-only so that they are
+        # not edited in place. Without hardlinks they are plain copies.
+        if os.stat(fname).st_nlink > 1:
+            self.assertEqual(os.stat(fname).st_mode & 0o222, 0)
+
+if __name__ == '__main__':
+    unittest.main()
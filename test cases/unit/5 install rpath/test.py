@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Checks that the installer fixes the rpaths of all installed files in
+# one go, and that files it can not fix are reported by name.
+
+import os, io, shutil, tempfile, subprocess, unittest
+from contextlib import redirect_stdout
+
+from mesonbuild.scripts import meson_install
+
+build_rpath = '/build/rpath'
+
+class InstallRpathTests(unittest.TestCase):
+    def setUp(self):
+        if not meson_install.is_elf_platform():
+            self.skipTest('Rpaths are only fixed on ELF platforms.')
+        cc = os.environ.get('CC', 'cc').split()
+        if shutil.which(cc[0]) is None:
+            self.skipTest('No C compiler found.')
+        self.workdir = tempfile.mkdtemp()
+        src = os.path.join(self.workdir, 'lib.c')
+        with open(src, 'w') as f:
+            f.write('int func(void) { return 0; }\n')
+        self.libs = []
+        for name in ('liba.so', 'libb.so'):
+            lib = os.path.join(self.workdir, name)
+            subprocess.check_call(cc + ['-fPIC', '-shared', src, '-o', lib,
+                                        '-Wl,--disable-new-dtags', '-Wl,-rpath,' + build_rpath])
+            self.libs.append(lib)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def get_rpath(self, lib):
+        out = subprocess.check_output(['readelf', '-d', lib], universal_newlines=True)
+        for line in out.split('\n'):
+            if '(RPATH)' in line:
+                return line.split('[', 1)[1].rsplit(']', 1)[0]
+        return None
+
+    def test_fix(self):
+        meson_install.fix_rpaths([(lib, '/usr') for lib in self.libs])
+        for lib in self.libs:
+            self.assertEqual(self.get_rpath(lib), '/usr')
+
+    def test_failure_is_reported(self):
+        out = io.StringIO()
+        fixes = [(self.libs[0], '/a/much/longer/install/rpath'), (self.libs[1], '')]
+        with redirect_stdout(out):
+            with self.assertRaises(SystemExit) as cm:
+                meson_install.fix_rpaths(fixes)
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn('Could not fix dependency info of %s:' % self.libs[0], out.getvalue())
+        # The failure does not stop the other files from being fixed.
+        self.assertIsNone(self.get_rpath(self.libs[1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Checks that cost based unity grouping keeps its previous assignments
+# when the measured costs only change a little, and moves files when
+# their cost class or editing state changes.
+
+import unittest
+
+from mesonbuild.backend import backends
+
+build_dir = '/build'
+
+class FakeEnvironment():
+    def get_build_dir(self):
+        return build_dir
+
+class FakeBackend(backends.Backend):
+    def __init__(self):
+        self.environment = FakeEnvironment()
+        self.costs = {}
+        self.hot = set()
+
+    def estimate_unity_costs(self, target, sources, previous_blocks, suffix):
+        return (dict(self.costs), set(self.hot))
+
+class UnityGroupingTests(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.sources = ['/src/file%d.c' % i for i in range(8)]
+        self.backend.costs = dict([(s, 1.0) for s in self.sources])
+
+    def group(self, previous):
+        (blocks, single) = self.backend.group_unity_sources_by_cost(None, self.sources, 2, previous, '.c')
+        return {'blocks': [b for (_, b) in blocks], 'single': single}
+
+    def test_deterministic(self):
+        self.assertEqual(self.group({}), self.group({}))
+
+    def test_noise_keeps_grouping(self):
+        first = self.group({})
+        self.assertEqual(first['single'], {})
+        for (i, s) in enumerate(self.sources):
+            self.backend.costs[s] = 1.0 + (0.3 if i % 2 else -0.3)
+        self.assertEqual(self.group(first), first)
+
+    def test_large_file(self):
+        big = self.sources[0]
+        self.backend.costs[big] = 10.0
+        first = self.group({})
+        self.assertEqual(first['single'], {big: 'large'})
+        # Budget is now 8.9 / 4. Slightly below the budget is still large.
+        self.backend.costs[big] = 1.9
+        second = self.group(first)
+        self.assertEqual(second['single'], {big: 'large'})
+        self.backend.costs[big] = 1.0
+        third = self.group(second)
+        self.assertEqual(third['single'], {})
+        self.assertIn(big, sum(third['blocks'], []))
+        # Once in a block, it takes more than twice the budget to leave.
+        self.backend.costs[big] = 3.0
+        self.assertEqual(self.group(third)['single'], {})
+
+    def test_edited_file_stays_out(self):
+        edited = self.sources[3]
+        first = self.group({})
+        self.backend.hot = set([edited])
+        second = self.group(first)
+        self.assertEqual(second['single'], {edited: 'edited'})
+        self.backend.hot = set()
+        third = self.group(second)
+        self.assertEqual(third, second)
+
+    def test_mass_change_regroups(self):
+        edited = self.sources[3]
+        self.backend.hot = set([edited])
+        first = self.group({})
+        self.assertEqual(first['single'], {edited: 'edited'})
+        self.backend.hot = set(self.sources[:6])
+        second = self.group(first)
+        self.assertEqual(second['single'], {})
+        self.assertIn(edited, sum(second['blocks'], []))
+
+if __name__ == '__main__':
+    unittest.main()
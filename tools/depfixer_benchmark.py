@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright 2016 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the time it takes to fix the rpaths of a large number of
+# shared libraries with one depfixer process per file, the way the
+# installer used to do it, and with a single depfixer --batch process.
+#
+# Usage: depfixer_benchmark.py [number of libraries]
+#
+# The C compiler is taken from the CC environment variable.
+
+import sys, os, shutil, subprocess, tempfile, time
+
+meson_command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'meson')]
+depfixer_command = meson_command + ['--internal', 'depfixer']
+build_rpath = '/a/fairly/long/build/directory/rpath/that/will/be/removed'
+
+def build_libs(workdir, count):
+    cc = os.environ.get('CC', 'cc').split()
+    src = os.path.join(workdir, 'lib.c')
+    with open(src, 'w') as f:
+        f.write('int func(void) { return 0; }\n')
+    proto = os.path.join(workdir, 'libproto.so')
+    subprocess.check_call(cc + ['-fPIC', '-shared', src, '-o', proto,
+                                '-Wl,--disable-new-dtags', '-Wl,-rpath,' + build_rpath])
+    return (proto, [os.path.join(workdir, 'lib%d.so' % i) for i in range(count)])
+
+def reset(proto, libs):
+    for l in libs:
+        shutil.copyfile(proto, l)
+
+def per_process(libs):
+    for l in libs:
+        subprocess.check_call(depfixer_command + [l, ''], stdout=subprocess.DEVNULL)
+
+def batch(libs):
+    args = []
+    for l in libs:
+        args += [l, '']
+    subprocess.check_call(depfixer_command + ['--batch'] + args)
+
+def check(libs):
+    for l in libs:
+        with open(l, 'rb') as f:
+            if build_rpath.encode() in f.read():
+                print('The rpath of %s was not removed.' % l)
+                sys.exit(1)
+
+def run(args):
+    count = 300
+    if len(args) > 0:
+        count = int(args[0])
+    workdir = tempfile.mkdtemp()
+    try:
+        (proto, libs) = build_libs(workdir, count)
+        for (name, func) in [('one process per file', per_process), ('batch', batch)]:
+            reset(proto, libs)
+            start = time.time()
+            func(libs)
+            duration = time.time() - start
+            check(libs)
+            print('%-22s %d libraries: %.3fs' % (name + ':', count, duration))
+    finally:
+        shutil.rmtree(workdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
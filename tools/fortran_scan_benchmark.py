@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright 2016 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generates a Fortran project with a large number of modules and
+measures how long it takes to configure it from scratch and how long
+a reconfigure takes once the module scan cache has been populated.
+
+Usage:
+
+    python3 tools/fortran_scan_benchmark.py [num_files]
+"""
+
+import sys, os, shutil, subprocess, tempfile, time
+
+meson_command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'meson')]
+
+def generate_project(srcdir, count):
+    names = []
+    for i in range(count):
+        name = 'mod%d.f90' % i
+        with open(os.path.join(srcdir, name), 'w') as f:
+            f.write('module mod%d\n' % i)
+            if i > 0:
+                f.write('  use mod%d\n' % (i - 1))
+            f.write('  implicit none\n')
+            f.write('contains\n')
+            f.write('  integer function func%d()\n' % i)
+            if i > 0:
+                f.write('    func%d = func%d() + 1\n' % (i, i - 1))
+            else:
+                f.write('    func%d = 0\n' % i)
+            f.write('  end function func%d\n' % i)
+            f.write('end module mod%d\n' % i)
+        names.append(name)
+    with open(os.path.join(srcdir, 'prog.f90'), 'w') as f:
+        f.write('program prog\n  use mod%d\n  print *, func%d()\nend program prog\n' % (count - 1, count - 1))
+    with open(os.path.join(srcdir, 'meson.build'), 'w') as f:
+        f.write("project('fortran scan benchmark', 'fortran')\n\n")
+        f.write("executable('prog', 'prog.f90',\n")
+        for n in names:
+            f.write("  '%s',\n" % n)
+        f.write(")\n")
+
+def timed(cmd):
+    start = time.time()
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+    return time.time() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(workdir, 'src')
+        builddir = os.path.join(workdir, 'build')
+        os.mkdir(srcdir)
+        os.mkdir(builddir)
+        generate_project(srcdir, count)
+        cold = timed(meson_command + [srcdir, builddir])
+        os.utime(os.path.join(srcdir, 'meson.build'))
+        warm = timed(['ninja', '-C', builddir, 'build.ninja'])
+        print('Files:        %d' % count)
+        print('Configure:    %.2f s' % cold)
+        print('Reconfigure:  %.2f s' % warm)
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()